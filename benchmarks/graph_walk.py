@@ -0,0 +1,75 @@
+"""
+Build the dependency graph for a synthetic chain of libraries where
+every library depends on the next one.
+
+Usage: python benchmarks/graph_walk.py [count]
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+from macholib import mach_o
+from macholib.MachOGraph import MachOGraph
+
+
+def lc_load_dylib(name):
+    name = name.encode("utf-8") + b"\x00"
+    name += b"\x00" * (-len(name) % 8)
+    return (
+        struct.pack(
+            "<IIIIII", mach_o.LC_LOAD_DYLIB, 24 + len(name), 24, 2, 0x10000, 0x10000
+        )
+        + name
+    )
+
+
+def write_library(path, dependencies):
+    commands = b"".join(lc_load_dylib(name) for name in dependencies)
+    with open(path, "wb") as fp:
+        fp.write(
+            struct.pack(
+                "<IIIIIIII",
+                mach_o.MH_MAGIC_64,
+                0x100000C,
+                0,
+                mach_o.MH_DYLIB,
+                len(dependencies),
+                len(commands),
+                0,
+                0,
+            )
+        )
+        fp.write(commands)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    directory = tempfile.mkdtemp()
+    try:
+        paths = [os.path.join(directory, "lib%d.dylib" % (i,)) for i in range(count)]
+        for i, path in enumerate(paths):
+            write_library(path, paths[i + 1 : i + 2])  # noqa: E203
+
+        graph = MachOGraph()
+        start = time.time()
+        graph.run_file(paths[0])
+        elapsed = time.time() - start
+
+        nodes = sum(1 for _ in graph.flatten())
+        print(
+            "%d nodes in %.2f s (%.1f us/node)"
+            % (nodes, elapsed, elapsed * 1e6 / nodes)
+        )
+
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Rewrite the load commands of a number of synthetic libraries, using
+the loop MachOStandalone used before (MachO.write once per header)
+and MachO.write.
+
+The libraries are fat files with *archs* slices, the difference
+between the methods grows with the number of headers in a file.
+
+Usage: python benchmarks/rewrite.py [count [archs]]
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+from macholib import mach_o
+from macholib.MachO import MachO
+
+# Offset of the first section, the space before it is available for
+# load commands.
+TEXT_OFFSET = 16384
+SLICE_ALIGN = 15
+
+
+def lc_segment_64():
+    segment = struct.pack(
+        "<II16sQQQQiiII",
+        mach_o.LC_SEGMENT_64,
+        72 + 80,
+        b"__TEXT",
+        0,
+        0,
+        0,
+        0,
+        7,
+        5,
+        1,
+        0,
+    )
+    section = struct.pack(
+        "<16s16sQQIIIIIIII",
+        b"__text",
+        b"__TEXT",
+        0,
+        8,
+        TEXT_OFFSET,
+        0,
+        0,
+        0,
+        0,
+        0,
+        0,
+        0,
+    )
+    return segment + section
+
+
+def lc_load_dylib(name):
+    name = name.encode("utf-8") + b"\x00"
+    name += b"\x00" * (-len(name) % 8)
+    return (
+        struct.pack(
+            "<IIIIII", mach_o.LC_LOAD_DYLIB, 24 + len(name), 24, 2, 0x10000, 0x10000
+        )
+        + name
+    )
+
+
+def library_slice(dependencies):
+    commands = [lc_segment_64()] + [lc_load_dylib(name) for name in dependencies]
+    commands = b"".join(commands)
+    header = struct.pack(
+        "<IIIIIIII",
+        mach_o.MH_MAGIC_64,
+        0x100000C,
+        0,
+        mach_o.MH_DYLIB,
+        len(dependencies) + 1,
+        len(commands),
+        0,
+        0,
+    )
+    data = header + commands
+    return data + b"\x00" * (TEXT_OFFSET - len(data)) + b"\x00" * 8
+
+
+def write_library(path, dependencies, archs):
+    data = library_slice(dependencies)
+    if archs == 1:
+        with open(path, "wb") as fp:
+            fp.write(data)
+        return
+
+    # Slices are aligned to 2**SLICE_ALIGN bytes
+    step = 1 << SLICE_ALIGN
+    header = struct.pack(">II", mach_o.FAT_MAGIC, archs)
+    for i in range(archs):
+        header += struct.pack(
+            ">IIIII", 0x100000C, i, step * (i + 1), len(data), SLICE_ALIGN
+        )
+    with open(path, "wb") as fp:
+        fp.write(header + b"\x00" * (step - len(header)))
+        for _ in range(archs):
+            fp.write(data + b"\x00" * (step - len(data)))
+
+
+def write_per_header(m, fp):
+    # What MachOStandalone did before, every header is written once
+    # for every header in the file.
+    for _header in m.headers:
+        fp.seek(0)
+        m.write(fp)
+
+
+def changefunc(path):
+    if path.startswith("/opt/"):
+        return "@executable_path/../Frameworks/" + os.path.basename(path)
+    return None
+
+
+def rewrite(paths, method):
+    # Returns the time used for writing, parsing the files and
+    # rewriting the load commands in memory is not included.
+    nodes = []
+    for path in paths:
+        m = MachO(path)
+        if m.rewriteLoadCommands(changefunc):
+            nodes.append((path, m))
+
+    start = time.time()
+    for path, m in nodes:
+        with open(path, "rb+") as fp:
+            method(m, fp)
+    return time.time() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    archs = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    directory = tempfile.mkdtemp()
+    try:
+        paths = [os.path.join(directory, "lib%d.dylib" % (i,)) for i in range(count)]
+        dependencies = ["/usr/lib/libSystem.B.dylib"] + [
+            "/opt/lib/lib%d.dylib" % (i,) for i in range(10)
+        ]
+        for label, method in (
+            ("write per header", write_per_header),
+            ("write", MachO.write),
+        ):
+            for path in paths:
+                write_library(path, dependencies, archs)
+            elapsed = rewrite(paths, method)
+            print(
+                "%s: wrote %d files with %d archs in %.2f s (%.1f us/file)"
+                % (label, count, archs, elapsed, elapsed * 1e6 / count)
+            )
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Compare the memory use of regular and compact Structure instances
+by decoding a large synthetic symbol table.
+
+Usage: python benchmarks/structure_memory.py [count]
+"""
+
+from __future__ import print_function
+
+import struct
+import sys
+import time
+import tracemalloc
+
+from macholib.mach_o import nlist_64
+from macholib.ptypes import Structure
+
+
+class regular_nlist_64(Structure):
+    _fields_ = nlist_64._fields_
+
+
+def measure(cls, data, count):
+    size = cls._size_
+    tracemalloc.start()
+    start = time.time()
+    values = [
+        cls.from_str(data[i * size : (i + 1) * size], _endian_="<")  # noqa: E203
+        for i in range(count)
+    ]
+    elapsed = time.time() - start
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del values
+    return used, elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    data = b"".join(
+        struct.pack("<iBBhq", i, 0x0F, 1, 0, 0x100000000 + i * 16) for i in range(count)
+    )
+    results = {}
+    for label, cls in (("regular", regular_nlist_64), ("compact", nlist_64)):
+        used, elapsed = measure(cls, data, count)
+        results[label] = used
+        print(
+            "%-8s %10.1f MB %8.1f bytes/entry %6.2f s"
+            % (label, used / 1e6, used / float(count), elapsed)
+        )
+    print("ratio     %10.1fx" % (results["regular"] / float(results["compact"]),))
+
+
+if __name__ == "__main__":
+    main()
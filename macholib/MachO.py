@@ -4,11 +4,13 @@ Utilities for reading and writing Mach-O headers
 
 from __future__ import print_function
 
+import functools
+import mmap
 import os
 import struct
 import sys
 
-from macholib.util import fileview
+from macholib.util import bufferview, fileview
 
 from .mach_o import (
     FAT_MAGIC,
@@ -21,9 +23,11 @@ from .mach_o import (
     LC_PREBOUND_DYLIB,
     LC_REEXPORT_DYLIB,
     LC_REGISTRY,
+    LC_RPATH,
     LC_SEGMENT,
     LC_SEGMENT_64,
     LC_SYMTAB,
+    LC_UUID,
     MH_CIGAM,
     MH_CIGAM_64,
     MH_FILETYPE_SHORTNAMES,
@@ -97,6 +101,19 @@ class MachO(object):
 
     If allow_unknown_load_commands is True, allows unknown load commands.
     Otherwise, raises ValueError if the file contains an unknown load command.
+
+    If lazy_section_data is True (the default), the contents of sections
+    are only read from the file when the section_data attribute of a
+    section is first accessed.
+
+    If use_mmap is True the file is memory mapped and parsed from the
+    mapping instead of using regular file reads, section data is then
+    a memoryview of the mapping. The mapping is released by close().
+
+    If cache is not None it is a macholib.cache.ParseCache that is used
+    to avoid parsing files that were parsed before. Only the headers and
+    load commands are cached, section contents are always read from the
+    file.
     """
 
     #   filename   - the original filename of this mach-o
@@ -108,7 +125,14 @@ class MachO(object):
     #   low_offset - essentially, the maximum mach-o header size
     #   id_cmd     - the index of my id command, or None
 
-    def __init__(self, filename, allow_unknown_load_commands=False):
+    def __init__(
+        self,
+        filename,
+        allow_unknown_load_commands=False,
+        lazy_section_data=True,
+        use_mmap=False,
+        cache=None,
+    ):
         # supports the ObjectGraph protocol
         self.graphident = filename
         self.filename = filename
@@ -118,12 +142,113 @@ class MachO(object):
         self.fat = None
         self.headers = []
         self.allow_unknown_load_commands = allow_unknown_load_commands
-        with open(filename, "rb") as fp:
-            self.load(fp)
+        self.lazy_section_data = lazy_section_data
+        self._mmap = None
+        self._buffer = None
+
+        if cache is not None:
+            options = self._cache_options()
+            cached = cache.lookup(filename, options)
+            if cached is not None:
+                self.fat, self.headers = cached
+                for header in self.headers:
+                    header.parent = self
+                if use_mmap:
+                    self._map_file()
+                if not lazy_section_data:
+                    for _header, sect in self._iter_sections():
+                        loader = getattr(sect, "_section_loader", None)
+                        if loader is not None:
+                            sect.add_section_data(loader())
+                return
+            st = os.stat(filename)
+
+        if use_mmap:
+            self._map_file()
+
+        if self._buffer is not None:
+            try:
+                self.load(bufferview(self._buffer))
+            except BaseException:
+                self.close()
+                raise
+        else:
+            with open(filename, "rb") as fp:
+                self.load(fp)
+
+        if cache is not None:
+            self._store_in_cache(cache, options, st)
 
     def __repr__(self):
         return "<MachO filename=%r>" % (self.filename,)
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_mmap"] = state["_buffer"] = None
+        return state
+
+    def _cache_options(self):
+        # Parse options that affect the cached headers, section contents
+        # aren't cached and lazy_section_data and use_mmap don't matter.
+        return "allow_unknown_load_commands=%d" % (
+            bool(self.allow_unknown_load_commands),
+        )
+
+    def _map_file(self):
+        with open(self.filename, "rb") as fp:
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+
+    def _iter_sections(self):
+        # Yield (header, section) for the sections in all headers
+        for header in self.headers:
+            for lc, _cmd, data in header.commands:
+                if lc.cmd in (LC_SEGMENT, LC_SEGMENT_64):
+                    for sect in data:
+                        yield header, sect
+
+    def _store_in_cache(self, cache, options, st):
+        # Section contents that were read while parsing are replaced by
+        # loaders while the headers are stored, the contents can be large
+        # and memoryviews of a mapping cannot be pickled.
+        saved = []
+        for header, sect in self._iter_sections():
+            data = sect.__dict__.pop("_section_data", None)
+            if data is not None:
+                saved.append((sect, data))
+                sect.add_section_data_loader(
+                    functools.partial(header._read_section_data, sect.offset, sect.size)
+                )
+        try:
+            cache.store(self.filename, (self.fat, self.headers), options, st)
+        finally:
+            for sect, data in saved:
+                sect.add_section_data(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Release the memory mapping used when the file was opened
+        with use_mmap=True. Section data that has not been read yet
+        will be read from the file after this.
+        """
+        buffer, mm = self._buffer, self._mmap
+        self._buffer = self._mmap = None
+        if mm is None:
+            return
+        try:
+            buffer.release()
+            mm.close()
+        except BufferError:
+            # There are still views of the mapping (for example section
+            # data), the mapping is closed when those are gone.
+            pass
+
     def load(self, fh):
         assert fh.tell() == 0
         header = struct.unpack(">I", fh.read(4))[0]
@@ -139,15 +264,38 @@ class MachO(object):
     def load_fat(self, fh):
         self.fat = fat_header.from_fileobj(fh)
         if self.fat.magic == FAT_MAGIC:
-            archs = [fat_arch.from_fileobj(fh) for i in range(self.fat.nfat_arch)]
+            arch_cls = fat_arch
         elif self.fat.magic == FAT_MAGIC_64:
-            archs = [fat_arch64.from_fileobj(fh) for i in range(self.fat.nfat_arch)]
+            arch_cls = fat_arch64
         else:
             raise ValueError("Unknown fat header magic: %r" % (self.fat.magic))
+        nfat_arch = self.fat.nfat_arch
+        archs = arch_cls.array_from_buffer(
+            fh.read(nfat_arch * sizeof(arch_cls)), nfat_arch
+        )
 
         for arch in archs:
             self.load_header(fh, arch.offset, arch.size)
 
+    def rpaths(self):
+        """
+        Return the paths in the LC_RPATH commands of all headers,
+        without duplicates.
+        """
+        result = []
+        for header in self.headers:
+            for path in header.rpaths():
+                if path not in result:
+                    result.append(path)
+        return result
+
+    def uuids(self):
+        """
+        Return a list with the value of the LC_UUID command of every
+        header, with None for headers without such command.
+        """
+        return [header.uuid() for header in self.headers]
+
     def rewriteLoadCommands(self, *args, **kw):
         changed = False
         for header in self.headers:
@@ -170,7 +318,15 @@ class MachO(object):
         else:
             raise ValueError("Unknown Mach-O header: 0x%08x in %r" % (header, fh))
         hdr = MachOHeader(
-            self, fh, offset, size, magic, hdr, endian, self.allow_unknown_load_commands
+            self,
+            fh,
+            offset,
+            size,
+            magic,
+            hdr,
+            endian,
+            self.allow_unknown_load_commands,
+            self.lazy_section_data,
         )
         self.headers.append(hdr)
 
@@ -185,6 +341,9 @@ class MachOHeader(object):
 
     If allow_unknown_load_commands is True, allows unknown load commands.
     Otherwise, raises ValueError if the file contains an unknown load command.
+
+    If lazy_section_data is True, section contents are read on first use
+    instead of while loading the header.
     """
 
     #   filename   - the original filename of this mach-o
@@ -206,6 +365,7 @@ class MachOHeader(object):
         hdr,
         endian,
         allow_unknown_load_commands=False,
+        lazy_section_data=False,
     ):
         self.MH_MAGIC = magic
         self.mach_header = hdr
@@ -226,6 +386,7 @@ class MachOHeader(object):
         self.headers = []
 
         self.allow_unknown_load_commands = allow_unknown_load_commands
+        self.lazy_section_data = lazy_section_data
 
         self.load(fh)
 
@@ -268,7 +429,7 @@ class MachOHeader(object):
                 # No load command in the registry, so append the load command itself
                 # instead of trying to deserialize the data after the header.
                 data_size = cmd_load.cmdsize - sizeof(load_command)
-                cmd_data = fh.read(data_size)
+                cmd_data = bytes(fh.read(data_size))
                 cmd.append((cmd_load, cmd_load, cmd_data))
                 read_bytes += cmd_load.cmdsize
                 continue
@@ -312,7 +473,13 @@ class MachOHeader(object):
                         not_zerofill = (seg.flags & S_ZEROFILL) != S_ZEROFILL
                         if seg.offset > 0 and seg.size > 0 and not_zerofill:
                             low_offset = min(low_offset, seg.offset)
-                        if not_zerofill:
+                        if not_zerofill and self.lazy_section_data:
+                            seg.add_section_data_loader(
+                                functools.partial(
+                                    self._read_section_data, seg.offset, seg.size
+                                )
+                            )
+                        elif not_zerofill:
                             c = fh.tell()
                             fh.seek(seg.offset)
                             sd = fh.read(seg.size)
@@ -337,7 +504,9 @@ class MachOHeader(object):
             else:
                 # data is a raw str
                 data_size = cmd_load.cmdsize - sizeof(klass) - sizeof(load_command)
-                cmd_data = fh.read(data_size)
+                # Always a copy, load command data is small and is
+                # edited in place by the rewrite methods.
+                cmd_data = bytes(fh.read(data_size))
             cmd.append((cmd_load, cmd_cmd, cmd_data))
             read_bytes += cmd_load.cmdsize
 
@@ -350,6 +519,22 @@ class MachOHeader(object):
         self.total_size = sizeof(self.mach_header) + read_bytes
         self.low_offset = low_offset
 
+    def _read_section_data(self, offset, size):
+        """
+        Read *size* bytes at *offset* (relative to the start of this
+        header) from the file this header was loaded from.
+        """
+        buffer = getattr(self.parent, "_buffer", None)
+        if buffer is not None:
+            start = self.offset + offset
+            end = min(start + size, self.offset + self.size)
+            return buffer[start:end]
+
+        with open(self.parent.filename, "rb") as fh:
+            fh = fileview(fh, self.offset, self.size)
+            fh.seek(offset)
+            return fh.read(size)
+
     def walkRelocatables(self, shouldRelocateCommand=_shouldRelocateCommand):
         """
         for all relocatable commands
@@ -363,6 +548,33 @@ class MachOHeader(object):
                     ofs : data.find(b"\x00", ofs)  # noqa: E203
                 ].decode(sys.getfilesystemencoding())
 
+    def rpaths(self):
+        """
+        Return the paths in the LC_RPATH commands, in load command
+        order. References to @loader_path and @executable_path are
+        not expanded.
+        """
+        result = []
+        for lc, cmd, data in self.commands:
+            if lc.cmd == LC_RPATH:
+                ofs = cmd.path - sizeof(lc.__class__) - sizeof(cmd.__class__)
+                result.append(
+                    data[ofs : data.find(b"\x00", ofs)].decode(  # noqa: E203
+                        sys.getfilesystemencoding()
+                    )
+                )
+        return result
+
+    def uuid(self):
+        """
+        Return the 16 bytes of the LC_UUID command, or None when
+        there is no such command.
+        """
+        for lc, cmd, _data in self.commands:
+            if lc.cmd == LC_UUID:
+                return bytes(cmd.uuid)
+        return None
+
     def rewriteInstallNameCommand(self, loadcmd):
         """Rewrite the load command of this dylib"""
         if self.id_cmd is not None:
@@ -425,43 +637,47 @@ class MachOHeader(object):
         self.total_size = sizeof(self.mach_header) + self.header.sizeofcmds
         self.sizediff = 0
 
-    def write(self, fileobj):
-        fileobj = fileview(fileobj, self.offset, self.size)
-        fileobj.seek(0)
-
-        # serialize all the mach-o commands
+    def serialize(self):
+        """
+        Return the bytes for the mach header and load commands, including
+        the zero filled space up to the first section. When the size of
+        that space is not known the result covers the current and
+        previous load commands.
+        """
+        old_size = self.total_size
         self.synchronize_size()
+        if self.low_offset <= self.size:
+            size = self.low_offset
+        else:
+            size = max(self.total_size, old_size)
 
-        self.header.to_fileobj(fileobj)
-        for lc, cmd, data in self.commands:
-            lc.to_fileobj(fileobj)
-            cmd.to_fileobj(fileobj)
-
-            if sys.version_info[0] == 2:
-                if isinstance(data, unicode):
-                    fileobj.write(data.encode(sys.getfilesystemencoding()))
+        data = b"".join(self._iter_serialized())
+        if len(data) < size:
+            data += b"\x00" * (size - len(data))
+        return data
 
-                elif isinstance(data, (bytes, str)):
-                    fileobj.write(data)
-                else:
-                    # segments..
-                    for obj in data:
-                        obj.to_fileobj(fileobj)
+    def _iter_serialized(self):
+        # Yield the serialized header and load commands
+        yield self.header.to_str()
+        encoding = sys.getfilesystemencoding()
+        for lc, cmd, data in self.commands:
+            yield lc.to_str()
+            yield cmd.to_str()
+            if isinstance(data, unicode):
+                yield data.encode(encoding)
+            elif isinstance(data, bytes):
+                yield data
             else:
-                if isinstance(data, str):
-                    fileobj.write(data.encode(sys.getfilesystemencoding()))
-
-                elif isinstance(data, bytes):
-                    fileobj.write(data)
-
-                else:
-                    # segments..
-                    for obj in data:
-                        obj.to_fileobj(fileobj)
+                # segments..
+                for obj in data:
+                    yield obj.to_str()
 
-        # zero out the unused space, doubt this is strictly necessary
-        # and is generally probably already the case
-        fileobj.write(b"\x00" * (self.low_offset - fileobj.tell()))
+    def write(self, fileobj):
+        # The header and load commands are serialized into a single
+        # buffer, which is written with one write.
+        fileobj = fileview(fileobj, self.offset, self.size)
+        fileobj.seek(0)
+        fileobj.write(self.serialize())
 
     def getSymbolTableCommand(self):
         for lc, cmd, _data in self.commands:
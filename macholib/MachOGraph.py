@@ -2,22 +2,76 @@
 Utilities for reading and writing Mach-O headers
 """
 
+import functools
 import os
+import pickle
 import sys
 
 from altgraph.ObjectGraph import ObjectGraph
 
-from macholib.dyld import dyld_find
-from macholib.itergraphreport import itergraphreport
+from macholib.batch import _make_executor
+from macholib.compactgraph import CompactGraph, CompactNode
+from macholib.dyld import _dyld_isfile, dyld_find
+from macholib.itergraphreport import DEFAULT_EDGE_KINDS, itergraphreport, iterjsonreport
 from macholib.MachO import MachO
 
 __all__ = ["MachOGraph"]
 
+_SNAPSHOT_VERSION = 1
+
 try:
     unicode
 except NameError:
     unicode = str
 
+try:
+    from itertools import imap
+except ImportError:
+    imap = map
+
+
+def _expand_rpath(path, loader_path, executable_path):
+    for prefix, value in (
+        ("@loader_path", loader_path),
+        ("@executable_path", executable_path),
+    ):
+        if path == prefix:
+            path = value or os.curdir
+            break
+        elif path.startswith(prefix + "/"):
+            path = os.path.join(value, path[len(prefix) + 1 :])  # noqa: E203
+            break
+    return os.path.normpath(path)
+
+
+def _file_signature(path):
+    # Information used to detect that a file changed
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    mtime = getattr(st, "st_mtime_ns", None)
+    if mtime is None:
+        mtime = int(st.st_mtime * 1e9)
+    return (st.st_size, mtime, st.st_ino)
+
+
+# The ParseCache used in the worker processes of MachOGraph.run_files,
+# set by the initializer of the process pool.
+_worker_cache = None
+
+
+def _init_worker(data):
+    # The cache is passed pickled, with the fork start method the
+    # arguments are not pickled and the worker would otherwise share
+    # the database connection of the parent.
+    global _worker_cache
+    _worker_cache = pickle.loads(data)
+
+
+def _parse_in_worker(filename):
+    return MachO(filename, cache=_worker_cache)
+
 
 class MissingMachO(object):
     def __init__(self, filename):
@@ -33,11 +87,241 @@ class MachOGraph(ObjectGraph):
     Graph data structure of Mach-O dependencies
     """
 
-    def __init__(self, debug=0, graph=None, env=None, executable_path=None):
+    def __init__(
+        self,
+        debug=0,
+        graph=None,
+        env=None,
+        executable_path=None,
+        cache=None,
+        dyld_cache=None,
+        resolver=None,
+    ):
         super(MachOGraph, self).__init__(debug=debug, graph=graph)
         self.env = env
         self.trans_table = {}
         self.executable_path = executable_path
+        self.cache = cache
+        self.dyld_cache = dyld_cache
+        self.resolver = resolver
+        self._rpath_stacks = {}
+        self._rpath_table = {}
+        self._pool = None
+        self._prefetched = None
+        self._prefetch_func = None
+        self._summarize_nodes = False
+        self._signatures = {}
+        self._query_graph = None
+        self._query_version = None
+
+    def _macho_class(self):
+        # The callable used to create nodes for Mach-O files
+        if self.cache is None:
+            return MachO
+        return functools.partial(MachO, cache=self.cache)
+
+    def _new_macho(self, filename):
+        # Create a MachO for *filename*, using the result of a
+        # prefetch when there is one.
+        self._signatures[filename] = _file_signature(filename)
+        if self._prefetched is not None:
+            future = self._prefetched.pop(filename, None)
+            if future is not None:
+                return future.result()
+        return self._macho_class()(filename)
+
+    def _prefetch(self, filename):
+        if filename in self._prefetched:
+            return
+        if super(MachOGraph, self).findNode(filename) is not None:
+            return
+        if not os.path.isfile(filename):
+            return
+        self._prefetched[filename] = self._pool.submit(self._prefetch_func, filename)
+
+    def _prefetch_dependencies(self, node):
+        # Start parsing the dependencies of *node*. The names are
+        # located before the walk gets to them, locate is called with
+        # the same arguments again during the walk.
+        for header in node.headers:
+            for _idx, _name, filename in header.walkRelocatables():
+                fn = self.locate(filename, loader=node)
+                if fn is not None:
+                    self._prefetch(fn)
+
+    def run_files(self, paths, workers=None, executor="thread"):
+        """
+        Add the Mach-O files in *paths* and their dependencies to the
+        graph, like calling run_file for every path.
+
+        Files are parsed in a pool of *workers* workers, *executor*
+        is either "thread", "process" or a concurrent.futures.Executor.
+        The graph itself is only updated by the calling thread, and
+        is identical to the graph created by calling run_file.
+
+        Parsing is mostly Python code, with "thread" workers only the
+        time spent reading files overlaps. Use "process" to parse
+        files in parallel.
+
+        Returns the list of nodes for *paths*.
+        """
+        paths = list(paths)
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        if workers <= 1 and isinstance(executor, str):
+            return [self.run_file(path) for path in paths]
+
+        func = self._macho_class()
+        if executor == "process" and self.cache is not None:
+            # Open the cache once in every worker process, instead of
+            # pickling it with every task.
+            pool = _make_executor(
+                executor, workers, _init_worker, (pickle.dumps(self.cache),)
+            )
+            func = _parse_in_worker
+            owned = True
+        elif isinstance(executor, str):
+            pool = _make_executor(executor, workers)
+            owned = True
+        else:
+            pool = executor
+            owned = False
+
+        self._pool = pool
+        self._prefetched = {}
+        self._prefetch_func = func
+        try:
+            for path in paths:
+                self._prefetch(path)
+            return [self.run_file(path) for path in paths]
+
+        finally:
+            for future in self._prefetched.values():
+                future.cancel()
+            self._prefetched = None
+            self._prefetch_func = None
+            self._pool = None
+            if owned:
+                pool.shutdown()
+
+    def run_files_compact(self, paths, workers=None, executor="thread"):
+        """
+        Add the Mach-O files in *paths* and their dependencies to the
+        graph like run_files, and return a CompactGraph for the graph.
+
+        The nodes for the files that are scanned are replaced by
+        CompactNode values once their dependencies are processed, which
+        drops the parsed headers. At most the headers of the files in
+        one chain of dependencies are kept during the walk. These nodes
+        are not updated by update.
+        """
+        self._summarize_nodes = True
+        try:
+            self.run_files(paths, workers=workers, executor=executor)
+        finally:
+            self._summarize_nodes = False
+        return self.compact()
+
+    def _summarize_node(self, node):
+        # Replace the data for *node* by a CompactNode
+        ident = node.graphident
+        incoming, outgoing, _ = self.graph.nodes[ident]
+        self.graph.nodes[ident] = (
+            incoming,
+            outgoing,
+            CompactNode(ident, node.filename, type(node).__name__),
+        )
+
+    def _dyld_find(self, filename, loader_path=None):
+        if self.resolver is not None:
+            return self.resolver.find(filename, loader_path=loader_path)
+        if self.dyld_cache is not None:
+            find = self.dyld_cache.find
+        else:
+            find = dyld_find
+        return find(
+            filename,
+            env=self.env,
+            executable_path=self.executable_path,
+            loader_path=loader_path,
+        )
+
+    def _exists(self, path):
+        # Used to decide if a node is a MachO or a MissingMachO
+        return os.path.exists(path)
+
+    def _isfile(self, path):
+        if self.resolver is not None:
+            return self.resolver.isfile(path)
+        if self.dyld_cache is not None:
+            return self.dyld_cache.stat_cache.isfile(path)
+        return _dyld_isfile(path)
+
+    def rpath_stack(self, node, caller=None):
+        """
+        Return the @rpath search path for *node*: the expanded LC_RPATH
+        entries of *node* followed by those of the nodes in its loader
+        chain, starting at *caller*.
+
+        The stack is calculated when *node* is first scanned, nodes that
+        are loaded from multiple places use the loader chain through
+        which they were found first.
+        """
+        return self._rpath_info(node, caller)[0]
+
+    def _rpath_info(self, node, caller=None):
+        # Returns (rpath stack, executable path) for *node*
+        info = self._rpath_stacks.get(node.graphident)
+        if info is not None:
+            return info
+
+        parent = None
+        if caller is not None and caller is not self:
+            parent = self._rpath_stacks.get(caller.graphident)
+        if parent is None:
+            stack = ()
+            executable_path = self.executable_path
+            if executable_path is None:
+                executable_path = node.loader_path
+        else:
+            stack, executable_path = parent
+
+        own = []
+        for path in node.rpaths():
+            path = _expand_rpath(path, node.loader_path, executable_path)
+            if path not in own:
+                own.append(path)
+        stack = tuple(own) + tuple(path for path in stack if path not in own)
+
+        info = self._rpath_stacks[node.graphident] = (stack, executable_path)
+        return info
+
+    def _locate_rpath(self, filename, loader):
+        stack = self.rpath_stack(loader)
+        key = (stack, filename)
+        try:
+            return self._rpath_table[key]
+        except KeyError:
+            pass
+
+        fn = None
+        rest = filename[len("@rpath/") :]  # noqa: E203
+        for path in stack:
+            candidate = os.path.join(path, rest)
+            if self._isfile(candidate):
+                fn = candidate
+                break
+        else:
+            # Not found through the rpath, fall back to the
+            # default search.
+            try:
+                fn = self._dyld_find(filename)
+            except ValueError:
+                pass
+
+        self._rpath_table[key] = fn
+        return fn
 
     def locate(self, filename, loader=None):
         if not isinstance(filename, (str, unicode)):
@@ -48,23 +332,24 @@ class MachOGraph(ObjectGraph):
                 loader_path = loader.loader_path
 
                 try:
-                    fn = dyld_find(
-                        filename,
-                        env=self.env,
-                        executable_path=self.executable_path,
-                        loader_path=loader_path,
-                    )
+                    fn = self._dyld_find(filename, loader_path=loader_path)
                     self.trans_table[(loader.filename, filename)] = fn
                 except ValueError:
                     return None
 
+        elif filename.startswith("@rpath/") and loader is not None:
+            fn = self.trans_table.get((loader.filename, filename))
+            if fn is None:
+                fn = self._locate_rpath(filename, loader)
+                if fn is None:
+                    return None
+                self.trans_table[(loader.filename, filename)] = fn
+
         else:
             fn = self.trans_table.get(filename)
             if fn is None:
                 try:
-                    fn = dyld_find(
-                        filename, env=self.env, executable_path=self.executable_path
-                    )
+                    fn = self._dyld_find(filename)
                     self.trans_table[filename] = fn
                 except ValueError:
                     return None
@@ -72,22 +357,23 @@ class MachOGraph(ObjectGraph):
 
     def findNode(self, name, loader=None):
         assert isinstance(name, (str, unicode))
-        data = super(MachOGraph, self).findNode(name)
-        if data is not None:
-            return data
-        newname = self.locate(name, loader=loader)
-        if newname is not None and newname != name:
-            return self.findNode(newname)
-        return None
+        while True:
+            data = super(MachOGraph, self).findNode(name)
+            if data is not None:
+                return data
+            newname = self.locate(name, loader=loader)
+            if newname is None or newname == name:
+                return None
+            name = newname
 
     def run_file(self, pathname, caller=None):
         assert isinstance(pathname, (str, unicode))
         self.msgin(2, "run_file", pathname)
         m = self.findNode(pathname, loader=caller)
         if m is None:
-            if not os.path.exists(pathname):
+            if not self._exists(pathname):
                 raise ValueError("%r does not exist" % (pathname,))
-            m = self.createNode(MachO, pathname)
+            m = self.createNode(self._new_macho, pathname)
             self.createReference(caller, m, edge_data="run_file")
             self.scan_node(m)
         self.msgout(2, "")
@@ -95,39 +381,373 @@ class MachOGraph(ObjectGraph):
 
     def load_file(self, name, caller=None):
         assert isinstance(name, (str, unicode))
-        self.msgin(2, "load_file", name, caller)
-        m = self.findNode(name, loader=caller)
-        if m is None:
-            newname = self.locate(name, loader=caller)
-            if newname is not None and newname != name:
-                return self.load_file(newname, caller=caller)
-            if os.path.exists(name):
-                m = self.createNode(MachO, name)
-                self.scan_node(m)
-            else:
-                m = self.createNode(MissingMachO, name)
+        m, new = self._load_file(name, caller)
+        if new:
+            self.scan_node(m, caller=caller)
         self.msgout(2, "")
         return m
 
-    def scan_node(self, node):
+    def _load_file(self, name, caller):
+        # Find or create the node for *name*, without scanning it.
+        # Returns the node and a flag that is true when the node is a
+        # new MachO that needs to be scanned. The caller must call
+        # msgout after scanning.
+        while True:
+            self.msgin(2, "load_file", name, caller)
+            m = self.findNode(name, loader=caller)
+            if m is not None:
+                return m, False
+            newname = self.locate(name, loader=caller)
+            if newname is None or newname == name:
+                break
+            # Like a nested load_file call for the new name, the
+            # msgout for this level is intentionally skipped.
+            name = newname
+
+        if self._exists(name):
+            return self.createNode(self._new_macho, name), True
+        return self.createNode(MissingMachO, name), False
+
+    def _start_scan(self, stack, node, caller, edge_data):
         self.msgin(2, "scan_node", node)
+        if hasattr(node, "rpaths"):
+            self._rpath_info(node, caller)
+            if self._prefetched is not None:
+                self._prefetch_dependencies(node)
+        stack.append((node, self._iter_dependencies(node), edge_data))
+
+    def _iter_dependencies(self, node):
         for header in node.headers:
             for _idx, name, filename in header.walkRelocatables():
                 assert isinstance(name, (str, unicode))
                 assert isinstance(filename, (str, unicode))
+                yield name, filename
+
+    def _uses_hooks(self):
+        # True when a subclass overrides load_file or scan_node
+        cls = type(self)
+        for name in ("load_file", "scan_node"):
+            method = getattr(cls, name)
+            if getattr(method, "__func__", method) is not MachOGraph.__dict__[name]:
+                return True
+        return False
+
+    def scan_node(self, node, caller=None):
+        # This is a depth-first walk using an explicit stack instead of
+        # recursion through load_file, nodes and edges are created in the
+        # same order as with a recursive walk. Every item on the stack is
+        # a node that is being scanned, an iterator for the dependencies
+        # that are not processed yet and the edge data for the reference
+        # from the previous node on the stack (None for the first item).
+        stack = []
+        self._start_scan(stack, node, caller, None)
+
+        if self._uses_hooks():
+            # Subclasses that override load_file or scan_node see every
+            # step of the walk, which is then recursive.
+            for name, filename in stack[0][1]:
                 m = self.load_file(filename, caller=node)
                 self.createReference(node, m, edge_data=name)
-        self.msgout(2, "", node)
+            if self._summarize_nodes:
+                self._summarize_node(node)
+            self.msgout(2, "", node)
+            return
+
+        while stack:
+            node, dependencies, _ = stack[-1]
+            for name, filename in dependencies:
+                m, new = self._load_file(filename, node)
+                if new:
+                    self._start_scan(stack, m, node, name)
+                    break
+                self.msgout(2, "")
+                self.createReference(node, m, edge_data=name)
+
+            else:
+                node, _, edge_data = stack.pop()
+                if self._summarize_nodes:
+                    self._summarize_node(node)
+                self.msgout(2, "", node)
+                if stack:
+                    self.msgout(2, "")
+                    self.createReference(stack[-1][0], node, edge_data=edge_data)
+
+    def snapshot(self):
+        """
+        Return a picklable snapshot of the graph that can be loaded
+        into another graph using restore.
+        """
+        graph = self.graph
+        root = self.graphident
+        nodes = [graph.node_data(ident) for ident in graph if ident is not root]
+        edges = []
+        for edge in sorted(graph.edge_list()):
+            _, edge_data, head, tail = graph.describe_edge(edge)
+            edges.append((None if head is root else head, tail, edge_data))
+        return {
+            "version": _SNAPSHOT_VERSION,
+            "nodes": nodes,
+            "edges": edges,
+            "trans_table": dict(self.trans_table),
+            "rpath_stacks": dict(self._rpath_stacks),
+            "rpath_table": dict(self._rpath_table),
+            "signatures": dict(self._signatures),
+        }
+
+    def restore(self, snapshot):
+        """
+        Load a snapshot created by snapshot into this graph, which
+        must be empty.
+        """
+        if snapshot.get("version") != _SNAPSHOT_VERSION:
+            raise ValueError("Unsupported snapshot version")
+        if self.graph.number_of_nodes() != 1:
+            raise ValueError("Cannot restore into a graph that is not empty")
+
+        for node in snapshot["nodes"]:
+            self.graph.add_node(node.graphident, node)
+        for head, tail, edge_data in snapshot["edges"]:
+            self.graph.add_edge(
+                self.graphident if head is None else head,
+                tail,
+                edge_data,
+                create_nodes=False,
+            )
+        self.trans_table.update(snapshot["trans_table"])
+        self._rpath_stacks.update(snapshot["rpath_stacks"])
+        self._rpath_table.update(snapshot["rpath_table"])
+        self._signatures.update(snapshot["signatures"])
+
+    def stale_files(self):
+        """
+        Return the files in the graph that were changed or removed
+        since they were parsed, as a tuple of two lists.
+        """
+        changed = []
+        removed = []
+        for filename, signature in self._signatures.items():
+            current = _file_signature(filename)
+            if current is None:
+                removed.append(filename)
+            elif current != signature:
+                changed.append(filename)
+        return changed, removed
+
+    def _delete_node(self, ident):
+        # Remove a node and its edges from the graph. ObjectGraph.removeNode
+        # only hides a node, and would restore the old node when a node with
+        # the same identifier is added later.
+        self.graph.hide_node(ident)
+        _, edges = self.graph.hidden_nodes.pop(ident)
+        for edge in edges:
+            self.graph.hidden_edges.pop(edge, None)
+        self._rpath_stacks.pop(ident, None)
+        self._signatures.pop(ident, None)
+
+    def _delete_out_edges(self, ident):
+        for edge in list(self.graph.out_edges(ident)):
+            self.graph.hide_edge(edge)
+            del self.graph.hidden_edges[edge]
+
+    def _caller_of(self, ident):
+        # An arbitrary node that refers to *ident*, or None
+        for head in self.graph.inc_nbrs(ident):
+            if head is not self.graphident:
+                return self.graph.node_data(head)
+        return None
+
+    def _forget_path(self, path):
+        # Forget cached lookup results that involve *path*
+        for table in (self.trans_table, self._rpath_table):
+            for key in [key for key, value in table.items() if value == path]:
+                del table[key]
+        if self.dyld_cache is not None:
+            self.dyld_cache.stat_cache.invalidate(path)
+        if self.resolver is not None and self.resolver.stat_cache is not None:
+            self.resolver.stat_cache.invalidate(path)
+
+    def _forget_basenames(self, basenames):
+        # Forget cached lookup results for names with a basename in
+        # *basenames* and delete the nodes for those names, except
+        # for nodes added with run_file. Returns the nodes that
+        # depended on the deleted nodes.
+        for table in (self.trans_table, self._rpath_table):
+            for key in list(table):
+                # Keys are a name, or a tuple with the name as the
+                # second element.
+                name = key[1] if isinstance(key, tuple) else key
+                if os.path.basename(name) in basenames:
+                    del table[key]
+
+        result = []
+        graph = self.graph
+        for ident in list(graph.nodes):
+            if ident is self.graphident or os.path.basename(ident) not in basenames:
+                continue
+            heads = graph.inc_nbrs(ident)
+            if self.graphident in heads:
+                continue
+            result.extend(heads)
+            self._delete_node(ident)
+        return result
+
+    def update(self, changed=(), added=(), removed=()):
+        """
+        Update the graph after files were changed, added or removed,
+        without processing the files that did not change.
+
+        Files in *changed* are parsed again and their dependencies are
+        updated. Files in *removed* are removed from the graph, and the
+        files depending on them are scanned again. Files in *added* are
+        added like with run_file. Files that depend on a library with
+        the same basename as an added file are scanned again as well,
+        the added file might be found instead of the library that was
+        found before (for example earlier in the @rpath search paths)
+        or instead of a missing library.
+
+        Nodes that are no longer reachable are removed from the graph.
+        The @rpath search paths of nodes other than the changed nodes
+        are not recalculated.
+        """
+        rescan = []
+        graph = self.graph
+
+        if added or removed:
+            if self.dyld_cache is not None:
+                self.dyld_cache.invalidate()
+            for key, value in list(self._rpath_table.items()):
+                if value is None:
+                    del self._rpath_table[key]
+
+        for path in removed:
+            self._forget_path(path)
+            if path not in graph.nodes:
+                continue
+            rescan.extend(
+                head for head in graph.inc_nbrs(path) if head is not self.graphident
+            )
+            self._delete_node(path)
+
+        for path in added:
+            self._forget_path(path)
+        if added:
+            rescan.extend(
+                self._forget_basenames(set(os.path.basename(path) for path in added))
+            )
+            # Missing libraries might be found now
+            for ident in list(graph.nodes):
+                if isinstance(graph.node_data(ident), MissingMachO):
+                    rescan.extend(
+                        head
+                        for head in graph.inc_nbrs(ident)
+                        if head is not self.graphident
+                    )
+                    self._delete_node(ident)
+
+        for path in changed:
+            if path not in graph.nodes:
+                continue
+            node = graph.node_data(path)
+            if not isinstance(node, MachO):
+                continue
+            incoming, outgoing, _ = graph.nodes[path]
+            graph.nodes[path] = (incoming, outgoing, self._new_macho(path))
+            self._rpath_stacks.pop(path, None)
+            rescan.append(path)
+
+        seen = set()
+        for ident in rescan:
+            if ident in seen or ident not in graph.nodes:
+                continue
+            seen.add(ident)
+            self._delete_out_edges(ident)
+            node = graph.node_data(ident)
+            self.scan_node(node, caller=self._caller_of(ident))
+
+        for path in added:
+            self.run_file(path)
+
+        reachable = set(graph.iterdfs(self.graphident))
+        for ident in list(graph.nodes):
+            if ident not in reachable:
+                self._delete_node(ident)
+
+    def compact(self):
+        """
+        Return a CompactGraph with the nodes and edges of this graph
+        """
+        return CompactGraph.from_graph(self)
+
+    def _graph_version(self):
+        # Changes whenever nodes or edges are added, removed, hidden
+        # or restored.
+        graph = self.graph
+        return (
+            id(graph),
+            graph.next_edge,
+            len(graph.nodes),
+            len(graph.edges),
+            len(graph.hidden_nodes),
+            len(graph.hidden_edges),
+        )
+
+    def _queries(self):
+        # A CompactGraph used for dependency queries, rebuilt when the
+        # graph changed since the last query.
+        version = self._graph_version()
+        if self._query_graph is None or self._query_version != version:
+            self._query_graph = self.compact()
+            self._query_version = version
+        return self._query_graph
+
+    def _query_ident(self, path):
+        ident = self.getRawIdent(path)
+        if ident is None:
+            ident = path
+        if ident not in self._queries():
+            raise KeyError(path)
+        return ident
+
+    def dependents_of(self, path):
+        """
+        Return the set of names of the nodes that directly depend
+        on *path*, which is a node or the name of a node.
+        """
+        return set(self._queries().dependents(self._query_ident(path)))
+
+    def transitive_dependents(self, path):
+        """
+        Return the set of names of the nodes that directly or
+        indirectly depend on *path*.
+        """
+        return self._queries().transitive_dependents(self._query_ident(path))
+
+    def transitive_dependencies(self, path):
+        """
+        Return the set of names of the nodes that *path* directly or
+        indirectly depends on.
+        """
+        return self._queries().transitive_dependencies(self._query_ident(path))
+
+    def itergraphreport(self, name="G", edge_kinds=DEFAULT_EDGE_KINDS):
+        nodes = imap(self.graph.describe_node, self.graph.iterdfs(self))
+        describe_edge = self.graph.describe_edge
+        return itergraphreport(nodes, describe_edge, name=name, edge_kinds=edge_kinds)
+
+    def graphreport(self, fileobj=None, edge_kinds=DEFAULT_EDGE_KINDS):
+        if fileobj is None:
+            fileobj = sys.stdout
+        fileobj.writelines(self.itergraphreport(edge_kinds=edge_kinds))
 
-    def itergraphreport(self, name="G"):
-        nodes = map(self.graph.describe_node, self.graph.iterdfs(self))
+    def iterjsonreport(self, edge_kinds=DEFAULT_EDGE_KINDS):
+        nodes = imap(self.graph.describe_node, self.graph.iterdfs(self))
         describe_edge = self.graph.describe_edge
-        return itergraphreport(nodes, describe_edge, name=name)
+        return iterjsonreport(nodes, describe_edge, edge_kinds=edge_kinds)
 
-    def graphreport(self, fileobj=None):
+    def jsonreport(self, fileobj=None, edge_kinds=DEFAULT_EDGE_KINDS):
         if fileobj is None:
             fileobj = sys.stdout
-        fileobj.writelines(self.itergraphreport())
+        fileobj.writelines(self.iterjsonreport(edge_kinds=edge_kinds))
 
 
 def main(args):
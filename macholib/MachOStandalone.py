@@ -1,17 +1,48 @@
 import os
 from collections import deque
 
+from macholib.batch import _make_executor
+from macholib.cache import _file_digest
 from macholib.dyld import framework_info
 from macholib.MachOGraph import MachOGraph, MissingMachO
 from macholib.util import (
     flipwritable,
     has_filename_filter,
     in_system_path,
+    is_platform_file,
     iter_platform_files,
     mergecopy,
     mergetree,
+    strip_files,
 )
 
+# Version of the format of plans created by MachOStandalone.plan
+_PLAN_VERSION = 1
+
+
+def _tree_size(path):
+    # Total size of the files in a directory tree, not following
+    # symbolic links.
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for fn in files:
+            fn = os.path.join(root, fn)
+            if not os.path.islink(fn):
+                total += os.path.getsize(fn)
+    return total
+
+
+def _copy_graph(graph):
+    # A copy of an altgraph Graph, the node and edge data is shared
+    # with the original.
+    result = type(graph)()
+    for node in graph.node_list():
+        result.add_node(node, graph.node_data(node))
+    for edge in graph.edge_list():
+        head, tail = graph.edge_by_id(edge)
+        result.add_edge(head, tail, graph.edge_data(edge))
+    return result
+
 
 class ExcludedMachO(MissingMachO):
     pass
@@ -33,9 +64,61 @@ class FilteredMachOGraph(MachOGraph):
             return None
         return self.delegate.locate(newname, loader=loader)
 
+    def _exists(self, path):
+        source = self.delegate._copy_source(path)
+        if source is not None:
+            return os.path.exists(source)
+        return super(FilteredMachOGraph, self)._exists(path)
+
+    def _new_macho(self, filename):
+        m = self.delegate._parsed.pop(filename, None)
+        if m is None:
+            source = self.delegate._copy_source(filename)
+            if source is None:
+                return super(FilteredMachOGraph, self)._new_macho(filename)
+
+            # The file is still being copied, parse the original instead
+            # of waiting for the copy.
+            m = self._macho_class()(source)
+
+        m.graphident = m.filename = filename
+        m.loader_path = os.path.dirname(filename)
+        return m
+
 
 class MachOStandalone(object):
-    def __init__(self, base, dest=None, graph=None, env=None, executable_path=None):
+    """
+    Copy the non-system dependencies of the Mach-O files in *base*
+    into *dest* and rewrite the load commands to refer to the copies.
+
+    File copies, load command rewrites and stripping are done in a
+    pool of *workers* threads, or in a pool with a thread per CPU when
+    *workers* is None. With a single worker, the default, everything
+    is done in the calling thread.
+
+    Files are copied using copy-on-write clones when the filesystem
+    supports them. When *hardlinks* is true the files in frameworks
+    that are not Mach-O files, and therefore aren't modified, are
+    hard linked instead of copied.
+
+    When *dedup* is true libraries with the same contents are only
+    copied once, other names for the library are symbolic links to
+    that copy. Libraries are identified by their LC_UUID commands and
+    size, or by the SHA-256 digest of their contents when they don't
+    have an LC_UUID command.
+    """
+
+    def __init__(
+        self,
+        base,
+        dest=None,
+        graph=None,
+        env=None,
+        executable_path=None,
+        workers=1,
+        hardlinks=False,
+        dedup=False,
+    ):
         self.base = os.path.join(os.path.abspath(base), "")
         if dest is None:
             dest = os.path.join(self.base, "Contents", "Frameworks")
@@ -43,9 +126,75 @@ class MachOStandalone(object):
         self.mm = FilteredMachOGraph(
             self, graph=graph, env=env, executable_path=executable_path
         )
+        self._graph = graph
         self.changemap = {}
         self.excludes = []
         self.pending = deque()
+        self.workers = workers
+        self.hardlinks = hardlinks
+        self.dedup = dedup
+        self._pool = None
+        self._copies = {}
+        self._sources = {}
+        self._parsed = {}
+        self._images = {}
+        self._duplicates = []
+        self._plan = None
+
+    def _submit(self, func, *args):
+        # Call *func* in the worker pool when there is one, and in
+        # the calling thread otherwise. Returns a future or None.
+        if self._pool is None:
+            func(*args)
+            return None
+        return self._pool.submit(func, *args)
+
+    def _start_copy(self, kind, src, dest):
+        # Start copying *src* to *dest*, kind is "file" or "tree". When
+        # creating a plan the copy is only recorded. Files that aren't
+        # copied yet are parsed from *src* by the graph.
+        if self._plan is not None:
+            size = os.path.getsize(src) if kind == "file" else _tree_size(src)
+            self._plan["copies"].append(
+                {"kind": kind, "source": src, "dest": dest, "size": size}
+            )
+            future = None
+        else:
+            func = self.mergecopy if kind == "file" else self.mergetree
+            future = self._submit(func, src, dest)
+        self._copies[dest] = future
+        if future is not None or self._plan is not None:
+            self._sources[dest] = src
+        return future
+
+    def _copy_of(self, path):
+        # The copy that creates *path*, for files in copied frameworks
+        # this is the copy of the framework.
+        while True:
+            if path in self._copies:
+                return self._copies[path]
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+
+    def _copy_source(self, path):
+        # The source of *path* when it is a file that is copied in
+        # the background, or is in a directory that is copied in the
+        # background, and None otherwise.
+        if not self._sources:
+            return None
+        head = path
+        while True:
+            source = self._sources.get(head)
+            if source is not None:
+                if head == path:
+                    return source
+                return os.path.join(source, os.path.relpath(path, head))
+            parent = os.path.dirname(head)
+            if parent == head:
+                return None
+            head = parent
 
     def update_node(self, m):
         return m
@@ -88,26 +237,158 @@ class MachOStandalone(object):
         else:
             dest = os.path.join(self.dest, os.path.basename(filename))
 
-        if not os.path.exists(dest):
-            self.mergecopy(filename, dest)
+        if self.dedup:
+            target = self._dedup_target(filename, dest)
+            if target is not None:
+                return target
+
+        if dest not in self._copies and not os.path.exists(dest):
+            self._start_copy("file", filename, dest)
         return dest
 
+    def _content_key(self, m):
+        # Identity of the contents of a Mach-O file
+        size = os.path.getsize(m.filename)
+        uuids = m.uuids()
+        if uuids and None not in uuids:
+            return ("uuid", size) + tuple(uuids)
+        return ("sha256", size, _file_digest(m.filename))
+
+    def _dedup_target(self, filename, dest):
+        # Returns the copy to use instead of copying *filename* to
+        # *dest*, or None when *filename* must be copied.
+        if dest in self._copies:
+            return None
+
+        m = self.mm._macho_class()(filename)
+        target = self._images.setdefault(self._content_key(m), dest)
+        if target == dest:
+            if not os.path.exists(dest):
+                self._parsed[dest] = m
+            return None
+
+        if self._plan is not None:
+            self._plan["links"].append({"dest": dest, "target": target})
+        elif not os.path.lexists(dest):
+            self._make_link(dest, target)
+        self._duplicates.append((filename, dest, target, os.path.getsize(filename)))
+        return target
+
+    def _make_link(self, dest, target):
+        os.symlink(os.path.relpath(target, os.path.dirname(dest)), dest)
+
+    def dedup_report(self):
+        """
+        Return a dictionary describing the libraries that weren't copied
+        because an identical library was already copied into the bundle,
+        with keys "duplicates", a list of dictionaries with keys "source",
+        "dest", "target" and "size", and "bytes_saved".
+        """
+        duplicates = [
+            {"source": source, "dest": dest, "target": target, "size": size}
+            for source, dest, target, size in self._duplicates
+        ]
+        return {
+            "duplicates": duplicates,
+            "bytes_saved": sum(item["size"] for item in duplicates),
+        }
+
     def mergecopy(self, src, dest):
+        # Used for Mach-O files, whose load commands will be rewritten
         return mergecopy(src, dest)
 
     def mergetree(self, src, dest):
-        return mergetree(src, dest)
+        return mergetree(src, dest, copyfn=self._copy_tree_file)
+
+    def _copy_tree_file(self, src, dest):
+        # Mach-O files in a tree are rewritten and must be copied,
+        # other files can be linked.
+        link = self.hardlinks and not is_platform_file(src)
+        return mergecopy(src, dest, link=link)
+
+    def strip_files(self, files):
+        return strip_files(files)
 
     def copy_framework(self, info):
         dest = os.path.join(self.dest, info["shortname"] + ".framework")
         destfn = os.path.join(self.dest, info["name"])
         src = os.path.join(info["location"], info["shortname"] + ".framework")
-        if not os.path.exists(dest):
-            self.mergetree(src, dest)
-            self.pending.append((destfn, iter_platform_files(dest)))
+        if dest not in self._copies and not os.path.exists(dest):
+            future = self._start_copy("tree", src, dest)
+            self.pending.append((destfn, self._iter_copied_files(src, dest, future)))
         return destfn
 
-    def run(self, platfiles=None, contents=None):
+    def _iter_copied_files(self, src, dest, future):
+        # The Mach-O files in a framework can only be listed after
+        # the framework is copied. When planning the files in the
+        # original are used instead.
+        if self._plan is not None:
+            for fn in iter_platform_files(src):
+                yield os.path.join(dest, os.path.relpath(fn, src))
+            return
+
+        if future is not None:
+            future.result()
+        for fn in iter_platform_files(dest):
+            yield fn
+
+    def _start(self):
+        self._images.clear()
+        del self._duplicates[:]
+        workers = self.workers
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers > 1:
+            self._pool = _make_executor("thread", workers)
+
+    def _finish(self):
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+        self._copies.clear()
+        self._sources.clear()
+        self._parsed.clear()
+
+    def _wait(self, tasks):
+        # Wait for *tasks* and all copies, and raise the first error
+        for future in tasks + list(self._copies.values()):
+            if future is not None:
+                future.result()
+
+    def run(self, platfiles=None, contents=None, strip=False):
+        """
+        Locate and copy the dependencies of *platfiles*, which
+        defaults to all Mach-O files in the base directory, and
+        rewrite the load commands of all files. The files are
+        stripped when *strip* is true.
+
+        Returns the set of files in the bundle.
+        """
+        self._start()
+        try:
+            machfiles, changemap = self._scan(platfiles, contents)
+            mm = self.mm
+            tasks = []
+            for node in machfiles:
+                fn = mm.locate(node.filename)
+                if fn is None:
+                    continue
+                changefunc = self._changefunc(node, changemap)
+                tasks.append(
+                    self._submit(self._update_file, node, fn, changefunc, strip)
+                )
+            self._wait(tasks)
+
+            allfiles = [mm.locate(node.filename) for node in machfiles]
+            return set(filter(None, allfiles))
+
+        finally:
+            self._finish()
+
+    def _scan(self, platfiles, contents):
+        # Build the dependency graph, returns the list of nodes for
+        # files in the bundle and the mapping from their filename to
+        # the name used in load commands.
         mm = self.mm
         if contents is None:
             contents = "@executable_path/.."
@@ -135,6 +416,148 @@ class MachOStandalone(object):
             )
             changemap[node.filename] = dest
 
+        return machfiles, changemap
+
+    def plan(self, platfiles=None, contents=None, strip=False):
+        """
+        Return a plan for what run would do, without changing any
+        files. The plan is a dictionary that can be serialized as JSON
+        and executed later using apply.
+
+        The plan contains the copies with their size, the symbolic
+        links for duplicate libraries, the load command changes for
+        every file with the resulting size of the load commands of
+        every header, and the files to strip.
+        """
+        mm, changemap, pending = self.mm, self.changemap, self.pending
+        # Plan using a new graph with the same settings as self.mm, the
+        # nodes created while planning would otherwise be used by run.
+        self.mm = FilteredMachOGraph(
+            self,
+            debug=mm.debug,
+            graph=None if self._graph is None else _copy_graph(self._graph),
+            env=mm.env,
+            executable_path=mm.executable_path,
+            cache=mm.cache,
+            dyld_cache=mm.dyld_cache,
+            resolver=mm.resolver,
+        )
+        self.changemap = {}
+        self.pending = deque()
+        self._plan = {"copies": [], "links": []}
+        self._images.clear()
+        del self._duplicates[:]
+        try:
+            machfiles, bundlemap = self._scan(platfiles, contents)
+            rewrites = []
+            files = []
+            for node in machfiles:
+                # Planned copies don't exist yet, and can't be located
+                fn = node.filename
+                if self._copy_source(fn) is None:
+                    fn = self.mm.locate(fn)
+                    if fn is None:
+                        continue
+                files.append(fn)
+                changes = self._plan_changes(node, bundlemap)
+                if changes:
+                    rewrites.append(
+                        {
+                            "path": fn,
+                            "changes": changes,
+                            "headers": [
+                                {
+                                    "offset": header.offset,
+                                    "sizeofcmds": int(header.header.sizeofcmds),
+                                    "new_sizeofcmds": int(header.header.sizeofcmds)
+                                    + header.sizediff,
+                                    "low_offset": header.low_offset,
+                                    "fits": header.total_size + header.sizediff
+                                    <= header.low_offset,
+                                }
+                                for header in node.headers
+                            ],
+                        }
+                    )
+
+            return {
+                "version": _PLAN_VERSION,
+                "base": self.base,
+                "dest": self.dest,
+                "copies": self._plan["copies"],
+                "links": self._plan["links"],
+                "rewrites": rewrites,
+                "strip": sorted(set(files)) if strip else [],
+                "files": sorted(set(files)),
+            }
+
+        finally:
+            self.mm, self.changemap, self.pending = mm, changemap, pending
+            self._plan = None
+            self._finish()
+
+    def _plan_changes(self, node, changemap):
+        # Rewrite the load commands of *node* in memory, and return
+        # the results of the change function that were used.
+        changes = {}
+        changefunc = self._changefunc(node, changemap)
+
+        def recording_changefunc(path):
+            result = changefunc(path)
+            if result is not None:
+                changes[path] = result
+            return result
+
+        node.rewriteLoadCommands(recording_changefunc)
+        return changes
+
+    def apply(self, plan):
+        """
+        Execute a plan created by plan, without building the
+        dependency graph. Returns the set of files in the bundle.
+        """
+        if plan.get("version") != _PLAN_VERSION:
+            raise ValueError("Unsupported plan version %r" % (plan.get("version"),))
+
+        self._start()
+        try:
+            for copy in plan["copies"]:
+                if not os.path.exists(copy["dest"]):
+                    self._start_copy(copy["kind"], copy["source"], copy["dest"])
+            for link in plan["links"]:
+                if not os.path.lexists(link["dest"]):
+                    self._make_link(link["dest"], link["target"])
+
+            strip = set(plan["strip"])
+            tasks = []
+            for item in plan["rewrites"]:
+                path = item["path"]
+                tasks.append(
+                    self._submit(self._apply_file, path, item["changes"], path in strip)
+                )
+                strip.discard(path)
+            for path in sorted(strip):
+                tasks.append(self._submit(self._apply_file, path, None, True))
+            self._wait(tasks)
+
+            return set(plan["files"])
+
+        finally:
+            self._finish()
+
+    def _apply_file(self, fn, changes, strip):
+        copy = self._copy_of(fn)
+        if copy is not None:
+            copy.result()
+        if changes:
+            node = self.mm._macho_class()(fn)
+            self._update_file(node, fn, changes.get, strip)
+        elif strip:
+            self.strip_files([fn])
+
+    def _changefunc(self, node, changemap):
+        mm = self.mm
+
         def changefunc(path):
             print("changefunc: ", path)
             if path.startswith("@loader_path/"):
@@ -146,36 +569,41 @@ class MachOStandalone(object):
 
             elif path.startswith("@rpath/"):
                 # Another hack for py2app: In most cases an
-                # @rpath path doesn't require updates.
-                return path
+                # @rpath path doesn't require updates, except
+                # when it refers to a library outside of the
+                # bundle that was copied into the bundle.
+                fn = mm.trans_table.get((node.filename, path))
+                if fn is None or fn.startswith(self.base):
+                    return path
+                return changemap.get(mm.locate(fn))
 
             res = mm.locate(path)
             rv = changemap.get(res)
             if rv is None and path.startswith("@loader_path/"):
                 rv = changemap.get(mm.locate(mm.trans_table.get((node.filename, path))))
-            if rv is None and path.startswith("@rpath/"):
-                rv = changemap.get(mm.locate(mm.trans_table.get((node.filename, path))))
             return rv
 
-        for node in machfiles:
-            fn = mm.locate(node.filename)
-            if fn is None:
-                continue
-            rewroteAny = False
-            for _header in node.headers:
-                if node.rewriteLoadCommands(changefunc):
-                    rewroteAny = True
-            if rewroteAny:
-                old_mode = flipwritable(fn)
-                try:
-                    with open(fn, "rb+") as f:
-                        for _header in node.headers:
-                            f.seek(0)
-                            node.write(f)
-                        f.seek(0, 2)
-                        f.flush()
-                finally:
-                    flipwritable(fn, old_mode)
-
-        allfiles = [mm.locate(node.filename) for node in machfiles]
-        return set(filter(None, allfiles))
+        return changefunc
+
+    def _update_file(self, node, fn, changefunc, strip):
+        # Rewrite the load commands of *fn* and strip it. Copies are
+        # submitted to the pool before the rewrites, waiting for a copy
+        # in a worker therefore cannot deadlock.
+        copy = self._copy_of(fn)
+        if copy is not None:
+            copy.result()
+
+        rewroteAny = False
+        for _header in node.headers:
+            if node.rewriteLoadCommands(changefunc):
+                rewroteAny = True
+        if rewroteAny:
+            old_mode = flipwritable(fn)
+            try:
+                with open(fn, "rb+") as f:
+                    node.write(f)
+            finally:
+                flipwritable(fn, old_mode)
+
+        if strip:
+            self.strip_files([fn])
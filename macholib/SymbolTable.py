@@ -5,10 +5,16 @@ Class to read the symbol table from a Mach-O header
 from __future__ import with_statement
 
 import sys
+from bisect import bisect_left, bisect_right
 
 from macholib.mach_o import (
+    LC_SEGMENT,
+    LC_SEGMENT_64,
     MH_CIGAM_64,
     MH_MAGIC_64,
+    N_SECT,
+    N_STAB,
+    N_TYPE,
     dylib_module,
     dylib_reference,
     dylib_table_of_contents,
@@ -16,20 +22,79 @@ from macholib.mach_o import (
     nlist_64,
     relocation_info,
 )
+from macholib.ptypes import sizeof
 
-__all__ = ["SymbolTable"]
+__all__ = ["SymbolTable", "SymbolList"]
 
 if sys.version_info[0] == 2:
     range = xrange  # noqa: F821
 
 
+def _symbol_name(strtab, strx):
+    if strx == 0:
+        return ""
+    return strtab[strx : strtab.find(b"\x00", strx)]  # noqa: E203
+
+
+class SymbolList(object):
+    """
+    Lazy sequence of (nlist, name) tuples for (a range of) a symbol
+    table. The nlist structures and names are only created when an
+    item is accessed, slicing returns a new view without decoding any
+    symbols.
+    """
+
+    def __init__(self, symbols, strtab, indices=None):
+        self._symbols = symbols
+        self._strtab = strtab
+        if indices is None:
+            indices = range(len(symbols))
+        self._indices = indices
+
+    def __repr__(self):
+        return "<%s of %d symbols>" % (type(self).__name__, len(self._indices))
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return SymbolList(self._symbols, self._strtab, self._indices[index])
+        sym = self._symbols[self._indices[index]]
+        return sym, _symbol_name(self._strtab, sym.n_un)
+
+    def __iter__(self):
+        symbols = self._symbols
+        strtab = self._strtab
+        for idx in self._indices:
+            sym = symbols[idx]
+            yield sym, _symbol_name(strtab, sym.n_un)
+
+    def names(self):
+        """
+        Iterate over the names of the symbols, without creating
+        nlist structures
+        """
+        records = self._symbols.records()
+        strtab = self._strtab
+        for idx in self._indices:
+            # The first field of an nlist is the string table index
+            yield _symbol_name(strtab, records[idx][0])
+
+
 class SymbolTable(object):
-    def __init__(self, macho, header=None, openfile=None):
+    def __init__(self, macho, header=None, openfile=None, lazy=False):
         if openfile is None:
             openfile = open
         if header is None:
             header = macho.headers[0]
         self.macho_header = header
+        self.lazy = lazy
+        self._filename = macho.filename
+        self._openfile = openfile
+        self._symbols = None
+        self._name_index = None
+        self._addr_index = None
         with openfile(macho.filename, "rb") as fh:
             self.symtab = header.getSymbolTableCommand()
             self.dysymtab = header.getDynamicSymbolTableCommand()
@@ -40,30 +105,116 @@ class SymbolTable(object):
             if self.dysymtab is not None:
                 self.readDynamicSymbolTable(fh)
 
+    def _readarray(self, fh, cls, off, n):
+        fh.seek(self.macho_header.offset + off)
+        return cls.array_from_buffer(
+            fh.read(n * sizeof(cls)), n, self.macho_header.endian
+        )
+
+    def _nlist_class(self):
+        if self.macho_header.MH_MAGIC in [MH_MAGIC_64, MH_CIGAM_64]:
+            return nlist_64
+        else:
+            return nlist
+
     def readSymbolTable(self, fh):
         cmd = self.symtab
         fh.seek(self.macho_header.offset + cmd.stroff)
-        strtab = fh.read(cmd.strsize)
-        fh.seek(self.macho_header.offset + cmd.symoff)
-        nlists = []
+        strtab = self.strtab = fh.read(cmd.strsize)
 
-        if self.macho_header.MH_MAGIC in [MH_MAGIC_64, MH_CIGAM_64]:
-            cls = nlist_64
-        else:
-            cls = nlist
-
-        for _i in range(cmd.nsyms):
-            cmd = cls.from_fileobj(fh, _endian_=self.macho_header.endian)
-            if cmd.n_un == 0:
-                nlists.append((cmd, ""))
-            else:
-                nlists.append(
-                    (
-                        cmd,
-                        strtab[cmd.n_un : strtab.find(b"\x00", cmd.n_un)],  # noqa: E203
-                    )
-                )
-        return nlists
+        symbols = self._symbols = self._readarray(
+            fh, self._nlist_class(), cmd.symoff, cmd.nsyms
+        )
+        if self.lazy:
+            return SymbolList(symbols, strtab)
+        return [(sym, _symbol_name(strtab, sym.n_un)) for sym in symbols]
+
+    def as_numpy(self):
+        """
+        Return the symbol table as a NumPy structured array with
+        the fields n_strx, n_type, n_sect, n_desc and n_value. The
+        n_strx field is the offset of the symbol name in self.strtab.
+
+        This requires NumPy.
+        """
+        import numpy
+
+        cmd = self.symtab
+        cls = self._nlist_class()
+        dtype = cls.numpy_dtype(self.macho_header.endian)
+        dtype.names = ("n_strx",) + dtype.names[1:]
+        if cmd is None:
+            return numpy.zeros(0, dtype=dtype)
+        with self._openfile(self._filename, "rb") as fh:
+            fh.seek(self.macho_header.offset + cmd.symoff)
+            data = fh.read(cmd.nsyms * dtype.itemsize)
+        return numpy.frombuffer(data, dtype=dtype, count=cmd.nsyms)
+
+    def lookup(self, name):
+        """
+        Return the list of (nlist, name) entries for symbols with the
+        given name, the list is empty when there are no such symbols.
+        """
+        if not isinstance(name, bytes):
+            name = name.encode(sys.getfilesystemencoding())
+        if self._symbols is None:
+            return []
+        if self._name_index is None:
+            index = {}
+            strtab = self.strtab
+            for idx, record in enumerate(self._symbols.records()):
+                # The first field of an nlist is the string table index
+                index.setdefault(_symbol_name(strtab, record[0]), []).append(idx)
+            self._name_index = index
+        return [self.nlists[idx] for idx in self._name_index.get(name, ())]
+
+    def _section_ends(self):
+        # The end address of the sections in the header, in the order
+        # used for the n_sect field of symbols (starting at 1).
+        ends = [None]
+        for lc, _cmd, data in self.macho_header.commands:
+            if lc.cmd in (LC_SEGMENT, LC_SEGMENT_64):
+                for sect in data:
+                    ends.append(sect.addr + sect.size)
+        return ends
+
+    def symbol_at(self, addr):
+        """
+        Return the (nlist, name) entry for the symbol that contains
+        address *addr*, that is the section symbol with the highest
+        address that is not larger than *addr*, provided *addr* is
+        before the end of the section of that symbol. Returns None
+        when there is no such symbol.
+        """
+        if self._symbols is None:
+            return None
+        if self._addr_index is None:
+            entries = sorted(
+                (record[4], idx, record[2])
+                for idx, record in enumerate(self._symbols.records())
+                if not (record[1] & N_STAB) and (record[1] & N_TYPE) == N_SECT
+            )
+            section_ends = self._section_ends()
+            self._addr_index = (
+                [value for value, _, _ in entries],
+                [idx for _, idx, _ in entries],
+                [
+                    section_ends[sect] if sect < len(section_ends) else None
+                    for _, _, sect in entries
+                ],
+            )
+        addrs, indices, ends = self._addr_index
+        # The symbol at *pos* - 1 is the last one that starts at or
+        # before *addr*, the next symbol is past *addr*.
+        pos = bisect_right(addrs, addr)
+        if pos == 0:
+            return None
+        # Use the first symbol in the table when there are multiple
+        # symbols for the same address.
+        pos = bisect_left(addrs, addrs[pos - 1])
+        if ends[pos] is not None and addr >= ends[pos]:
+            return None
+        return self.nlists[indices[pos]]
 
     def readDynamicSymbolTable(self, fh):
         cmd = self.dysymtab
@@ -84,22 +235,17 @@ class SymbolTable(object):
             self.toc = self.readtoc(fh, cmd.tocoff, cmd.ntoc)
 
     def readtoc(self, fh, off, n):
-        fh.seek(self.macho_header.offset + off)
-        return [dylib_table_of_contents.from_fileobj(fh) for i in range(n)]
+        return list(self._readarray(fh, dylib_table_of_contents, off, n))
 
     def readmodtab(self, fh, off, n):
-        fh.seek(self.macho_header.offset + off)
-        return [dylib_module.from_fileobj(fh) for i in range(n)]
+        return list(self._readarray(fh, dylib_module, off, n))
 
     def readsym(self, fh, off, n):
-        fh.seek(self.macho_header.offset + off)
         refs = []
-        for _i in range(n):
-            ref = dylib_reference.from_fileobj(fh)
-            isym, flags = divmod(ref.isym_flags, 256)
+        for (isym_flags,) in self._readarray(fh, dylib_reference, off, n).records():
+            isym, flags = divmod(isym_flags, 256)
             refs.append((self.nlists[isym], flags))
         return refs
 
     def readrel(self, fh, off, n):
-        fh.seek(self.macho_header.offset + off)
-        return [relocation_info.from_fileobj(fh) for i in range(n)]
+        return list(self._readarray(fh, relocation_info, off, n))
@@ -7,3 +7,5 @@ And also Apple's documentation.
 """
 
 __version__ = "1.16.4"
+
+from macholib.batch import scan  # noqa: E402,F401
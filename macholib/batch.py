@@ -0,0 +1,144 @@
+"""
+Parsing many Mach-O files concurrently
+"""
+
+import os
+import struct
+from collections import namedtuple
+
+from macholib.MachO import MachO
+
+__all__ = ["HeaderSummary", "MachOSummary", "scan", "summarize"]
+
+
+class HeaderSummary(
+    namedtuple(
+        "HeaderSummary",
+        [
+            "offset",
+            "size",
+            "magic",
+            "endian",
+            "cputype",
+            "cpusubtype",
+            "filetype",
+            "load_commands",
+            "dependencies",
+        ],
+    )
+):
+    """
+    Summary of one header in a Mach-O file.
+
+    load_commands is a tuple of (cmd, cmdsize) tuples, dependencies
+    is a tuple of (command_name, filename) tuples as returned by
+    MachOHeader.walkRelocatables.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_header(cls, header):
+        return cls(
+            header.offset,
+            header.size,
+            header.MH_MAGIC,
+            header.endian,
+            int(header.header.cputype),
+            int(header.header.cpusubtype),
+            header.filetype,
+            tuple(
+                (int(lc.cmd), int(lc.cmdsize)) for lc, _cmd, _data in header.commands
+            ),
+            tuple(
+                (name, filename) for _idx, name, filename in header.walkRelocatables()
+            ),
+        )
+
+
+class MachOSummary(namedtuple("MachOSummary", ["filename", "headers", "error"])):
+    """
+    Picklable summary of a Mach-O file.
+
+    headers is a tuple of HeaderSummary values, error is None when
+    the file could be parsed and a description of the problem
+    otherwise.
+    """
+
+    __slots__ = ()
+
+    @property
+    def dependencies(self):
+        """
+        The names of the libraries this file depends on, for all
+        headers and in load command order.
+        """
+        seen = set()
+        result = []
+        for header in self.headers:
+            for _name, filename in header.dependencies:
+                if filename not in seen:
+                    seen.add(filename)
+                    result.append(filename)
+        return result
+
+
+def summarize(filename):
+    """
+    Parse a Mach-O file and return a MachOSummary for it. Errors while
+    reading or parsing the file are recorded in the summary.
+    """
+    try:
+        m = MachO(filename)
+        # Names in load commands are decoded while summarizing, which
+        # raises UnicodeDecodeError for names that aren't valid in the
+        # filesystem encoding.
+        headers = tuple(HeaderSummary.from_header(hdr) for hdr in m.headers)
+    except (IOError, OSError, ValueError, UnicodeDecodeError, struct.error) as exc:
+        return MachOSummary(filename, (), "%s: %s" % (type(exc).__name__, exc))
+    return MachOSummary(filename, headers, None)
+
+
+def _make_executor(executor, workers, initializer=None, initargs=()):
+    import concurrent.futures
+
+    if executor == "thread":
+        return concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, initializer=initializer, initargs=initargs
+        )
+    elif executor == "process":
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=initializer, initargs=initargs
+        )
+    raise ValueError("Unknown executor type: %r" % (executor,))
+
+
+def scan(paths, workers=None, executor="thread"):
+    """
+    Parse the Mach-O files in *paths* concurrently and return a list
+    of MachOSummary values in the same order as *paths*.
+
+    *workers* is the maximum number of concurrent workers and defaults
+    to the number of CPUs. *executor* is either "thread", "process"
+    or a concurrent.futures.Executor instance.
+    """
+    paths = list(paths)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1 and isinstance(executor, str):
+        return [summarize(path) for path in paths]
+
+    if isinstance(executor, str):
+        pool = _make_executor(executor, workers)
+        owned = True
+    else:
+        pool = executor
+        owned = False
+
+    try:
+        chunksize = max(1, len(paths) // (workers * 4))
+        return list(pool.map(summarize, paths, chunksize=chunksize))
+    finally:
+        if owned:
+            pool.shutdown()
@@ -0,0 +1,182 @@
+"""
+Persistent cache of parsed Mach-O headers
+"""
+
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+
+from macholib import __version__
+
+__all__ = ["ParseCache"]
+
+_SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT NOT NULL,
+    options TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    digest TEXT,
+    data BLOB NOT NULL,
+    PRIMARY KEY (path, options)
+)
+"""
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        while True:
+            data = fp.read(1024 * 1024)
+            if not data:
+                break
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def _stat_key(st):
+    mtime = getattr(st, "st_mtime_ns", None)
+    if mtime is None:
+        mtime = int(st.st_mtime * 1e9)
+    return st.st_size, mtime, st.st_ino
+
+
+class ParseCache(object):
+    """
+    A persistent cache of parsed Mach-O headers, stored in an SQLite
+    database in *directory*.
+
+    Entries are keyed by the absolute path of a file and are only used when the
+    size, modification time and inode of the file are unchanged. When
+    *verify_content* is True the SHA-256 digest of the file contents
+    is checked as well, which means every lookup reads the whole file.
+
+    Instances can be shared between threads, and can be pickled to
+    use the same cache in another process.
+
+    The entries are pickled MachO objects, which are only valid for the
+    macholib release that created them. Every release therefore uses a
+    separate database file. Entries are loaded with pickle, the cache
+    directory must not be writable by untrusted users.
+    """
+
+    filename = "macholib-%s-cache-v%d.sqlite3" % (__version__, _SCHEMA_VERSION)
+
+    def __init__(self, directory, verify_content=False):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.verify_content = verify_content
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            os.path.join(directory, self.filename), check_same_thread=False
+        )
+        with self._db:
+            self._db.execute(_SCHEMA)
+
+    def __repr__(self):
+        return "<%s directory=%r>" % (type(self).__name__, self.directory)
+
+    def __reduce__(self):
+        return (type(self), (self.directory, self.verify_content))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _check_open(self):
+        # Must be called with the lock held
+        if self._db is None:
+            raise ValueError("Operation on a closed cache")
+
+    def lookup(self, path, options=""):
+        """
+        Return the value stored for *path* and *options*, or None when
+        there is no entry or the file changed since it was stored.
+        """
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            self._check_open()
+            row = self._db.execute(
+                "SELECT size, mtime, inode, digest, data FROM entries"
+                " WHERE path = ? AND options = ?",
+                (path, options),
+            ).fetchone()
+        if row is None or tuple(row[:3]) != _stat_key(st):
+            return None
+        if self.verify_content and row[3] != _file_digest(path):
+            return None
+        try:
+            return pickle.loads(row[4])
+        except Exception:
+            # Entries that cannot be loaded (for example after upgrading
+            # macholib) are treated as missing.
+            return None
+
+    def store(self, path, value, options="", stat_result=None):
+        """
+        Store *value* for *path* and *options*. The value must be
+        picklable, values that are not are silently ignored.
+
+        *stat_result* is the result of os.stat for *path* from before
+        the value was calculated, and is fetched when not specified.
+        """
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path) if stat_result is None else stat_result
+        except OSError:
+            return
+        try:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            # Pickling can fail with a variety of exceptions, including
+            # AttributeError for local objects.
+            return
+        digest = _file_digest(path) if self.verify_content else None
+        with self._lock:
+            self._check_open()
+            try:
+                with self._db:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO entries"
+                        " (path, options, size, mtime, inode, digest, data)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (path, options)
+                        + _stat_key(st)
+                        + (digest, sqlite3.Binary(data)),
+                    )
+            except sqlite3.OperationalError:
+                # The database is locked by another process for too long,
+                # the cache is best effort.
+                pass
+
+    def invalidate(self, path=None):
+        """
+        Remove the entries for *path*, or all entries when *path* is None.
+        """
+        with self._lock:
+            self._check_open()
+            with self._db:
+                if path is None:
+                    self._db.execute("DELETE FROM entries")
+                else:
+                    self._db.execute(
+                        "DELETE FROM entries WHERE path = ?", (os.path.abspath(path),)
+                    )
@@ -0,0 +1,405 @@
+"""
+Compact representation of a Mach-O dependency graph
+"""
+
+from array import array
+from collections import namedtuple
+
+__all__ = ["CompactGraph", "CompactNode", "EDGE_KINDS"]
+
+# Edge kinds with a fixed code, other kinds are assigned a code
+# when they are first used.
+EDGE_KINDS = (
+    "run_file",
+    "load_dylib",
+    "load_weak_dylib",
+    "load_upward_dylib",
+    "reexport_dylib",
+    "prebound_dylib",
+)
+
+# Node kinds with a fixed code
+NODE_KINDS = ("MachO", "MissingMachO", "ExcludedMachO")
+
+
+class CompactNode(namedtuple("CompactNode", ["graphident", "filename", "kind"])):
+    """
+    Summary of a node in a CompactGraph. filename is None for nodes
+    that don't refer to an existing file, kind is the name of the
+    node class in the graph the node was copied from.
+    """
+
+    __slots__ = ()
+
+
+class CompactGraph(object):
+    """
+    A memory efficient dependency graph.
+
+    Node names are interned as integer identifiers, and the edges of
+    a node are stored as arrays of integer identifiers and edge kind
+    codes. Nodes only have a kind and don't keep parsed headers.
+
+    Transitive queries use the strongly connected components of the
+    graph, and memoize the set of reachable nodes for every component
+    as a bitset. The memoized data is dropped when the graph changes.
+
+    The roots of the graph are the nodes that were added using a
+    "run_file" edge from the root of a MachOGraph.
+    """
+
+    def __init__(self):
+        self._names = []
+        self._ids = {}
+        self._has_file = array("B")
+        self._is_root = array("B")
+        self._node_kinds = array("B")
+        self._out_tails = []
+        self._out_kinds = []
+        self._in_heads = None
+        self._components = None
+        self.roots = array("l")
+        self.node_kinds = list(NODE_KINDS)
+        self.edge_kinds = list(EDGE_KINDS)
+        self._edge_codes = dict((kind, code) for code, kind in enumerate(EDGE_KINDS))
+
+    @classmethod
+    def from_graph(cls, graph):
+        """
+        Create a CompactGraph with the nodes and edges of *graph*,
+        an altgraph ObjectGraph such as a MachOGraph.
+        """
+        self = cls()
+        raw = graph.graph
+        root = graph.graphident
+
+        # Nodes are added in DFS order to get identifiers with
+        # some locality.
+        for ident in raw.iterdfs(root):
+            if ident is root:
+                continue
+            node = raw.node_data(ident)
+            if isinstance(node, CompactNode):
+                kind = node.kind
+            else:
+                kind = type(node).__name__
+            self.add_node(
+                ident, kind, has_file=getattr(node, "filename", None) is not None
+            )
+
+        for edge in sorted(raw.edge_list()):
+            _, edge_data, head, tail = raw.describe_edge(edge)
+            if tail not in self._ids:
+                continue
+            if head is root:
+                self.add_root(tail)
+            elif head in self._ids:
+                self.add_edge(head, tail, edge_data)
+        return self
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._ids
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def _kind_code(self, kinds, kind):
+        try:
+            return kinds.index(kind)
+        except ValueError:
+            kinds.append(kind)
+            return len(kinds) - 1
+
+    def node_id(self, name):
+        """
+        Return the integer identifier for *name*, raises KeyError
+        for unknown names.
+        """
+        return self._ids[name]
+
+    def node_name(self, node_id):
+        """
+        Return the name for integer identifier *node_id*
+        """
+        return self._names[node_id]
+
+    def add_node(self, name, kind="MachO", has_file=True):
+        """
+        Add a node and return its integer identifier. Nothing is
+        changed when the node already exists.
+        """
+        try:
+            return self._ids[name]
+        except KeyError:
+            pass
+        node_id = len(self._names)
+        self._names.append(name)
+        self._ids[name] = node_id
+        self._has_file.append(1 if has_file else 0)
+        self._is_root.append(0)
+        self._node_kinds.append(self._kind_code(self.node_kinds, kind))
+        self._out_tails.append(array("l"))
+        self._out_kinds.append(array("B"))
+        self._in_heads = None
+        self._components = None
+        return node_id
+
+    def add_root(self, name):
+        """
+        Mark node *name* as a root of the graph.
+        """
+        node_id = self._ids[name]
+        if not self._is_root[node_id]:
+            self._is_root[node_id] = 1
+            self.roots.append(node_id)
+
+    def add_edge(self, head, tail, kind):
+        """
+        Add an edge of kind *kind* from node *head* to node *tail*,
+        both nodes must exist.
+        """
+        head_id = self._ids[head]
+        tail_id = self._ids[tail]
+        code = self._edge_codes.get(kind)
+        if code is None:
+            code = self._edge_codes[kind] = self._kind_code(self.edge_kinds, kind)
+        self._out_tails[head_id].append(tail_id)
+        self._out_kinds[head_id].append(code)
+        self._in_heads = None
+        self._components = None
+
+    def node(self, name):
+        """
+        Return a CompactNode for *name*
+        """
+        node_id = self._ids[name]
+        return CompactNode(
+            name,
+            name if self._has_file[node_id] else None,
+            self.node_kinds[self._node_kinds[node_id]],
+        )
+
+    def out_edges(self, name):
+        """
+        Return a list of (tail, kind) tuples for the edges starting
+        at *name*, in the order they were added.
+        """
+        node_id = self._ids[name]
+        names = self._names
+        kinds = self.edge_kinds
+        return [
+            (names[tail], kinds[code])
+            for tail, code in zip(self._out_tails[node_id], self._out_kinds[node_id])
+        ]
+
+    def dependencies(self, name):
+        """
+        Return the names of the nodes that *name* refers to,
+        without duplicates.
+        """
+        names = self._names
+        result = []
+        seen = set()
+        for tail in self._out_tails[self._ids[name]]:
+            if tail not in seen:
+                seen.add(tail)
+                result.append(names[tail])
+        return result
+
+    def _incoming(self):
+        if self._in_heads is None:
+            in_heads = [array("l") for _ in self._names]
+            for head, tails in enumerate(self._out_tails):
+                for tail in tails:
+                    if not in_heads[tail] or in_heads[tail][-1] != head:
+                        in_heads[tail].append(head)
+            self._in_heads = in_heads
+        return self._in_heads
+
+    def dependents(self, name):
+        """
+        Return the names of the nodes that refer to *name*,
+        without duplicates and in no particular order.
+        """
+        names = self._names
+        return [names[head] for head in self._incoming()[self._ids[name]]]
+
+    def _iterdfs_ids(self, start, condition=None):
+        # Same visiting order as altgraph.Graph.iterdfs, the children of
+        # nodes for which condition returns false are not visited.
+        if start is None:
+            start_ids = self.roots
+        else:
+            start_ids = [self._ids[start]]
+        out_tails = self._out_tails
+        visited = set(start_ids)
+        stack = list(start_ids)
+        while stack:
+            node_id = stack.pop()
+            if condition is not None and not condition(node_id):
+                continue
+            yield node_id
+            for tail in out_tails[node_id]:
+                if tail not in visited:
+                    visited.add(tail)
+                    stack.append(tail)
+
+    def iterdfs(self, start=None):
+        """
+        Yield the names of the nodes reachable from *start* in depth
+        first order, or of the nodes reachable from the roots when
+        *start* is None.
+        """
+        names = self._names
+        for node_id in self._iterdfs_ids(start):
+            yield names[node_id]
+
+    def flatten(self, condition=None, start=None):
+        """
+        Yield a CompactNode for every node that is reachable from
+        *start* (or the roots) through nodes for which *condition*
+        returns true, like ObjectGraph.flatten.
+        """
+        names = self._names
+        nodes = {}
+
+        def check(node_id):
+            node = nodes[node_id] = self.node(names[node_id])
+            return condition is None or condition(node)
+
+        for node_id in self._iterdfs_ids(start, check):
+            yield nodes.pop(node_id)
+
+    def _condense(self):
+        # Calculate the strongly connected components of the graph using
+        # an iterative version of Tarjan's algorithm, and the edges
+        # between components. Components are numbered in reverse
+        # topological order.
+        if self._components is not None:
+            return self._components
+
+        count = len(self._names)
+        out_tails = self._out_tails
+        index = [-1] * count
+        low = [0] * count
+        on_stack = [False] * count
+        stack = []
+        component = [-1] * count
+        members = []
+        counter = 0
+
+        for start in range(count):
+            if index[start] != -1:
+                continue
+            index[start] = low[start] = counter
+            counter += 1
+            stack.append(start)
+            on_stack[start] = True
+            work = [(start, 0)]
+
+            while work:
+                node_id, i = work.pop()
+                tails = out_tails[node_id]
+                while i < len(tails):
+                    tail = tails[i]
+                    i += 1
+                    if index[tail] == -1:
+                        index[tail] = low[tail] = counter
+                        counter += 1
+                        stack.append(tail)
+                        on_stack[tail] = True
+                        work.append((node_id, i))
+                        work.append((tail, 0))
+                        break
+                    elif on_stack[tail]:
+                        low[node_id] = min(low[node_id], index[tail])
+                else:
+                    if low[node_id] == index[node_id]:
+                        current = len(members)
+                        group = array("l")
+                        while True:
+                            other = stack.pop()
+                            on_stack[other] = False
+                            component[other] = current
+                            group.append(other)
+                            if other == node_id:
+                                break
+                        members.append(group)
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[node_id])
+
+        successors = [set() for _ in members]
+        predecessors = [set() for _ in members]
+        for head, tails in enumerate(out_tails):
+            head_component = component[head]
+            for tail in tails:
+                tail_component = component[tail]
+                if tail_component != head_component:
+                    successors[head_component].add(tail_component)
+                    predecessors[tail_component].add(head_component)
+
+        bits = []
+        for group in members:
+            value = 0
+            for node_id in group:
+                value |= 1 << node_id
+            bits.append(value)
+
+        self._components = (component, bits, successors, predecessors, {}, {})
+        return self._components
+
+    def _closure(self, start, edges, memo, bits):
+        # Return the bitset of nodes in the components reachable from
+        # component *start*, including *start* itself. The results for
+        # all components that are visited are memoized.
+        if start in memo:
+            return memo[start]
+
+        work = [(start, iter(edges[start]))]
+        while work:
+            current, it = work[-1]
+            for other in it:
+                if other not in memo:
+                    work.append((other, iter(edges[other])))
+                    break
+            else:
+                work.pop()
+                value = bits[current]
+                for other in edges[current]:
+                    value |= memo[other]
+                memo[current] = value
+        return memo[start]
+
+    def _names_for_bits(self, value):
+        names = self._names
+        digits = bin(value)[:1:-1]
+        result = set()
+        i = digits.find("1")
+        while i != -1:
+            result.add(names[i])
+            i = digits.find("1", i + 1)
+        return result
+
+    def transitive_dependencies(self, name):
+        """
+        Return the set of names of all nodes that are reachable from
+        *name*, not including *name* itself.
+        """
+        node_id = self._ids[name]
+        component, bits, successors, _, forward, _ = self._condense()
+        value = self._closure(component[node_id], successors, forward, bits)
+        return self._names_for_bits(value & ~(1 << node_id))
+
+    def transitive_dependents(self, name):
+        """
+        Return the set of names of all nodes from which *name* can
+        be reached, not including *name* itself.
+        """
+        node_id = self._ids[name]
+        component, bits, _, predecessors, _, backward = self._condense()
+        value = self._closure(component[node_id], predecessors, backward, bits)
+        return self._names_for_bits(value & ~(1 << node_id))
@@ -6,12 +6,23 @@ import ctypes
 import os
 import platform
 import sys
+import threading
+from collections import OrderedDict
 from itertools import chain
 
 from macholib.dylib import dylib_info
 from macholib.framework import framework_info
 
-__all__ = ["dyld_find", "framework_find", "framework_info", "dylib_info"]
+__all__ = [
+    "dyld_find",
+    "framework_find",
+    "framework_info",
+    "dylib_info",
+    "DyldLookupCache",
+    "StatCache",
+    "DirectoryIndex",
+    "DyldResolver",
+]
 
 if sys.platform == "darwin" and [
     int(x) for x in platform.mac_ver()[0].split(".")[:2]
@@ -182,10 +193,16 @@ def dyld_default_search(name, env=None):
             yield os.path.join(path, os.path.basename(name))
 
 
-def dyld_find(name, executable_path=None, env=None, loader_path=None):
-    """
-    Find a library or framework using dyld semantics
-    """
+def _dyld_isfile(path):
+    if (
+        _dyld_shared_cache_contains_path is not None
+        and _dyld_shared_cache_contains_path(path)
+    ):
+        return True
+    return os.path.isfile(path)
+
+
+def _dyld_find(name, executable_path, env, loader_path, isfile):
     name = _ensure_utf8(name)
     executable_path = _ensure_utf8(executable_path)
     for path in dyld_image_suffix_search(
@@ -197,14 +214,342 @@ def dyld_find(name, executable_path=None, env=None, loader_path=None):
         ),
         env,
     ):
+        if isfile(path):
+            return path
+    raise ValueError("dylib %s could not be found" % (name,))
+
+
+def dyld_find(name, executable_path=None, env=None, loader_path=None):
+    """
+    Find a library or framework using dyld semantics
+    """
+    return _dyld_find(name, executable_path, env, loader_path, _dyld_isfile)
+
+
+class StatCache(object):
+    """
+    Memoized file existence checks for dyld lookups.
+
+    The result of checking a path is remembered until it is
+    invalidated, instances can be shared between a number of
+    DyldLookupCache instances.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._isfile = {}
+
+    def isfile(self, path):
+        try:
+            return self._isfile[path]
+        except KeyError:
+            pass
+        result = _dyld_isfile(path)
+        with self._lock:
+            self._isfile[path] = result
+        return result
+
+    def invalidate(self, path=None):
+        """
+        Forget the information about *path*, or about all paths when
+        *path* is None.
+        """
+        with self._lock:
+            if path is None:
+                self._isfile.clear()
+            else:
+                self._isfile.pop(path, None)
+
+
+def _list_directory(directory):
+    # Returns a mapping from name to a DirEntry for the contents
+    # of *directory*, the mapping is empty for directories that
+    # cannot be read. The values are None on Python versions without
+    # os.scandir.
+    try:
+        if hasattr(os, "scandir"):
+            it = os.scandir(directory)
+            try:
+                return dict((entry.name, entry) for entry in it)
+            finally:
+                if hasattr(it, "close"):
+                    it.close()
+        else:
+            return dict.fromkeys(os.listdir(directory))
+    except (IOError, OSError):
+        return {}
+
+
+class DirectoryIndex(object):
+    """
+    File existence checks for dyld lookups that are answered using
+    directory listings.
+
+    Every directory is listed once, after which checks for files in
+    that directory don't need system calls for names that are not
+    present. The listings are kept until they are refreshed.
+
+    Instances can be used instead of a StatCache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listings = {}
+
+    def _listing(self, directory):
+        try:
+            return self._listings[directory]
+        except KeyError:
+            pass
+        listing = _list_directory(directory)
+        with self._lock:
+            self._listings[directory] = listing
+        return listing
+
+    def isfile(self, path):
         if (
             _dyld_shared_cache_contains_path is not None
             and _dyld_shared_cache_contains_path(path)
         ):
-            return path
-        if os.path.isfile(path):
-            return path
-    raise ValueError("dylib %s could not be found" % (name,))
+            return True
+        directory, name = os.path.split(path)
+        listing = self._listing(directory or os.curdir)
+        if name not in listing:
+            return False
+        entry = listing[name]
+        if entry is None:
+            return os.path.isfile(path)
+        try:
+            return entry.is_file()
+        except OSError:
+            return False
+
+    def refresh(self, directory=None):
+        """
+        Forget the listing of *directory*, or of all directories when
+        *directory* is None. Listings are read again when needed.
+        """
+        with self._lock:
+            if directory is None:
+                self._listings.clear()
+            else:
+                self._listings.pop(directory.rstrip(os.sep) or os.sep, None)
+
+    def invalidate(self, path=None):
+        """
+        Forget the information about *path*, or about all paths when
+        *path* is None.
+        """
+        if path is None:
+            self.refresh()
+        else:
+            self.refresh(os.path.dirname(path) or os.curdir)
+
+
+_NOT_FOUND = object()
+
+
+class DyldLookupCache(object):
+    """
+    A bounded cache of dyld_find results, including failed lookups.
+
+    Results are keyed by the name, the DYLD_* variables in the
+    environment, and the executable and loader path when those are
+    used by the name. The least recently used result is dropped when
+    there are more than *maxsize* results.
+
+    File existence checks are performed using *stat_cache*, which
+    defaults to a new StatCache. Use a DirectoryIndex to answer those
+    checks from directory listings instead.
+    """
+
+    def __init__(self, maxsize=4096, stat_cache=None):
+        if stat_cache is None:
+            stat_cache = StatCache()
+        self.maxsize = maxsize
+        self.stat_cache = stat_cache
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+
+    def _key(self, name, executable_path, env, loader_path):
+        if env is None:
+            env = os.environ
+        env_key = tuple(sorted((k, v) for k, v in env.items() if k.startswith("DYLD_")))
+        if not name.startswith("@executable_path/"):
+            executable_path = None
+        if not name.startswith("@loader_path/"):
+            loader_path = None
+        return (name, env_key, executable_path, loader_path)
+
+    def find(self, name, executable_path=None, env=None, loader_path=None):
+        """
+        Like dyld_find, but using the cache.
+        """
+        name = _ensure_utf8(name)
+        key = self._key(name, executable_path, env, loader_path)
+        with self._lock:
+            result = self._results.pop(key, None)
+            if result is not None:
+                self._results[key] = result
+                self.hits += 1
+        if result is None:
+            try:
+                result = _dyld_find(
+                    name, executable_path, env, loader_path, self.stat_cache.isfile
+                )
+            except ValueError:
+                result = _NOT_FOUND
+            with self._lock:
+                self.misses += 1
+                self._results[key] = result
+                while len(self._results) > self.maxsize:
+                    self._results.popitem(last=False)
+
+        if result is _NOT_FOUND:
+            raise ValueError("dylib %s could not be found" % (name,))
+        return result
+
+    def __len__(self):
+        return len(self._results)
+
+    def invalidate(self, name=None):
+        """
+        Forget the results for *name*, or all results when *name* is None.
+        The stat cache is cleared as well when *name* is None.
+        """
+        with self._lock:
+            if name is None:
+                self._results.clear()
+            else:
+                for key in [key for key in self._results if key[0] == name]:
+                    del self._results[key]
+        if name is None:
+            self.stat_cache.invalidate()
+
+
+class DyldResolver(object):
+    """
+    Find libraries and frameworks using dyld semantics for a fixed
+    environment and executable path.
+
+    The search path is calculated once from *env* (which defaults to
+    os.environ at the time the resolver is created), which makes
+    repeated lookups cheaper than calling dyld_find.
+
+    File existence checks are performed using *stat_cache* when
+    that is not None, for example a StatCache or DirectoryIndex.
+    """
+
+    def __init__(self, env=None, executable_path=None, stat_cache=None):
+        if env is None:
+            env = os.environ
+        self.executable_path = _ensure_utf8(executable_path)
+        self.image_suffix = dyld_image_suffix(env)
+        self.framework_path = tuple(dyld_framework_path(env))
+        self.library_path = tuple(dyld_library_path(env))
+        self.fallback_framework_path = tuple(
+            dyld_fallback_framework_path(env) or _DEFAULT_FRAMEWORK_FALLBACK
+        )
+        self.fallback_library_path = tuple(
+            dyld_fallback_library_path(env) or _DEFAULT_LIBRARY_FALLBACK
+        )
+        self.stat_cache = stat_cache
+        if stat_cache is None:
+            self._isfile = _dyld_isfile
+        else:
+            self._isfile = stat_cache.isfile
+
+    def candidates(self, name, loader_path=None):
+        """
+        Return the list of paths that are tried for *name*, in the
+        same order as dyld_find.
+        """
+        name = _ensure_utf8(name)
+        join = os.path.join
+        framework = framework_info(name)
+        basename = os.path.basename(name)
+
+        paths = []
+        if framework is not None:
+            paths.extend(join(path, framework["name"]) for path in self.framework_path)
+        paths.extend(join(path, basename) for path in self.library_path)
+
+        if self.executable_path is not None and name.startswith("@executable_path/"):
+            paths.append(
+                join(
+                    self.executable_path, name[len("@executable_path/") :]  # noqa: E203
+                )
+            )
+        if loader_path is not None and name.startswith("@loader_path/"):
+            paths.append(join(loader_path, name[len("@loader_path/") :]))  # noqa: E203
+
+        paths.append(name)
+        if framework is not None:
+            paths.extend(
+                join(path, framework["name"]) for path in self.fallback_framework_path
+            )
+        paths.extend(join(path, basename) for path in self.fallback_library_path)
+
+        suffix = self.image_suffix
+        if suffix is not None:
+            result = []
+            for path in paths:
+                if path.endswith(".dylib"):
+                    result.append(path[: -len(".dylib")] + suffix + ".dylib")
+                else:
+                    result.append(path + suffix)
+                result.append(path)
+            paths = result
+
+        return paths
+
+    def isfile(self, path):
+        """
+        Return True if *path* is an existing file.
+        """
+        return self._isfile(path)
+
+    def find(self, name, loader_path=None):
+        """
+        Find a library or framework, raises ValueError when it
+        cannot be found.
+        """
+        isfile = self._isfile
+        for path in self.candidates(name, loader_path):
+            if isfile(path):
+                return path
+        raise ValueError("dylib %s could not be found" % (name,))
+
+    def find_many(self, names, loader_path=None):
+        """
+        Find a number of libraries or frameworks, returns a list
+        with the location of every item in *names*, with None for
+        names that cannot be found.
+        """
+        result = []
+        for name in names:
+            try:
+                result.append(self.find(name, loader_path))
+            except ValueError:
+                result.append(None)
+        return result
+
+    def framework_find(self, fn):
+        """
+        Like framework_find, but using the search path of
+        this resolver.
+        """
+        try:
+            return self.find(fn)
+        except ValueError:
+            pass
+        fmwk_index = fn.rfind(".framework")
+        if fmwk_index == -1:
+            fmwk_index = len(fn)
+            fn += ".framework"
+        fn = os.path.join(fn, os.path.basename(fn[:fmwk_index]))
+        return self.find(fn)
 
 
 def framework_find(fn, executable_path=None, env=None):
@@ -2,19 +2,37 @@
 Utilities for creating dot output from a MachOGraph
 """
 
-from collections import deque
+import json
 
 try:
     from itertools import imap
 except ImportError:
     imap = map
 
-__all__ = ["itergraphreport"]
+__all__ = ["itergraphreport", "iterjsonreport", "DEFAULT_EDGE_KINDS"]
 
+# The kinds of edges that are included in reports by default
+DEFAULT_EDGE_KINDS = ("run_file", "load_dylib")
 
-def itergraphreport(nodes, describe_edge, name="G"):
-    edges = deque()
-    nodetoident = {}
+
+def _iteredges(outgoing, describe_edge, edge_kinds):
+    for edge, data, head, tail in imap(describe_edge, outgoing):
+        if edge_kinds is None or data in edge_kinds:
+            yield edge, data, head, tail
+
+
+def itergraphreport(nodes, describe_edge, name="G", edge_kinds=DEFAULT_EDGE_KINDS):
+    """
+    Yield the lines of a graphviz description of a graph.
+
+    *nodes* is an iterable of (node, data, outgoing, incoming) tuples,
+    and *describe_edge* returns an (edge, data, head, tail) tuple for
+    an outgoing edge. Only edges whose data is in *edge_kinds* are
+    included, or all edges when *edge_kinds* is None.
+
+    The description of a node is followed by the description of its
+    edges, *nodes* is only iterated once and edges are not buffered.
+    """
 
     def nodevisitor(node, data, outgoing, incoming):
         return {"label": str(node)}
@@ -28,16 +46,8 @@ def itergraphreport(nodes, describe_edge, name="G"):
     for item in attr.items():
         yield "\t%s;\n" % (cpatt % item,)
 
-    # find all packages (subgraphs)
-    for node, data, _outgoing, _incoming in nodes:
-        nodetoident[node] = getattr(data, "identifier", node)
-
-    # create sets for subgraph, write out descriptions
+    edgestr = '\t"%s" -> "%s" [%s];\n'
     for node, data, outgoing, incoming in nodes:
-        # update edges
-        for edge in imap(describe_edge, outgoing):
-            edges.append(edge)
-
         # describe node
         yield '\t"%s" [%s];\n' % (
             node,
@@ -49,17 +59,8 @@ def itergraphreport(nodes, describe_edge, name="G"):
             ),
         )
 
-    graph = []
-
-    while edges:
-        edge, data, head, tail = edges.popleft()
-        if data in ("run_file", "load_dylib"):
-            graph.append((edge, data, head, tail))
-
-    def do_graph(edges, tabs):
-        edgestr = tabs + '"%s" -> "%s" [%s];\n'
-        # describe edge
-        for edge, data, head, tail in edges:
+        # describe edges
+        for edge, data, head, tail in _iteredges(outgoing, describe_edge, edge_kinds):
             attribs = edgevisitor(edge, data, head, tail)
             yield edgestr % (
                 head,
@@ -67,7 +68,19 @@ def itergraphreport(nodes, describe_edge, name="G"):
                 ",".join([(cpatt % item) for item in attribs.items()]),
             )
 
-    for s in do_graph(graph, "\t"):
-        yield s
-
     yield "}\n"
+
+
+def iterjsonreport(nodes, describe_edge, edge_kinds=DEFAULT_EDGE_KINDS):
+    """
+    Like itergraphreport, but yields JSON lines: an object with a
+    "node" key for every node, followed by an object with "head",
+    "tail" and "kind" keys for each of its edges.
+    """
+    for node, _data, outgoing, _incoming in nodes:
+        yield json.dumps({"node": str(node)}) + "\n"
+
+        for _edge, data, head, tail in _iteredges(outgoing, describe_edge, edge_kinds):
+            yield json.dumps(
+                {"head": str(head), "tail": str(tail), "kind": data}
+            ) + "\n"
@@ -635,6 +635,28 @@ SG_NORELOC = 0x4
 SG_PROTECTED_VERSION_1 = 0x8
 
 
+def _get_section_data(self):
+    # Section data is either set explicitly using add_section_data, or
+    # read on first access using a loader installed with
+    # add_section_data_loader. The latter is used by MachOHeader to avoid
+    # reading section contents that are never looked at.
+    try:
+        return self._section_data
+    except AttributeError:
+        pass
+    loader = getattr(self, "_section_loader", None)
+    if loader is None:
+        raise AttributeError("section_data")
+    self._section_data = loader()
+    self._section_loader = None
+    return self._section_data
+
+
+def _set_section_data(self, data):
+    self._section_data = data
+    self._section_loader = None
+
+
 class section(Structure):
     _fields_ = (
         ("sectname", p_str16),
@@ -673,9 +695,14 @@ class section(Structure):
         s["reserved2"] = int(self.reserved2)
         return s
 
+    section_data = property(_get_section_data, _set_section_data)
+
     def add_section_data(self, data):
         self.section_data = data
 
+    def add_section_data_loader(self, loader):
+        self._section_loader = loader
+
 
 class section_64(Structure):
     _fields_ = (
@@ -717,9 +744,14 @@ class section_64(Structure):
         s["reserved3"] = int(self.reserved3)
         return s
 
+    section_data = property(_get_section_data, _set_section_data)
+
     def add_section_data(self, data):
         self.section_data = data
 
+    def add_section_data_loader(self, loader):
+        self._section_loader = loader
+
 
 SECTION_TYPE = 0xFF
 SECTION_ATTRIBUTES = 0xFFFFFF00
@@ -1447,6 +1479,8 @@ class n_un(p_int32):
 
 
 class nlist(Structure):
+    # Symbol tables can be large, use the memory efficient layout
+    _compact_ = True
     _fields_ = (
         ("n_un", n_un),
         ("n_type", p_uint8),
@@ -1457,6 +1491,8 @@ class nlist(Structure):
 
 
 class nlist_64(Structure):
+    # Symbol tables can be large, use the memory efficient layout
+    _compact_ = True
     _fields_ = [
         ("n_un", n_un),
         ("n_type", p_uint8),
@@ -6,6 +6,7 @@ converted to a binary format as used in MachO headers.
 import struct
 import sys
 from itertools import chain, starmap
+from operator import attrgetter, itemgetter
 
 try:
     from itertools import imap, izip
@@ -16,6 +17,7 @@ __all__ = """
 sizeof
 BasePackable
 Structure
+StructureArray
 pypackable
 p_char
 p_byte
@@ -60,21 +62,39 @@ class MetaPackable(type):
     initializer
     """
 
+    def __init__(cls, clsname, bases, dct):
+        super(MetaPackable, cls).__init__(clsname, bases, dct)
+        # Compiled struct.Struct objects for this class, by endianness
+        cls._structs_ = {}
+
+    def _get_struct(cls, endian):
+        """
+        Return the (cached) struct.Struct for packing values of this
+        class with the given endianness
+        """
+        try:
+            return cls._structs_[endian]
+        except KeyError:
+            st = cls._structs_[endian] = struct.Struct(endian + cls._format_)
+            return st
+
     def from_mmap(cls, mm, ptr, **kw):
-        return cls.from_str(mm[ptr : ptr + cls._size_], **kw)  # noqa: E203
+        endian = kw.get("_endian_", cls._endian_)
+        return cls.from_tuple(cls._get_struct(endian).unpack_from(mm, ptr), **kw)
 
     def from_fileobj(cls, f, **kw):
         return cls.from_str(f.read(cls._size_), **kw)
 
     def from_str(cls, s, **kw):
         endian = kw.get("_endian_", cls._endian_)
-        return cls.from_tuple(struct.unpack(endian + cls._format_, s), **kw)
+        return cls.from_tuple(cls._get_struct(endian).unpack(s), **kw)
 
     def from_tuple(cls, tpl, **kw):
         return cls(tpl[0], **kw)
 
 
 class BasePackable(object):
+    __slots__ = ()
     _endian_ = ">"
 
     def to_str(self):
@@ -95,7 +115,7 @@ def _make():
     def to_str(self):
         cls = type(self)
         endian = getattr(self, "_endian_", cls._endian_)
-        return struct.pack(endian + cls._format_, self)
+        return cls._get_struct(endian).pack(self)
 
     return MetaPackable("Packable", (BasePackable,), {"to_str": to_str})
 
@@ -112,20 +132,137 @@ def pypackable(name, pytype, format):
     size, items = _formatinfo(format)
 
     def __new__(cls, *args, **kwds):
-        if "_endian_" in kwds:
-            _endian_ = kwds.pop("_endian_")
-        else:
-            _endian_ = cls._endian_
+        _endian_ = kwds.pop("_endian_", None)
 
         result = pytype.__new__(cls, *args, **kwds)
-        result._endian_ = _endian_
+        # The class attribute is used when the byteorder is the
+        # default, this avoids creating an instance dictionary.
+        if _endian_ is not None and _endian_ != cls._endian_:
+            result._endian_ = _endian_
         return result
 
-    return type(Packable)(
-        name,
-        (pytype, Packable),
-        {"_format_": format, "_size_": size, "_items_": items, "__new__": __new__},
-    )
+    class_dict = {
+        "_format_": format,
+        "_size_": size,
+        "_items_": items,
+        "__new__": __new__,
+    }
+    # Like collections.namedtuple: make the class picklable when it
+    # is stored in a module global with the same name.
+    try:
+        class_dict["__module__"] = sys._getframe(1).f_globals.get(
+            "__name__", "__main__"
+        )
+    except (AttributeError, ValueError):
+        pass
+
+    return type(Packable)(name, (pytype, Packable), class_dict)
+
+
+class _compact_endian(object):
+    """
+    Descriptor for the _endian_ attribute of compact structures, the
+    value is stored in a slot and defaults to the byteorder of the class.
+    """
+
+    def __init__(self, default):
+        self.default = default
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self.default
+        try:
+            return obj._compact_endian_
+        except AttributeError:
+            return self.default
+
+    def __set__(self, obj, value):
+        obj._compact_endian_ = value
+
+
+def _compact_slot(name):
+    # The name of the slot for field *name* of a compact structure
+    return "_compact_%s_" % (name,)
+
+
+def compact_property(slot, typ):
+    """
+    Property for a field of a compact structure, *slot* is the
+    descriptor of the slot where the value is stored.
+
+    Basic values are stored as plain Python values, they are
+    converted to *typ* when the field is read. Values that are
+    assigned are converted to *typ* and must fit in its format.
+    """
+    _get_slot = slot.__get__
+    _set_slot = slot.__set__
+
+    if isinstance(typ, MetaStructure):
+
+        def _get(self):
+            return _get_slot(self)
+
+        def _set(self, obj):
+            if type(obj) is not typ:
+                obj = typ(obj)
+            _set_slot(self, obj)
+
+    else:
+        pack = struct.Struct(typ._endian_ + typ._format_).pack
+        base = typ.__mro__[1]
+
+        def _get(self):
+            return typ(_get_slot(self))
+
+        def _set(self, obj):
+            obj = typ(obj)
+            pack(obj)
+            _set_slot(self, base(obj))
+
+    return property(_get, _set, None, typ.__name__)
+
+
+def _compact_objects(self):
+    # The equivalent of the _objects_ dictionary of regular structures
+    result = {}
+    for name in self._names_:
+        try:
+            result[name] = getattr(self, name)
+        except AttributeError:
+            pass
+    return result
+
+
+# Mapping from struct format characters to NumPy type codes
+_NUMPY_TYPECODES = {
+    "c": "S",
+    "s": "S",
+    "b": "i1",
+    "B": "u1",
+    "h": "i2",
+    "H": "u2",
+    "i": "i4",
+    "I": "u4",
+    "l": "i4",
+    "L": "u4",
+    "q": "i8",
+    "Q": "u8",
+    "f": "f4",
+    "d": "f8",
+}
+
+
+def _numpy_format(format):
+    """
+    Convert the struct format of a basic packable to a NumPy type code
+    """
+    count, code = format[:-1], format[-1]
+    typecode = _NUMPY_TYPECODES[code]
+    if typecode == "S":
+        return typecode + (count or "1")
+    if count:
+        raise ValueError("Unsupported struct format %r" % (format,))
+    return typecode
 
 
 def _formatinfo(format):
@@ -143,13 +280,23 @@ class MetaStructure(MetaPackable):
     Since we can assume that all Structures have a fixed size,
     we can do a bunch of calculations up front and pack or
     unpack the whole thing in one struct call.
+
+    Classes that set "_compact_" to True store their fields in
+    __slots__ instead of a dictionary, the slot for a field is
+    named "_compact_<name>_" and the field itself is a property
+    that converts values to the field type like for regular
+    structures.
     """
 
     def __new__(cls, clsname, bases, dct):
         fields = dct["_fields_"]
+        compact = dct.get(
+            "_compact_", any(getattr(base, "_compact_", False) for base in bases)
+        )
         names = []
         types = []
         structmarks = []
+        nested = False
         format = ""
         items = 0
         size = 0
@@ -166,33 +313,178 @@ class MetaStructure(MetaPackable):
             return property(_get, _set, typ.__name__)
 
         for name, typ in fields:
-            dct[name] = struct_property(name, typ)
+            if not compact:
+                dct[name] = struct_property(name, typ)
             names.append(name)
             types.append(typ)
             format += typ._format_
             size += typ._size_
             if typ._items_ > 1:
                 structmarks.append((items, typ._items_, typ))
+            if isinstance(typ, MetaStructure):
+                nested = True
             items += typ._items_
 
         dct["_structmarks_"] = structmarks
+        dct["_nested_"] = nested
         dct["_names_"] = names
         dct["_types_"] = types
         dct["_size_"] = size
         dct["_items_"] = items
         dct["_format_"] = format
+
+        if compact:
+            inherited = set()
+            for base in bases:
+                for klass in base.__mro__:
+                    inherited.update(klass.__dict__.get("__slots__", ()))
+            slots = [
+                _compact_slot(nm) for nm in names if _compact_slot(nm) not in inherited
+            ]
+            if "_compact_endian_" not in inherited:
+                slots.append("_compact_endian_")
+                dct["_endian_"] = _compact_endian(
+                    dct.get("_endian_", bases[0]._endian_)
+                )
+            dct["__slots__"] = tuple(slots) + tuple(dct.get("__slots__", ()))
+            dct["_compact_"] = True
+            dct["_objects_"] = property(_compact_objects)
         return super(MetaStructure, cls).__new__(cls, clsname, bases, dct)
 
+    def __init__(cls, clsname, bases, dct):
+        super(MetaStructure, cls).__init__(clsname, bases, dct)
+        if cls._compact_:
+            for name, typ in zip(cls._names_, cls._types_):
+                setattr(
+                    cls, name, compact_property(getattr(cls, _compact_slot(name)), typ)
+                )
+        cls._make_codec()
+
+    def _make_codec(cls):
+        """
+        Create the specialised functions for converting between
+        the flat tuple used by the struct module and instances
+        of this class.
+        """
+        names = tuple(cls._names_)
+        types = tuple(cls._types_)
+        structmarks = tuple(cls._structmarks_)
+
+        if not structmarks:
+
+            def group_values(tpl, kw):
+                return tpl
+
+        else:
+
+            def group_values(tpl, kw):
+                values = []
+                current = 0
+                for begin, length, typ in structmarks:
+                    if begin > current:
+                        values.extend(tpl[current:begin])
+                    current = begin + length
+                    values.append(typ.from_tuple(tpl[begin:current], **kw))
+                values.extend(tpl[current:])
+                return values
+
+        if cls._compact_:
+            # Values that were unpacked by the struct module are stored
+            # as is, they have the right type and range.
+            slots = tuple(_compact_slot(name) for name in names)
+            setters = tuple(getattr(cls, slot).__set__ for slot in slots)
+
+            def from_values(tpl, kw):
+                self = cls.__new__(cls)
+                if kw:
+                    self._endian_ = kw["_endian_"]
+                for setter, value in izip(setters, group_values(tpl, kw)):
+                    setter(self, value)
+                return self
+
+            get_fields = attrgetter(*slots) if slots else None
+
+        else:
+
+            def from_values(tpl, kw):
+                # Equivalent to cls(*group_values(tpl, kw), **kw) for the
+                # default __init__, without the per field overhead of that.
+                self = cls.__new__(cls)
+                if kw:
+                    self._endian_ = kw["_endian_"]
+                self._objects_ = {
+                    name: value if type(value) is typ else typ(value)
+                    for name, typ, value in izip(names, types, group_values(tpl, kw))
+                }
+                return self
+
+            get_objects = itemgetter(*names) if names else None
+
+            def get_fields(self):
+                return get_objects(self._objects_)
+
+        if not names:
+
+            def get_values(self):
+                return ()
+
+        elif len(names) == 1:
+
+            def get_values(self):
+                return (get_fields(self),)
+
+        else:
+            get_values = get_fields
+
+        cls._group_values_ = staticmethod(group_values)
+        cls._from_values_ = staticmethod(from_values)
+        cls._get_values_ = staticmethod(get_values)
+
+    def array_from_buffer(cls, buf, count, endian=None):
+        """
+        Decode *count* contiguous records from the start of *buf*
+        in one pass, returns a StructureArray.
+        """
+        if endian is None:
+            endian = cls._endian_
+        st = cls._get_struct(endian)
+        size = count * cls._size_
+        buf = memoryview(buf)
+        if len(buf) < size:
+            raise ValueError(
+                "Buffer of %d bytes is too small for %d records of %d bytes"
+                % (len(buf), count, cls._size_)
+            )
+        buf = buf[:size]
+        if hasattr(st, "iter_unpack"):
+            records = list(st.iter_unpack(buf))
+        else:
+            records = [st.unpack_from(buf, ofs) for ofs in range(0, size, st.size)]
+        return StructureArray(cls, records, endian)
+
+    def numpy_dtype(cls, endian=None):
+        """
+        Return a NumPy structured dtype with the same layout as this
+        structure. Requires NumPy.
+        """
+        import numpy
+
+        if endian is None:
+            endian = cls._endian_
+        fields = []
+        for name, typ in zip(cls._names_, cls._types_):
+            if isinstance(typ, MetaStructure):
+                fields.append((name, typ.numpy_dtype(endian)))
+            else:
+                fields.append((name, endian + _numpy_format(typ._format_)))
+        return numpy.dtype(fields)
+
     def from_tuple(cls, tpl, **kw):
-        values = []
-        current = 0
-        for begin, length, typ in cls._structmarks_:
-            if begin > current:
-                values.extend(tpl[current:begin])
-            current = begin + length
-            values.append(typ.from_tuple(tpl[begin:current], **kw))
-        values.extend(tpl[current:])
-        return cls(*values, **kw)
+        if cls.__init__ is Structure.__init__ and (
+            not kw or (len(kw) == 1 and "_endian_" in kw)
+        ):
+            return cls._from_values_(tpl, kw)
+        return cls(*cls._group_values_(tpl, kw), **kw)
 
 
 # See metaclass discussion earlier in this file
@@ -203,24 +495,29 @@ def _make():
     def as_method(function):
         class_dict[function.__name__] = function
 
+    class_dict["__slots__"] = ()
+    class_dict["_compact_"] = False
+
     @as_method
     def __init__(self, *args, **kwargs):
         if len(args) == 1 and not kwargs and type(args[0]) is type(self):
             kwargs = args[0]._objects_
             args = ()
-        self._objects_ = {}
+        if not self._compact_:
+            self._objects_ = {}
         iargs = chain(izip(self._names_, args), kwargs.items())
         for key, value in iargs:
             if key not in self._names_ and key != "_endian_":
                 raise TypeError
             setattr(self, key, value)
+        objects = self._objects_
         for key, typ in izip(self._names_, self._types_):
-            if key not in self._objects_:
-                self._objects_[key] = typ()
+            if key not in objects:
+                setattr(self, key, typ())
 
     @as_method
     def _get_packables(self):
-        for obj in imap(self._objects_.__getitem__, self._names_):
+        for obj in type(self)._get_values_(self):
             if hasattr(obj, "_get_packables"):
                 for value in obj._get_packables():
                     yield value
@@ -230,7 +527,12 @@ def _make():
 
     @as_method
     def to_str(self):
-        return struct.pack(self._endian_ + self._format_, *self._get_packables())
+        cls = type(self)
+        if cls._nested_:
+            values = self._get_packables()
+        else:
+            values = cls._get_values_(self)
+        return cls._get_struct(self._endian_).pack(*values)
 
     @as_method
     def __cmp__(self, other):
@@ -306,6 +608,51 @@ def _make():
 Structure = _make()
 del _make
 
+
+class StructureArray(object):
+    """
+    A read-only sequence of structures decoded by array_from_buffer.
+
+    The records are stored as the tuples returned by the struct module,
+    instances of the structure type are created when an item is
+    accessed. Every access returns a new instance.
+    """
+
+    __slots__ = ("_type", "_records", "_endian")
+
+    def __init__(self, typ, records, endian):
+        self._type = typ
+        self._records = records
+        self._endian = endian
+
+    def __repr__(self):
+        return "<%s of %d %s>" % (
+            type(self).__name__,
+            len(self._records),
+            self._type.__name__,
+        )
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return StructureArray(self._type, self._records[index], self._endian)
+        return self._type.from_tuple(self._records[index], _endian_=self._endian)
+
+    def __iter__(self):
+        from_tuple = self._type.from_tuple
+        endian = self._endian
+        for record in self._records:
+            yield from_tuple(record, _endian_=endian)
+
+    def records(self):
+        """
+        Return the list of raw record tuples
+        """
+        return self._records
+
+
 try:
     long
 except NameError:
@@ -1,3 +1,4 @@
+import errno
 import os
 import shutil
 import stat
@@ -6,6 +7,11 @@ import sys
 
 from macholib import mach_o
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 MAGIC = [
     struct.pack("!L", getattr(mach_o, "MH_" + _))
     for _ in ["MAGIC", "CIGAM", "MAGIC_64", "CIGAM_64"]
@@ -14,6 +20,10 @@ FAT_MAGIC_BYTES = struct.pack("!L", mach_o.FAT_MAGIC)
 MAGIC_LEN = 4
 STRIPCMD = ["/usr/bin/strip", "-x", "-S", "-"]
 
+# ioctl for cloning a file on Linux filesystems with copy-on-write
+# support (btrfs, xfs), _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
 try:
     unicode
 except NameError:
@@ -108,14 +118,188 @@ class fileview(object):
         return self._fileobj.read(bytes)
 
 
-def mergecopy(src, dest):
+class bufferview(object):
+    """
+    A read-only file-like object for a buffer (such as a memoryview of
+    an mmap). Reads return zero-copy memoryview slices of the buffer.
+    """
+
+    def __init__(self, buffer):
+        self._buffer = memoryview(buffer)
+        self._pos = 0
+
+    def __repr__(self):
+        return "<bufferview [%d] @%d>" % (len(self._buffer), self._pos)
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=0):
+        if whence == 0:
+            pos = offset
+        elif whence == 1:
+            pos = self._pos + offset
+        elif whence == 2:
+            pos = len(self._buffer) + offset
+        else:
+            raise IOError("Invalid whence argument to seek: %r" % (whence,))
+        if pos < 0:
+            raise IOError("seek to negative offset %d" % (pos,))
+        self._pos = pos
+
+    def read(self, size=sys.maxsize):
+        if size < 0:
+            raise ValueError("Invalid size %s while reading from %r" % (size, self))
+        start = self._pos
+        self._pos = min(start + size, len(self._buffer))
+        return self._buffer[start : self._pos]  # noqa: E203
+
+
+_clonefile = None
+
+
+def _darwin_clonefile():
+    # clonefile(2) on macOS, or None when it is not available
+    global _clonefile
+    if _clonefile is None:
+        _clonefile = False
+        if sys.platform == "darwin":
+            try:
+                import ctypes
+
+                func = ctypes.CDLL(None, use_errno=True).clonefile
+            except (ImportError, OSError, AttributeError):
+                pass
+            else:
+                func.argtypes = (ctypes.c_char_p, ctypes.c_char_p, ctypes.c_uint32)
+                func.restype = ctypes.c_int
+                _clonefile = func
+    return _clonefile or None
+
+
+def _copy_contents(fsrc, fdst):
+    # Copy the contents of file object fsrc to fdst using the cheapest
+    # mechanism that works, and return its name.
+    sfd = fsrc.fileno()
+    dfd = fdst.fileno()
+    if sys.platform.startswith("linux"):
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(dfd, FICLONE, sfd)
+                return "reflink"
+            except (IOError, OSError):
+                pass
+
+        copy_file_range = getattr(os, "copy_file_range", None)
+        if copy_file_range is not None:
+            if _copy_loop(lambda size: copy_file_range(sfd, dfd, size)):
+                return "copy_file_range"
+
+        sendfile = getattr(os, "sendfile", None)
+        if sendfile is not None:
+            if _copy_loop(lambda size: sendfile(dfd, sfd, None, size)):
+                return "sendfile"
+
+    shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+    return "copy"
+
+
+def _copy_loop(copy_chunk):
+    # Call copy_chunk until it reports end of file. Returns False when
+    # the mechanism is not supported for these files, which is only
+    # detected before anything is copied.
+    copied = 0
+    while True:
+        try:
+            count = copy_chunk(1024 * 1024 * 1024)
+        except OSError as exc:
+            if copied == 0 and exc.errno in (
+                errno.EXDEV,
+                errno.EINVAL,
+                errno.ENOSYS,
+                errno.EOPNOTSUPP,
+                errno.EBADF,
+                errno.ENOTSUP,
+            ):
+                return False
+            raise
+        if count == 0:
+            return True
+        copied += count
+
+
+def _unlink_hardlink(path):
+    # Writing to a hard link would change the other names of the file
+    # as well, remove the link instead.
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return
+    if stat.S_ISREG(st.st_mode) and st.st_nlink > 1:
+        os.unlink(path)
+
+
+def copy_file(src, dst, link=False):
+    """
+    Copy *src* to *dst* including permissions and timestamps, like
+    copy2, and return the name of the mechanism that was used.
+
+    The contents are cloned when the filesystem supports it ("clonefile"
+    on macOS, "reflink" on Linux), which takes no additional space until
+    either copy is modified. Otherwise "copy_file_range" and "sendfile"
+    are tried on Linux before falling back to a regular "copy".
+
+    When *link* is true *dst* is created as a hard link to *src* when
+    possible ("link"). This must only be used for files that won't
+    be modified in place afterwards.
     """
-    copy2, but only if the destination isn't up to date
+    src = fsencoding(src)
+    dst = fsencoding(dst)
+
+    if link:
+        try:
+            if os.path.lexists(dst):
+                os.unlink(dst)
+            os.link(src, dst)
+            return "link"
+        except OSError:
+            pass
+
+    _unlink_hardlink(dst)
+
+    clonefile = _darwin_clonefile()
+    if clonefile is not None and not os.path.lexists(dst):
+        if clonefile(src, dst, 0) == 0:
+            return "clonefile"
+
+    with open(src, "rb") as fsrc:
+        with open(dst, "wb") as fdst:
+            strategy = _copy_contents(fsrc, fdst)
+    shutil.copystat(src, dst)
+    return strategy
+
+
+def mergecopy(src, dest, link=False):
+    """
+    copy_file, but only if the destination isn't up to date
     """
     if os.path.exists(dest) and os.stat(dest).st_mtime >= os.stat(src).st_mtime:
         return
 
-    copy2(src, dest)
+    copy_file(src, dest, link=link)
+
+
+def _iterdir(path):
+    # Yield (name, is_link, is_dir) for the entries of directory *path*,
+    # using os.scandir to avoid a stat call per entry when available.
+    scandir = getattr(os, "scandir", None)
+    if scandir is None:
+        for name in os.listdir(path):
+            fullname = os.path.join(path, name)
+            yield name, os.path.islink(fullname), os.path.isdir(fullname)
+    else:
+        for entry in list(scandir(path)):
+            yield entry.name, entry.is_symlink(), entry.is_dir()
 
 
 def mergetree(src, dst, condition=None, copyfn=mergecopy, srcbase=None):
@@ -126,22 +310,22 @@ def mergetree(src, dst, condition=None, copyfn=mergecopy, srcbase=None):
     dst = fsencoding(dst)
     if srcbase is None:
         srcbase = src
-    names = map(fsencoding, os.listdir(src))
+    entries = list(_iterdir(src))
     try:
         os.makedirs(dst)
     except OSError:
         pass
     errors = []
-    for name in names:
+    for name, is_link, is_dir in entries:
         srcname = os.path.join(src, name)
         dstname = os.path.join(dst, name)
         if condition is not None and not condition(srcname):
             continue
         try:
-            if os.path.islink(srcname):
+            if is_link:
                 realsrc = os.readlink(srcname)
                 os.symlink(realsrc, dstname)
-            elif os.path.isdir(srcname):
+            elif is_dir:
                 mergetree(
                     srcname,
                     dstname,
@@ -13,8 +13,7 @@ else:
     import unittest
 
 
-@contextlib.contextmanager
-def temporary_macho_file(load_commands):
+def macho_file_data(load_commands, trailer=b""):
     struct_mach_header_64_format = ">IIIIIIII"
     cpu_type_arm64 = 0x100000C
     cpu_subtype_arm_all = 0x0
@@ -32,10 +31,13 @@ def temporary_macho_file(load_commands):
         0,
         0,
     )
+    return mach_header + b"".join(load_commands) + trailer
+
+
+@contextlib.contextmanager
+def temporary_macho_file(load_commands, trailer=b""):
     with tempfile.NamedTemporaryFile(delete=False) as macho_file:
-        macho_file.write(mach_header)
-        for lc in load_commands:
-            macho_file.write(lc)
+        macho_file.write(macho_file_data(load_commands, trailer))
         # Close the file so it can be re-opened on Windows.
         macho_file.close()
         yield macho_file.name
@@ -48,6 +50,81 @@ def lc_uuid(macho_uuid):
     return struct.pack(lc_uuid_format, mach_o.LC_UUID, lc_uuid_size, macho_uuid.bytes)
 
 
+def lc_segment_64(segname, sections):
+    # sections is a list of (sectname, offset, size, flags)
+    lc_segment_64_format = ">II16sQQQQiiII"
+    section_64_format = ">16s16sQQIIIIIIII"
+    cmdsize = struct.calcsize(lc_segment_64_format) + len(sections) * struct.calcsize(
+        section_64_format
+    )
+    data = struct.pack(
+        lc_segment_64_format,
+        mach_o.LC_SEGMENT_64,
+        cmdsize,
+        segname,
+        0,
+        0,
+        0,
+        0,
+        7,
+        7,
+        len(sections),
+        0,
+    )
+    for sectname, offset, size, flags in sections:
+        data += struct.pack(
+            section_64_format,
+            sectname,
+            segname,
+            0,
+            size,
+            offset,
+            0,
+            0,
+            0,
+            flags,
+            0,
+            0,
+            0,
+        )
+    return data
+
+
+def lc_load_dylib(name, cmd=mach_o.LC_LOAD_DYLIB):
+    lc_dylib_format = ">IIIIII"
+    name = name.encode("utf-8") + b"\x00"
+    name += b"\x00" * (-len(name) % 8)
+    lc_dylib_size = struct.calcsize(lc_dylib_format) + len(name)
+    return (
+        struct.pack(
+            lc_dylib_format,
+            cmd,
+            lc_dylib_size,
+            struct.calcsize(lc_dylib_format),
+            2,
+            0x10000,
+            0x10000,
+        )
+        + name
+    )
+
+
+def lc_rpath(path):
+    lc_rpath_format = ">III"
+    path = path.encode("utf-8") + b"\x00"
+    path += b"\x00" * (-len(path) % 8)
+    lc_rpath_size = struct.calcsize(lc_rpath_format) + len(path)
+    return (
+        struct.pack(
+            lc_rpath_format,
+            mach_o.LC_RPATH,
+            lc_rpath_size,
+            struct.calcsize(lc_rpath_format),
+        )
+        + path
+    )
+
+
 def lc_unknown():
     lc_unknown_format = ">III"
     lc_unknown = 0x707A11ED  # Made-up load command. Hopefully never used.
@@ -99,6 +176,177 @@ class TestMachO(unittest.TestCase):
             load_command, command, _ = macho.headers[0].commands[1]
             self.assertEqual(load_command.cmd, mach_o.LC_UUID)
             self.assertEqual(uuid.UUID(bytes=command.uuid), macho_uuid)
+            self.assertEqual(macho.uuids(), [macho_uuid.bytes])
+
+        with temporary_macho_file([lc_unknown()]) as macho_filename:
+            macho = MachO.MachO(macho_filename, allow_unknown_load_commands=True)
+            self.assertEqual(macho.uuids(), [None])
+
+    def test_section_data(self):
+        # header (32 bytes) + segment command (72 bytes) + 2 sections (80 bytes)
+        data_offset = 32 + 72 + 2 * 80
+        segment = lc_segment_64(
+            b"__TEXT",
+            [
+                (b"__text", data_offset, 8, 0),
+                (b"__bss", 0, 16, mach_o.S_ZEROFILL),
+            ],
+        )
+        with temporary_macho_file([segment], b"ABCDEFGH") as macho_filename:
+            for lazy in (True, False):
+                with self.subTest(lazy=lazy):
+                    macho = MachO.MachO(macho_filename, lazy_section_data=lazy)
+                    _, _, sections = macho.headers[0].commands[0]
+                    self.assertEqual(len(sections), 2)
+                    self.assertEqual("_section_data" in sections[0].__dict__, not lazy)
+                    self.assertEqual(sections[0].section_data, b"ABCDEFGH")
+                    self.assertIn("_section_data", sections[0].__dict__)
+                    self.assertFalse(hasattr(sections[1], "section_data"))
+
+                    sections[0].add_section_data(b"12345678")
+                    self.assertEqual(sections[0].section_data, b"12345678")
+
+    def test_use_mmap(self):
+        data_offset = 32 + 72 + 80 + 24
+        segment = lc_segment_64(b"__TEXT", [(b"__text", data_offset, 8, 0)])
+        macho_uuid = uuid.UUID("6894C0AE-C8B7-4E0B-A529-30BBEBA3703B")
+        with temporary_macho_file(
+            [segment, lc_uuid(macho_uuid)], b"ABCDEFGH"
+        ) as macho_filename:
+            with MachO.MachO(macho_filename, use_mmap=True) as macho:
+                self.assertIsNotNone(macho._mmap)
+                header = macho.headers[0]
+                self.assertEqual(len(header.commands), 2)
+                _, _, sections = header.commands[0]
+                _, command, data = header.commands[1]
+                self.assertEqual(uuid.UUID(bytes=command.uuid), macho_uuid)
+                self.assertIsInstance(data, bytes)
+
+                section_data = sections[0].section_data
+                self.assertIsInstance(section_data, memoryview)
+                self.assertEqual(section_data, b"ABCDEFGH")
+                del section_data, sections
+
+            self.assertIsNone(macho._mmap)
+
+    def test_write(self):
+        # dylib_command has mach_version_helper fields
+        data_offset = 4096
+        name = b"/usr/lib/libfoo.dylib\x00\x00\x00"
+        load_commands = [
+            lc_segment_64(b"__TEXT", [(b"__text", data_offset, 8, 0)]),
+            struct.pack(
+                ">IIIIII", mach_o.LC_LOAD_DYLIB, 24 + len(name), 24, 2, 0x10000, 0x10000
+            )
+            + name,
+        ]
+        header_size = 32 + sum(len(lc) for lc in load_commands)
+        trailer = b"\x00" * (data_offset - header_size) + b"ABCDEFGH"
+        with temporary_macho_file(load_commands, trailer) as macho_filename:
+            with open(macho_filename, "rb") as fp:
+                original = fp.read()
+
+            macho = MachO.MachO(macho_filename)
+            with open(macho_filename, "rb+") as fp:
+                macho.write(fp)
+            with open(macho_filename, "rb") as fp:
+                self.assertEqual(fp.read(), original)
+
+    def test_write_rewritten(self):
+        data_offset = 4096
+        segment = lc_segment_64(b"__TEXT", [(b"__text", data_offset, 8, 0)])
+        load_commands = [
+            segment,
+            lc_load_dylib("/usr/lib/libfoo.dylib"),
+            lc_load_dylib("/usr/lib/libbar.dylib"),
+        ]
+        header_size = len(macho_file_data(load_commands))
+        trailer = b"\x00" * (data_offset - header_size) + b"ABCDEFGH"
+        thin = macho_file_data(load_commands, trailer)
+
+        # A fat file with two copies of the same file
+        offset = 4096
+        fat = struct.pack(">II", mach_o.FAT_MAGIC, 2)
+        fat += struct.pack(">iiIII", 0x100000C, 0, offset, len(thin), 12)
+        fat += struct.pack(">iiIII", 0x1000007, 3, 3 * offset, len(thin), 12)
+        fat = fat.ljust(offset, b"\x00") + thin
+        fat = fat.ljust(3 * offset, b"\x00") + thin
+
+        def changefunc(path):
+            if path == "/usr/lib/libbar.dylib":
+                return "@executable_path/../Frameworks/libbar.dylib"
+            return None
+
+        for data in (thin, fat):
+            with tempfile.NamedTemporaryFile(delete=False) as fp:
+                fp.write(data)
+            try:
+                macho = MachO.MachO(fp.name)
+                for header in macho.headers:
+                    self.assertEqual(
+                        header.serialize(),
+                        data[header.offset : header.offset + data_offset],  # noqa: E203
+                    )
+                with open(fp.name, "rb+") as fobj:
+                    macho.write(fobj)
+                with open(fp.name, "rb") as fobj:
+                    self.assertEqual(fobj.read(), data)
+
+                # Only the load commands of every header change
+                macho.rewriteLoadCommands(changefunc)
+                with open(fp.name, "rb+") as fobj:
+                    macho.write(fobj)
+                with open(fp.name, "rb") as fobj:
+                    changed = fobj.read()
+                self.assertEqual(len(changed), len(data))
+                for header in macho.headers:
+                    end = header.offset + header.size
+                    self.assertEqual(
+                        changed[header.offset + data_offset : end],  # noqa: E203
+                        data[header.offset + data_offset : end],  # noqa: E203
+                    )
+
+                self.assertEqual(
+                    [
+                        filename
+                        for header in MachO.MachO(fp.name).headers
+                        for _idx, _name, filename in header.walkRelocatables()
+                    ],
+                    [
+                        "/usr/lib/libfoo.dylib",
+                        "@executable_path/../Frameworks/libbar.dylib",
+                    ]
+                    * len(macho.headers),
+                )
+            finally:
+                os.unlink(fp.name)
+
+    def test_fat_file(self):
+        macho_uuid = uuid.UUID("6894C0AE-C8B7-4E0B-A529-30BBEBA3703B")
+        with temporary_macho_file([lc_uuid(macho_uuid)]) as macho_filename:
+            with open(macho_filename, "rb") as fp:
+                thin = fp.read()
+
+        offset = 8 + 2 * 20
+        fat = struct.pack(">II", mach_o.FAT_MAGIC, 2)
+        fat += struct.pack(">iiIII", 0x100000C, 0, offset, len(thin), 0)
+        fat += struct.pack(">iiIII", 0x1000007, 3, offset + len(thin), len(thin), 0)
+        with tempfile.NamedTemporaryFile(delete=False) as fp:
+            fp.write(fat + thin + thin)
+        try:
+            for use_mmap in (False, True):
+                with self.subTest(use_mmap=use_mmap):
+                    with MachO.MachO(fp.name, use_mmap=use_mmap) as macho:
+                        self.assertEqual(macho.fat.nfat_arch, 2)
+                        self.assertEqual(
+                            [header.offset for header in macho.headers],
+                            [offset, offset + len(thin)],
+                        )
+                        for header in macho.headers:
+                            _, command, _ = header.commands[0]
+                            self.assertEqual(uuid.UUID(bytes=command.uuid), macho_uuid)
+        finally:
+            os.unlink(fp.name)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,13 @@
+import os
+import pickle
+import shutil
 import sys
+import tempfile
 
 from macholib import MachOGraph
+from macholib.dyld import DyldResolver
+
+from .test_MachO import lc_load_dylib, lc_rpath, macho_file_data
 
 if sys.version_info[:2] <= (2, 6):
     import unittest2 as unittest
@@ -9,9 +16,451 @@ else:
 
 
 class TestMachOGraph(unittest.TestCase):
-    @unittest.expectedFailure
-    def test_missing(self):
-        self.fail("tests are missing")
+    def setUp(self):
+        self.directory = os.path.realpath(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_file(self, path, load_commands):
+        path = os.path.join(self.directory, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as fp:
+            fp.write(macho_file_data(load_commands))
+        return path
+
+    def test_rpath(self):
+        # bin/app -> @rpath/libfoo.dylib (lib) -> @rpath/libbar.dylib (lib2)
+        #                                       -> @rpath/libbaz.dylib (lib3)
+        app = self.make_file(
+            "bin/app",
+            [
+                lc_rpath("@loader_path/../lib"),
+                lc_rpath("@executable_path/../lib2"),
+                lc_load_dylib("@rpath/libfoo.dylib"),
+                lc_load_dylib("@rpath/libmissing.dylib"),
+            ],
+        )
+        libfoo = self.make_file(
+            "lib/libfoo.dylib",
+            [
+                lc_rpath("@loader_path/../lib3"),
+                lc_load_dylib("@rpath/libbar.dylib"),
+                lc_load_dylib("@rpath/libbaz.dylib"),
+            ],
+        )
+        libbar = self.make_file("lib2/libbar.dylib", [])
+        libbaz = self.make_file("lib3/libbaz.dylib", [])
+        # Not found because libfoo.dylib is found in lib first
+        self.make_file("lib2/libfoo.dylib", [])
+
+        for kwds in ({}, {"resolver": DyldResolver({})}):
+            with self.subTest(**kwds):
+                graph = MachOGraph.MachOGraph(**kwds)
+                node = graph.run_file(app)
+
+                self.assertEqual(
+                    node.rpaths(), ["@loader_path/../lib", "@executable_path/../lib2"]
+                )
+                self.assertEqual(
+                    graph.rpath_stack(node),
+                    (
+                        os.path.join(self.directory, "lib"),
+                        os.path.join(self.directory, "lib2"),
+                    ),
+                )
+                foo_node = graph.findNode(libfoo)
+                self.assertEqual(
+                    graph.rpath_stack(foo_node),
+                    (
+                        os.path.join(self.directory, "lib3"),
+                        os.path.join(self.directory, "lib"),
+                        os.path.join(self.directory, "lib2"),
+                    ),
+                )
+
+                self.assertIsInstance(foo_node, MachOGraph.MachO)
+                self.assertIsInstance(graph.findNode(libbar), MachOGraph.MachO)
+                self.assertIsInstance(graph.findNode(libbaz), MachOGraph.MachO)
+                self.assertIsInstance(
+                    graph.findNode("@rpath/libmissing.dylib"), MachOGraph.MissingMachO
+                )
+                self.assertEqual(
+                    graph.trans_table[(app, "@rpath/libfoo.dylib")], libfoo
+                )
+                self.assertEqual(
+                    graph.trans_table[(libfoo, "@rpath/libbar.dylib")], libbar
+                )
+
+                self.assertEqual(
+                    sorted(n.graphident for n in graph.flatten() if n is not graph),
+                    sorted([app, libfoo, libbar, libbaz, "@rpath/libmissing.dylib"]),
+                )
+
+    def test_rpath_cache(self):
+        libfoo = self.make_file("lib/libfoo.dylib", [])
+        modules = [
+            self.make_file(
+                "mod%d.so" % (i,),
+                [lc_rpath("@loader_path/lib"), lc_load_dylib("@rpath/libfoo.dylib")],
+            )
+            for i in range(3)
+        ]
+
+        probes = []
+
+        class Resolver(DyldResolver):
+            def isfile(self, path):
+                probes.append(path)
+                return super(Resolver, self).isfile(path)
+
+        graph = MachOGraph.MachOGraph(resolver=Resolver({}))
+        for fn in modules:
+            graph.run_file(fn)
+
+        # The modules share the same rpath stack, the library is only
+        # searched once.
+        self.assertEqual(probes, [libfoo])
+        for fn in modules:
+            self.assertEqual(graph.trans_table[(fn, "@rpath/libfoo.dylib")], libfoo)
+
+    def make_tree(self):
+        # A small tree of files with shared, missing and @rpath dependencies
+        libs = []
+        for i in range(8):
+            libs.append(
+                self.make_file(
+                    "lib/lib%d.dylib" % (i,),
+                    [
+                        lc_load_dylib(
+                            os.path.join(self.directory, "lib/lib%d.dylib" % (j,))
+                        )
+                        for j in range(i + 1, min(i + 3, 8))
+                    ]
+                    + [lc_load_dylib("/no/such/lib%d.dylib" % (i,))],
+                )
+            )
+        apps = [
+            self.make_file(
+                "bin/app%d" % (i,),
+                [
+                    lc_rpath("@loader_path/../lib"),
+                    lc_load_dylib("@rpath/lib%d.dylib" % (i,)),
+                    lc_load_dylib("@rpath/lib%d.dylib" % (7 - i,)),
+                ],
+            )
+            for i in range(4)
+        ]
+        invalid = os.path.join(self.directory, "invalid")
+        with open(invalid, "wb") as fp:
+            fp.write(b"not a Mach-O file")
+        return apps, libs, invalid
+
+    def test_run_files(self):
+        apps, libs, invalid = self.make_tree()
+
+        serial = MachOGraph.MachOGraph()
+        for fn in apps:
+            serial.run_file(fn)
+        expected = list(serial.itergraphreport())
+        self.assertEqual(len(list(serial.flatten())), 4 + 8 + 8)
+
+        for executor in ("thread", "process"):
+            with self.subTest(executor=executor):
+                graph = MachOGraph.MachOGraph()
+                nodes = graph.run_files(apps, workers=4, executor=executor)
+                self.assertEqual([n.graphident for n in nodes], apps)
+                self.assertEqual(list(graph.itergraphreport()), expected)
+
+        graph = MachOGraph.MachOGraph()
+        graph.run_files(apps, workers=1)
+        self.assertEqual(list(graph.itergraphreport()), expected)
+
+        # Errors are raised in the same way as with run_file
+        graph = MachOGraph.MachOGraph()
+        self.assertRaises(ValueError, graph.run_files, [invalid], workers=2)
+        self.assertRaises(
+            ValueError,
+            graph.run_files,
+            [os.path.join(self.directory, "missing")],
+            workers=2,
+        )
+
+    def test_run_files_locate(self):
+        # Dependencies are prefetched using the locate method of
+        # subclasses.
+        from concurrent.futures import ThreadPoolExecutor
+
+        lib = self.make_file("lib/libfoo.dylib", [])
+        app = self.make_file("bin/app", [lc_load_dylib("libfoo.dylib")])
+
+        class RenamingGraph(MachOGraph.MachOGraph):
+            def locate(self, filename, loader=None):
+                if filename == "libfoo.dylib":
+                    return lib
+                return super(RenamingGraph, self).locate(filename, loader)
+
+        class RecordingExecutor(ThreadPoolExecutor):
+            def __init__(self):
+                super(RecordingExecutor, self).__init__(2)
+                self.submitted = []
+
+            def submit(self, fn, *args):
+                self.submitted.extend(args)
+                return super(RecordingExecutor, self).submit(fn, *args)
+
+        graph = RenamingGraph()
+        with RecordingExecutor() as executor:
+            graph.run_files([app], executor=executor)
+        self.assertEqual(executor.submitted, [app, lib])
+        self.assertEqual(graph.findNode(lib).filename, lib)
+
+    def test_run_files_compact(self):
+        apps, libs, invalid = self.make_tree()
+        expected = MachOGraph.MachOGraph()
+        expected.run_files(apps, workers=1)
+        expected = expected.compact()
+
+        for workers in (1, 4):
+            with self.subTest(workers=workers):
+                graph = MachOGraph.MachOGraph()
+                compact = graph.run_files_compact(apps, workers=workers)
+                self.assertEqual(list(compact), list(expected))
+                self.assertEqual(list(compact.roots), list(expected.roots))
+                for name in expected:
+                    self.assertEqual(compact.node(name), expected.node(name))
+                    self.assertEqual(compact.out_edges(name), expected.out_edges(name))
+
+                # No parsed headers are kept
+                for node in graph.flatten():
+                    self.assertNotIsInstance(node, MachOGraph.MachO)
+                self.assertEqual(graph.findNode(libs[0]).kind, "MachO")
+
+    def test_deep_chain(self):
+        # Longer than the recursion limit
+        count = sys.getrecursionlimit() + 100
+        paths = [
+            os.path.join(self.directory, "lib%d.dylib" % (i,)) for i in range(count)
+        ]
+        for i, path in enumerate(paths):
+            self.make_file(
+                path,
+                [lc_load_dylib(name) for name in paths[i + 1 : i + 2]],  # noqa: E203
+            )
+
+        graph = MachOGraph.MachOGraph()
+        graph.run_file(paths[0])
+        self.assertEqual([n.graphident for n in graph.flatten()], paths)
+        for i in range(count - 1):
+            edge = graph.graph.edge_by_node(paths[i], paths[i + 1])
+            self.assertEqual(graph.graph.edge_data(edge), "load_dylib")
+
+    def test_hooks(self):
+        # Subclasses that override load_file or scan_node see the
+        # nested steps of the walk as well.
+        apps, libs, invalid = self.make_tree()
+        expected = MachOGraph.MachOGraph()
+        expected.run_file(apps[0])
+
+        class LoadFileGraph(MachOGraph.MachOGraph):
+            def load_file(self, name, caller=None):
+                calls.append(("load_file", name, caller.graphident))
+                return super(LoadFileGraph, self).load_file(name, caller=caller)
+
+        class ScanNodeGraph(MachOGraph.MachOGraph):
+            def scan_node(self, node, caller=None):
+                calls.append(("scan_node", node.graphident))
+                return super(ScanNodeGraph, self).scan_node(node, caller=caller)
+
+        for cls in (LoadFileGraph, ScanNodeGraph):
+            with self.subTest(cls=cls.__name__):
+                calls = []
+                graph = cls()
+                graph.run_file(apps[0])
+                self.assertEqual(
+                    list(graph.graph.edge_list()), list(expected.graph.edge_list())
+                )
+                self.assertEqual(
+                    [n.graphident for n in graph.flatten()],
+                    [n.graphident for n in expected.flatten()],
+                )
+                if cls is LoadFileGraph:
+                    self.assertIn(("load_file", "/no/such/lib2.dylib", libs[2]), calls)
+                else:
+                    self.assertEqual(
+                        [ident for _, ident in calls],
+                        [apps[0]] + libs[: len(calls) - 1],
+                    )
+                    self.assertEqual(len(calls), len(libs) + 1)
+
+    def test_compact(self):
+        apps, libs, invalid = self.make_tree()
+        graph = MachOGraph.MachOGraph()
+        for fn in apps:
+            graph.run_file(fn)
+
+        compact = graph.compact()
+        self.assertEqual(
+            [(node.graphident, type(node).__name__) for node in graph.flatten()],
+            [(node.graphident, node.kind) for node in compact.flatten()],
+        )
+        self.assertEqual(
+            sorted(compact.dependents(libs[2])), sorted([apps[2], libs[0], libs[1]])
+        )
+
+    def test_dependents(self):
+        apps, libs, invalid = self.make_tree()
+        graph = MachOGraph.MachOGraph()
+        for fn in apps:
+            graph.run_file(fn)
+
+        self.assertEqual(graph.dependents_of(libs[2]), {apps[2], libs[0], libs[1]})
+        self.assertEqual(graph.dependents_of(graph.findNode(apps[0])), set())
+        self.assertEqual(
+            graph.transitive_dependents(libs[2]),
+            {apps[0], apps[1], apps[2], libs[0], libs[1]},
+        )
+        self.assertEqual(
+            graph.transitive_dependents("/no/such/lib7.dylib"), set(apps) | set(libs)
+        )
+        self.assertEqual(
+            graph.transitive_dependencies(apps[3]),
+            set(libs[3:]) | set("/no/such/lib%d.dylib" % (i,) for i in range(3, 8)),
+        )
+        self.assertRaises(KeyError, graph.dependents_of, invalid)
+
+        # Results reflect changes to the graph
+        self.make_file("lib/lib6.dylib", [])
+        graph.update(changed=[libs[6]])
+        self.assertEqual(graph.dependents_of(libs[7]), {apps[0], libs[5]})
+        self.assertEqual(
+            graph.transitive_dependencies(apps[3]),
+            set(libs[3:]) | set("/no/such/lib%d.dylib" % (i,) for i in (3, 4, 5, 7)),
+        )
+
+    def graph_contents(self, graph):
+        nodes = set()
+        for node in graph.flatten():
+            nodes.add((type(node).__name__, node.graphident))
+        edges = set()
+        for edge in graph.graph.edge_list():
+            _, edge_data, head, tail = graph.graph.describe_edge(edge)
+            if head is graph:
+                head = None
+            edges.add((head, tail, edge_data))
+        return nodes, edges
+
+    def test_snapshot(self):
+        apps, libs, invalid = self.make_tree()
+        graph = MachOGraph.MachOGraph()
+        for fn in apps:
+            graph.run_file(fn)
+
+        snapshot = pickle.loads(pickle.dumps(graph.snapshot()))
+        restored = MachOGraph.MachOGraph()
+        restored.restore(snapshot)
+        self.assertEqual(
+            list(restored.itergraphreport()), list(graph.itergraphreport())
+        )
+        self.assertEqual(restored.trans_table, graph.trans_table)
+        self.assertEqual(restored.stale_files(), ([], []))
+        self.assertRaises(ValueError, restored.restore, snapshot)
+        self.assertRaises(ValueError, MachOGraph.MachOGraph().restore, {})
+
+    def test_update(self):
+        apps, libs, invalid = self.make_tree()
+        graph = MachOGraph.MachOGraph()
+        for fn in apps:
+            graph.run_file(fn)
+        restored = MachOGraph.MachOGraph()
+        restored.restore(graph.snapshot())
+
+        # lib0 no longer depends on lib1 and lib2, but on a new library
+        # that didn't exist before, and lib5 is removed.
+        new_lib = os.path.join(self.directory, "lib/libnew.dylib")
+        self.make_file("lib/lib0.dylib", [lc_load_dylib(new_lib)])
+        os.utime(libs[0], (0, 0))
+        self.make_file(new_lib, [])
+        os.unlink(libs[5])
+
+        self.assertEqual(restored.stale_files(), ([libs[0]], [libs[5]]))
+
+        parsed = []
+        _new_macho = restored._new_macho
+
+        def new_macho(filename):
+            parsed.append(filename)
+            return _new_macho(filename)
+
+        restored._new_macho = new_macho
+        restored.update(changed=[libs[0]], removed=[libs[5]])
+        self.assertEqual(parsed, [libs[0], new_lib])
+        self.assertEqual(restored.stale_files(), ([], []))
+
+        expected = MachOGraph.MachOGraph()
+        for fn in apps:
+            expected.run_file(fn)
+        self.assertEqual(self.graph_contents(restored), self.graph_contents(expected))
+        self.assertIsInstance(restored.findNode(libs[5]), MachOGraph.MissingMachO)
+
+    def test_update_added(self):
+        libfoo = self.make_file(
+            "lib/libfoo.dylib", [lc_load_dylib("@loader_path/libbar.dylib")]
+        )
+        graph = MachOGraph.MachOGraph()
+        graph.run_file(libfoo)
+        self.assertIsInstance(
+            graph.findNode("@loader_path/libbar.dylib"), MachOGraph.MissingMachO
+        )
+
+        libbar = self.make_file("lib/libbar.dylib", [])
+        app = self.make_file("app", [lc_load_dylib(libfoo)])
+        graph.update(added=[libbar, app])
+
+        expected = MachOGraph.MachOGraph()
+        expected.run_file(libfoo)
+        expected.run_file(libbar)
+        expected.run_file(app)
+        self.assertEqual(self.graph_contents(graph), self.graph_contents(expected))
+        self.assertIsInstance(graph.findNode(libbar), MachOGraph.MachO)
+        self.assertIsNone(
+            super(MachOGraph.MachOGraph, graph).findNode("@loader_path/libbar.dylib")
+        )
+
+    def test_update_added_shadows(self):
+        # app -> @rpath/libbar.dylib (rpaths lib, lib2)
+        #     -> lib2/libbaz.dylib, found in lib3 when that has a copy
+        app = self.make_file(
+            "bin/app",
+            [
+                lc_rpath(os.path.join(self.directory, "lib")),
+                lc_rpath(os.path.join(self.directory, "lib2")),
+                lc_load_dylib("@rpath/libbar.dylib"),
+                lc_load_dylib(os.path.join(self.directory, "lib2/libbaz.dylib")),
+            ],
+        )
+        self.make_file("lib2/libbar.dylib", [])
+        self.make_file("lib2/libbaz.dylib", [])
+        env = {"DYLD_LIBRARY_PATH": os.path.join(self.directory, "lib3")}
+
+        graph = MachOGraph.MachOGraph(env=env)
+        graph.run_file(app)
+
+        # Both libraries are now found elsewhere
+        libbar = self.make_file("lib/libbar.dylib", [])
+        libbaz = self.make_file("lib3/libbaz.dylib", [])
+        graph.update(added=[libbar, libbaz])
+
+        expected = MachOGraph.MachOGraph(env=env)
+        expected.run_file(app)
+        expected.run_file(libbar)
+        expected.run_file(libbaz)
+        self.assertEqual(self.graph_contents(graph), self.graph_contents(expected))
+        self.assertEqual(
+            sorted(graph.graph.tail(edge) for edge in graph.graph.out_edges(app)),
+            sorted([libbar, libbaz]),
+        )
 
 
 if __name__ == "__main__":
@@ -1,6 +1,18 @@
+import json
+import os
+import shutil
 import sys
+import tempfile
+import threading
+import uuid
+
+from altgraph.Graph import Graph
 
 from macholib import MachOStandalone
+from macholib.cache import ParseCache
+from macholib.MachO import MachO
+
+from .test_MachO import lc_load_dylib, lc_segment_64, lc_uuid, macho_file_data
 
 if sys.version_info[:2] <= (2, 6):
     import unittest2 as unittest
@@ -8,10 +20,388 @@ else:
     import unittest
 
 
+TEXT_OFFSET = 4096
+
+
+def write_macho(path, names, macho_uuid=None):
+    # A Mach-O file with room for growing the load commands
+    load_commands = [lc_segment_64(b"__TEXT", [(b"__text", TEXT_OFFSET, 8, 0)])]
+    if macho_uuid is not None:
+        load_commands.append(lc_uuid(macho_uuid))
+    load_commands.extend(lc_load_dylib(name) for name in names)
+    data = macho_file_data(load_commands)
+    data += b"\x00" * (TEXT_OFFSET - len(data)) + b"ABCDEFGH"
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, "wb") as fp:
+        fp.write(data)
+    return path
+
+
+def dependencies(path):
+    return [
+        filename
+        for header in MachO(path).headers
+        for _idx, _name, filename in header.walkRelocatables()
+    ]
+
+
+class RecordingStandalone(MachOStandalone.MachOStandalone):
+    def __init__(self, *args, **kwds):
+        super(RecordingStandalone, self).__init__(*args, **kwds)
+        self.stripped = []
+
+    def strip_files(self, files):
+        self.stripped.extend(files)
+
+
 class TestMachOStandalone(unittest.TestCase):
-    @unittest.expectedFailure
-    def test_missing(self):
-        self.fail("tests are missing")
+    def setUp(self):
+        self.directory = os.path.realpath(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_bundle(self, name):
+        # App.app/Contents/MacOS/app -> ext/lib/libfoo.dylib -> libbar.dylib
+        #                            -> ext/Foo.framework/Foo -> libbar.dylib
+        #                            -> /usr/lib/libSystem.B.dylib
+        base = os.path.join(self.directory, name, "App.app")
+        ext = os.path.join(self.directory, name, "ext")
+        libfoo = os.path.join(ext, "lib", "libfoo.dylib")
+        libbar = os.path.join(ext, "lib", "libbar.dylib")
+        framework = os.path.join(ext, "Foo.framework")
+        foo = os.path.join(framework, "Versions", "A", "Foo")
+
+        write_macho(libbar, [])
+        write_macho(libfoo, [libbar])
+        write_macho(foo, [libbar])
+        os.symlink("A", os.path.join(framework, "Versions", "Current"))
+        os.symlink("Versions/Current/Foo", os.path.join(framework, "Foo"))
+        with open(os.path.join(framework, "Versions", "A", "Info.plist"), "w") as fp:
+            fp.write("<plist/>")
+
+        app = write_macho(
+            os.path.join(base, "Contents", "MacOS", "app"),
+            [libfoo, foo, "/usr/lib/libSystem.B.dylib"],
+        )
+        os.makedirs(os.path.join(base, "Contents", "Frameworks"))
+        return base, app, libfoo, foo
+
+    def test_run(self):
+        for workers in (1, 4):
+            with self.subTest(workers=workers):
+                base, app, libfoo, foo = self.make_bundle("w%d" % (workers,))
+                original = dependencies(libfoo)
+                frameworks = os.path.join(base, "Contents", "Frameworks")
+
+                standalone = RecordingStandalone(base, workers=workers)
+                files = standalone.run(strip=True)
+
+                expected = {
+                    app,
+                    os.path.join(frameworks, "libfoo.dylib"),
+                    os.path.join(frameworks, "libbar.dylib"),
+                    os.path.join(frameworks, "Foo.framework/Versions/A/Foo"),
+                }
+                self.assertEqual(files, expected)
+                self.assertEqual(set(standalone.stripped), expected)
+
+                self.assertEqual(
+                    dependencies(app),
+                    [
+                        "@executable_path/../Frameworks/libfoo.dylib",
+                        "@executable_path/../Frameworks/"
+                        "Foo.framework/Versions/A/Foo",
+                        "/usr/lib/libSystem.B.dylib",
+                    ],
+                )
+                for path in (
+                    os.path.join(frameworks, "libfoo.dylib"),
+                    os.path.join(frameworks, "Foo.framework/Versions/A/Foo"),
+                ):
+                    self.assertEqual(
+                        dependencies(path),
+                        ["@executable_path/../Frameworks/libbar.dylib"],
+                    )
+                self.assertTrue(
+                    os.path.islink(os.path.join(frameworks, "Foo.framework/Foo"))
+                )
+                self.assertTrue(
+                    os.path.exists(
+                        os.path.join(frameworks, "Foo.framework/Versions/A/Info.plist")
+                    )
+                )
+
+                # The originals are not changed
+                self.assertEqual(dependencies(libfoo), original)
+                with open(os.path.join(frameworks, "libbar.dylib"), "rb") as fp:
+                    fp.seek(TEXT_OFFSET)
+                    self.assertEqual(fp.read(), b"ABCDEFGH")
+
+    def test_default_single_thread(self):
+        # Without a workers argument all hooks run in the calling thread
+        threads = set()
+
+        class ThreadStandalone(RecordingStandalone):
+            def mergecopy(self, src, dest):
+                threads.add(threading.current_thread())
+                return super(ThreadStandalone, self).mergecopy(src, dest)
+
+            def mergetree(self, src, dest):
+                threads.add(threading.current_thread())
+                return super(ThreadStandalone, self).mergetree(src, dest)
+
+            def locate(self, filename, loader=None):
+                threads.add(threading.current_thread())
+                return super(ThreadStandalone, self).locate(filename, loader)
+
+            def strip_files(self, files):
+                threads.add(threading.current_thread())
+                return super(ThreadStandalone, self).strip_files(files)
+
+        base, app, libfoo, foo = self.make_bundle("default")
+        standalone = ThreadStandalone(base)
+        self.assertEqual(standalone.workers, 1)
+        standalone.run(strip=True)
+        self.assertEqual(len(standalone.stripped), 4)
+        self.assertEqual(threads, {threading.current_thread()})
+
+    def test_hardlinks(self):
+        for hardlinks in (False, True):
+            with self.subTest(hardlinks=hardlinks):
+                base, app, libfoo, foo = self.make_bundle("h%d" % (hardlinks,))
+                standalone = RecordingStandalone(base, hardlinks=hardlinks)
+                standalone.run()
+
+                source = os.path.dirname(foo)
+                copy = os.path.join(
+                    base, "Contents", "Frameworks", "Foo.framework", "Versions", "A"
+                )
+                self.assertEqual(
+                    os.stat(os.path.join(copy, "Info.plist")).st_ino
+                    == os.stat(os.path.join(source, "Info.plist")).st_ino,
+                    hardlinks,
+                )
+                self.assertNotEqual(
+                    os.stat(os.path.join(copy, "Foo")).st_ino, os.stat(foo).st_ino
+                )
+                self.assertEqual(
+                    dependencies(foo),
+                    [os.path.join(os.path.dirname(libfoo), "libbar.dylib")],
+                )
+
+    def test_dedup(self):
+        for workers in (1, 4):
+            for macho_uuid in (None, uuid.UUID("6894C0AE-C8B7-4E0B-A529-30BBEBA3703B")):
+                with self.subTest(workers=workers, uuid=macho_uuid):
+                    name = "d%d%s" % (workers, macho_uuid is not None)
+                    base, app, libfoo, foo = self.make_bundle(name)
+                    ext = os.path.dirname(libfoo)
+                    libbaz = write_macho(os.path.join(ext, "libbaz.dylib"), [])
+                    lib1 = write_macho(
+                        os.path.join(ext, "one", "libsame.dylib"), [libbaz], macho_uuid
+                    )
+                    lib2 = os.path.join(ext, "two", "libother.dylib")
+                    os.makedirs(os.path.dirname(lib2))
+                    shutil.copy(lib1, lib2)
+                    write_macho(app, [lib1, lib2])
+
+                    frameworks = os.path.join(base, "Contents", "Frameworks")
+                    standalone = RecordingStandalone(base, workers=workers, dedup=True)
+                    files = standalone.run()
+                    self.assertEqual(
+                        files,
+                        {
+                            app,
+                            os.path.join(frameworks, "libsame.dylib"),
+                            os.path.join(frameworks, "libbaz.dylib"),
+                        },
+                    )
+                    self.assertEqual(
+                        dependencies(app),
+                        ["@executable_path/../Frameworks/libsame.dylib"] * 2,
+                    )
+                    link = os.path.join(frameworks, "libother.dylib")
+                    self.assertEqual(os.readlink(link), "libsame.dylib")
+                    self.assertEqual(
+                        dependencies(link),
+                        ["@executable_path/../Frameworks/libbaz.dylib"],
+                    )
+                    self.assertEqual(
+                        standalone.dedup_report(),
+                        {
+                            "duplicates": [
+                                {
+                                    "source": lib2,
+                                    "dest": link,
+                                    "target": os.path.join(frameworks, "libsame.dylib"),
+                                    "size": os.path.getsize(lib2),
+                                }
+                            ],
+                            "bytes_saved": os.path.getsize(lib2),
+                        },
+                    )
+
+        # Without dedup both libraries are copied
+        base, app, libfoo, foo = self.make_bundle("nodedup")
+        lib1 = write_macho(os.path.join(base, "..", "one", "libsame.dylib"), [])
+        lib2 = write_macho(os.path.join(base, "..", "two", "libother.dylib"), [])
+        write_macho(app, [lib1, lib2])
+        standalone = RecordingStandalone(base)
+        self.assertEqual(len(standalone.run()), 3)
+        self.assertEqual(standalone.dedup_report()["bytes_saved"], 0)
+
+    def bundle_contents(self, base):
+        result = {}
+        for root, dirs, files in os.walk(base):
+            for name in dirs + files:
+                path = os.path.join(root, name)
+                relpath = os.path.relpath(path, base)
+                if os.path.islink(path):
+                    result[relpath] = ("link", os.readlink(path))
+                elif os.path.isdir(path):
+                    result[relpath] = ("dir",)
+                else:
+                    with open(path, "rb") as fp:
+                        result[relpath] = ("file", fp.read())
+        return result
+
+    def make_duplicate(self, app, libfoo, foo):
+        # Add a dependency on a copy of libbar with a different name
+        libbar = os.path.join(os.path.dirname(libfoo), "libbar.dylib")
+        duplicate = os.path.join(os.path.dirname(libfoo), "libbar-copy.dylib")
+        shutil.copy(libbar, duplicate)
+        write_macho(app, [libfoo, foo, "/usr/lib/libSystem.B.dylib", duplicate])
+        return duplicate
+
+    def test_plan(self):
+        expected_base, app, libfoo, foo = self.make_bundle("expected")
+        self.make_duplicate(app, libfoo, foo)
+        expected = RecordingStandalone(expected_base, dedup=True)
+        expected_files = expected.run(strip=True)
+
+        for workers in (1, 4):
+            with self.subTest(workers=workers):
+                base, app, libfoo, foo = self.make_bundle("w%d" % (workers,))
+                duplicate = self.make_duplicate(app, libfoo, foo)
+                frameworks = os.path.join(base, "Contents", "Frameworks")
+                standalone = RecordingStandalone(base, workers=workers, dedup=True)
+
+                plan = standalone.plan(strip=True)
+                self.assertEqual(os.listdir(frameworks), [])
+                self.assertEqual(standalone.stripped, [])
+                plan = json.loads(json.dumps(plan))
+
+                self.assertEqual(
+                    sorted((copy["kind"], copy["dest"]) for copy in plan["copies"]),
+                    [
+                        ("file", os.path.join(frameworks, "libbar.dylib")),
+                        ("file", os.path.join(frameworks, "libfoo.dylib")),
+                        ("tree", os.path.join(frameworks, "Foo.framework")),
+                    ],
+                )
+                for copy in plan["copies"]:
+                    if copy["kind"] == "file":
+                        self.assertEqual(copy["size"], os.path.getsize(copy["source"]))
+                    else:
+                        self.assertEqual(
+                            copy["size"], os.path.getsize(foo) + len("<plist/>")
+                        )
+
+                rewrites = dict((item["path"], item) for item in plan["rewrites"])
+                self.assertEqual(
+                    rewrites[app]["changes"],
+                    {
+                        app: "@executable_path/../MacOS/app",
+                        libfoo: "@executable_path/../Frameworks/libfoo.dylib",
+                        foo: "@executable_path/../Frameworks/"
+                        "Foo.framework/Versions/A/Foo",
+                        duplicate: "@executable_path/../Frameworks/libbar.dylib",
+                    },
+                )
+                self.assertEqual(
+                    plan["links"],
+                    [
+                        {
+                            "dest": os.path.join(frameworks, "libbar-copy.dylib"),
+                            "target": os.path.join(frameworks, "libbar.dylib"),
+                        }
+                    ],
+                )
+                (header,) = rewrites[app]["headers"]
+                self.assertTrue(header["fits"])
+                self.assertEqual(header["low_offset"], TEXT_OFFSET)
+                self.assertGreater(header["new_sizeofcmds"], header["sizeofcmds"])
+                self.assertEqual(plan["strip"], plan["files"])
+
+                files = standalone.apply(plan)
+                self.assertEqual(
+                    files,
+                    set(path.replace(expected_base, base) for path in expected_files),
+                )
+                self.assertEqual(sorted(standalone.stripped), plan["strip"])
+                self.assertEqual(
+                    self.bundle_contents(base), self.bundle_contents(expected_base)
+                )
+
+                # Running the plan again is a no-op
+                standalone.apply(plan)
+                self.assertEqual(
+                    self.bundle_contents(base), self.bundle_contents(expected_base)
+                )
+
+        plan["version"] = 0
+        self.assertRaises(ValueError, standalone.apply, plan)
+
+    def test_plan_options(self):
+        base, app, libfoo, foo = self.make_bundle("options")
+        graph = Graph()
+        marker = MachOStandalone.ExcludedMachO("marker")
+        graph.add_node("marker", marker)
+        cache = ParseCache(os.path.join(self.directory, "cache"))
+
+        class PlanningStandalone(RecordingStandalone):
+            def _scan(self, platfiles, contents):
+                self.planning_graph = self.mm
+                return super(PlanningStandalone, self)._scan(platfiles, contents)
+
+        standalone = PlanningStandalone(
+            base, graph=graph, env={"DYLD_LIBRARY_PATH": ""}
+        )
+        standalone.mm.cache = cache
+        try:
+            nodes = graph.number_of_nodes()
+            plan = standalone.plan()
+
+            mm = standalone.planning_graph
+            self.assertIsNot(mm, standalone.mm)
+            self.assertIs(mm.cache, cache)
+            self.assertEqual(mm.env, {"DYLD_LIBRARY_PATH": ""})
+            self.assertIsNot(mm.graph, graph)
+            self.assertIs(mm.findNode("marker"), marker)
+            # Planning doesn't add nodes to the graph used by run
+            self.assertEqual(graph.number_of_nodes(), nodes)
+            self.assertIsNone(standalone.mm.findNode(app))
+
+            standalone.apply(plan)
+            self.assertEqual(
+                dependencies(app)[0], "@executable_path/../Frameworks/libfoo.dylib"
+            )
+        finally:
+            cache.close()
+
+    def test_copy_error(self):
+        base, app, libfoo, foo = self.make_bundle("error")
+
+        class FailingStandalone(MachOStandalone.MachOStandalone):
+            def mergecopy(self, src, dest):
+                raise IOError("copy failed")
+
+        for workers in (1, 4):
+            with self.subTest(workers=workers):
+                standalone = FailingStandalone(base, workers=workers)
+                self.assertRaises(IOError, standalone.run)
 
 
 if __name__ == "__main__":
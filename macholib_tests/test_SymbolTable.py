@@ -1,17 +1,236 @@
+import contextlib
+import os
+import struct
 import sys
+import tempfile
 
-from macholib import SymbolTable
+from macholib import SymbolTable, mach_o
+from macholib.MachO import MachO
 
 if sys.version_info[:2] <= (2, 6):
     import unittest2 as unittest
 else:
     import unittest
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# (name, n_type, n_sect, n_value), ordered as local, external, undefined
+SYMBOLS = [
+    (b"_local", mach_o.N_SECT, 1, 0x1000),
+    (b"_main", mach_o.N_SECT | mach_o.N_EXT, 1, 0x1100),
+    (b"_helper", mach_o.N_SECT | mach_o.N_EXT, 1, 0x1200),
+    (b"_malloc", mach_o.N_UNDF | mach_o.N_EXT, 0, 0),
+    (b"_printf", mach_o.N_UNDF | mach_o.N_EXT, 0, 0),
+]
+
+
+def lc_segment_64():
+    # A __TEXT segment with a __text section for 0x1000 - 0x1300
+    segment = struct.pack(
+        "<II16sQQQQiiII",
+        mach_o.LC_SEGMENT_64,
+        72 + 80,
+        b"__TEXT",
+        0x1000,
+        0x300,
+        0,
+        0,
+        5,
+        5,
+        1,
+        0,
+    )
+    section = struct.pack(
+        "<16s16sQQIIIIIIII", b"__text", b"__TEXT", 0x1000, 0x300, 0, 0, 0, 0, 0, 0, 0, 0
+    )
+    return segment + section
+
+
+@contextlib.contextmanager
+def temporary_symtab_file(symtab=True):
+    segment = lc_segment_64()
+    symtab_size = 24
+    dysymtab_size = 80
+    symoff = 32 + len(segment) + symtab_size + dysymtab_size
+
+    strtab = b"\x00"
+    nlists = b""
+    for name, n_type, n_sect, n_value in SYMBOLS:
+        nlists += struct.pack("<iBBhq", len(strtab), n_type, n_sect, 0, n_value)
+        strtab += name + b"\x00"
+    stroff = symoff + len(nlists)
+
+    if symtab:
+        commands = segment + struct.pack(
+            "<IIIIII",
+            mach_o.LC_SYMTAB,
+            symtab_size,
+            symoff,
+            len(SYMBOLS),
+            stroff,
+            len(strtab),
+        )
+        commands += struct.pack(
+            "<II18I", mach_o.LC_DYSYMTAB, dysymtab_size, 0, 1, 1, 2, 3, 2, *([0] * 12)
+        )
+    else:
+        commands = segment
+
+    data = struct.pack(
+        "<IIIIIIII",
+        mach_o.MH_MAGIC_64,
+        0x100000C,
+        0,
+        mach_o.MH_EXECUTE,
+        3 if symtab else 1,
+        len(commands),
+        0,
+        0,
+    )
+    data += commands
+    if symtab:
+        data += nlists + strtab
+
+    with tempfile.NamedTemporaryFile(delete=False) as macho_file:
+        macho_file.write(data)
+        macho_file.close()
+        yield macho_file.name
+        os.unlink(macho_file.name)
+
 
 class TestSymbolTable(unittest.TestCase):
-    @unittest.expectedFailure
-    def test_missing(self):
-        self.fail("tests are missing")
+    def test_read(self):
+        with temporary_symtab_file() as fn:
+            symtab = SymbolTable.SymbolTable(MachO(fn))
+
+        self.assertEqual(len(symtab.nlists), len(SYMBOLS))
+        for (sym, name), expected in zip(symtab.nlists, SYMBOLS):
+            self.assertIsInstance(sym, mach_o.nlist_64)
+            self.assertEqual(sym._endian_, "<")
+            self.assertIsInstance(sym.n_un, mach_o.n_un)
+            self.assertEqual((name, sym.n_type, sym.n_sect, sym.n_value), expected)
+
+        self.assertEqual([name for _, name in symtab.localsyms], [b"_local"])
+        self.assertEqual(
+            [name for _, name in symtab.extdefsyms], [b"_main", b"_helper"]
+        )
+        self.assertEqual(
+            [name for _, name in symtab.undefsyms], [b"_malloc", b"_printf"]
+        )
+        self.assertIsNone(symtab.toc)
+
+    def test_readers(self):
+        with temporary_symtab_file() as fn:
+            symtab = SymbolTable.SymbolTable(MachO(fn))
+
+        with tempfile.TemporaryFile() as fp:
+            fp.write(struct.pack("<IIII", 1, 2, 3, 4))
+            fp.flush()
+
+            toc = symtab.readtoc(fp, 0, 2)
+            self.assertIsInstance(toc, list)
+            self.assertEqual(
+                [(t.symbol_index, t.module_index) for t in toc], [(1, 2), (3, 4)]
+            )
+
+            rel = symtab.readrel(fp, 8, 1)
+            self.assertIsInstance(rel, list)
+            self.assertEqual((rel[0].r_address, rel[0]._r_bitfield), (3, 4))
+
+            self.assertEqual(symtab.readmodtab(fp, 0, 0), [])
+
+    def test_lazy(self):
+        with temporary_symtab_file() as fn:
+            macho = MachO(fn)
+            eager = SymbolTable.SymbolTable(macho)
+            lazy = SymbolTable.SymbolTable(macho, lazy=True)
+
+        self.assertIsInstance(lazy.nlists, SymbolTable.SymbolList)
+        self.assertEqual(len(lazy.nlists), len(eager.nlists))
+        self.assertEqual(list(lazy.nlists), eager.nlists)
+        self.assertEqual(lazy.nlists[1], eager.nlists[1])
+        self.assertEqual(lazy.nlists[-1], eager.nlists[-1])
+
+        for attr in ("localsyms", "extdefsyms", "undefsyms"):
+            with self.subTest(attr=attr):
+                syms = getattr(lazy, attr)
+                self.assertIsInstance(syms, SymbolTable.SymbolList)
+                self.assertEqual(list(syms), getattr(eager, attr))
+                self.assertEqual(
+                    list(syms.names()), [name for _, name in getattr(eager, attr)]
+                )
+
+        self.assertEqual(list(lazy.undefsyms[1:].names()), [b"_printf"])
+
+    def test_lookup(self):
+        with temporary_symtab_file() as fn:
+            macho = MachO(fn)
+            for lazy in (False, True):
+                with self.subTest(lazy=lazy):
+                    symtab = SymbolTable.SymbolTable(macho, lazy=lazy)
+                    result = symtab.lookup(b"_main")
+                    self.assertEqual(len(result), 1)
+                    self.assertEqual(result[0][1], b"_main")
+                    self.assertEqual(result[0][0].n_value, 0x1100)
+                    self.assertEqual(symtab.lookup("_printf"), [symtab.nlists[4]])
+                    self.assertEqual(symtab.lookup("_missing"), [])
+
+    def test_symbol_at(self):
+        with temporary_symtab_file() as fn:
+            macho = MachO(fn)
+            for lazy in (False, True):
+                with self.subTest(lazy=lazy):
+                    symtab = SymbolTable.SymbolTable(macho, lazy=lazy)
+                    self.assertIsNone(symtab.symbol_at(0))
+                    self.assertIsNone(symtab.symbol_at(0xFFF))
+                    self.assertEqual(symtab.symbol_at(0x1000)[1], b"_local")
+                    self.assertEqual(symtab.symbol_at(0x10FF)[1], b"_local")
+                    self.assertEqual(symtab.symbol_at(0x1100)[1], b"_main")
+                    self.assertEqual(symtab.symbol_at(0x1180)[1], b"_main")
+                    self.assertEqual(symtab.symbol_at(0x12FF)[1], b"_helper")
+                    # Past the end of the __text section
+                    self.assertIsNone(symtab.symbol_at(0x1300))
+                    self.assertIsNone(symtab.symbol_at(0x5000))
+
+    def test_no_symtab(self):
+        with temporary_symtab_file(symtab=False) as fn:
+            symtab = SymbolTable.SymbolTable(MachO(fn))
+
+        self.assertIsNone(symtab.symtab)
+        self.assertEqual(symtab.lookup(b"_main"), [])
+        self.assertIsNone(symtab.symbol_at(0x1100))
+        if numpy is not None:
+            symbols = symtab.as_numpy()
+            self.assertEqual(len(symbols), 0)
+            self.assertEqual(symbols.dtype.names[0], "n_strx")
+
+    @unittest.skipIf(numpy is None, "requires NumPy")
+    def test_as_numpy(self):
+        with temporary_symtab_file() as fn:
+            symtab = SymbolTable.SymbolTable(MachO(fn))
+            symbols = symtab.as_numpy()
+
+        self.assertEqual(
+            symbols.dtype.names, ("n_strx", "n_type", "n_sect", "n_desc", "n_value")
+        )
+        self.assertEqual(len(symbols), len(SYMBOLS))
+        self.assertEqual(
+            list(symbols["n_value"]), [value for _, _, _, value in SYMBOLS]
+        )
+        names = [
+            symtab.strtab[strx : symtab.strtab.index(b"\x00", strx)]
+            for strx in symbols["n_strx"]
+        ]
+        self.assertEqual(names, [name for name, _, _, _ in SYMBOLS])
+
+        external = symbols[(symbols["n_type"] & mach_o.N_EXT) != 0]
+        self.assertEqual(len(external), 4)
+        defined = external[(external["n_type"] & mach_o.N_TYPE) == mach_o.N_SECT]
+        self.assertEqual(list(defined["n_value"]), [0x1100, 0x1200])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,118 @@
+import os
+import pickle
+import struct
+import sys
+import tempfile
+
+import macholib
+from macholib import batch, mach_o
+
+from .test_MachO import lc_load_dylib, temporary_macho_file
+
+if sys.version_info[:2] <= (2, 6):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestBatch(unittest.TestCase):
+    def test_summarize(self):
+        with temporary_macho_file(
+            [
+                lc_load_dylib("/usr/lib/libSystem.B.dylib"),
+                lc_load_dylib("@rpath/libfoo.dylib", mach_o.LC_LOAD_WEAK_DYLIB),
+            ]
+        ) as fn:
+            summary = batch.summarize(fn)
+
+        self.assertEqual(summary.filename, fn)
+        self.assertIsNone(summary.error)
+        self.assertEqual(len(summary.headers), 1)
+        header = summary.headers[0]
+        self.assertEqual(header.offset, 0)
+        self.assertEqual(header.endian, ">")
+        self.assertEqual(header.filetype, "execute")
+        self.assertEqual(
+            [cmd for cmd, _ in header.load_commands],
+            [mach_o.LC_LOAD_DYLIB, mach_o.LC_LOAD_WEAK_DYLIB],
+        )
+        self.assertEqual(
+            header.dependencies,
+            (
+                ("load_dylib", "/usr/lib/libSystem.B.dylib"),
+                ("load_weak_dylib", "@rpath/libfoo.dylib"),
+            ),
+        )
+        self.assertEqual(
+            summary.dependencies,
+            ["/usr/lib/libSystem.B.dylib", "@rpath/libfoo.dylib"],
+        )
+        self.assertEqual(pickle.loads(pickle.dumps(summary)), summary)
+
+    def test_summarize_error(self):
+        with tempfile.NamedTemporaryFile(delete=False) as fp:
+            fp.write(b"not a mach-o file")
+        try:
+            summary = batch.summarize(fp.name)
+        finally:
+            os.unlink(fp.name)
+        self.assertEqual(summary.headers, ())
+        self.assertTrue(summary.error.startswith("ValueError: "))
+
+        summary = batch.summarize(fp.name)
+        self.assertIsNotNone(summary.error)
+
+    def test_summarize_truncated(self):
+        # A Mach-O header that is cut off after the magic
+        with tempfile.NamedTemporaryFile(delete=False) as fp:
+            fp.write(struct.pack(">I", mach_o.MH_MAGIC_64) + b"\x00" * 10)
+        try:
+            summary = batch.summarize(fp.name)
+            self.assertEqual(summary.headers, ())
+            self.assertTrue(summary.error.startswith("error: "), summary.error)
+
+            self.assertEqual(batch.scan([fp.name], workers=2), [summary])
+        finally:
+            os.unlink(fp.name)
+
+    def test_summarize_bad_name(self):
+        # A load command with a name that is not valid UTF-8
+        command = lc_load_dylib("/usr/lib/libX.dylib").replace(b"libX", b"lib\xff")
+        with temporary_macho_file([command]) as fn:
+            summary = batch.summarize(fn)
+            self.assertEqual(summary.headers, ())
+            self.assertTrue(
+                summary.error.startswith("UnicodeDecodeError: "), summary.error
+            )
+
+            with temporary_macho_file([lc_load_dylib("/usr/lib/libA.dylib")]) as fn2:
+                summaries = batch.scan([fn, fn2], workers=2)
+            self.assertEqual(summaries[0], summary)
+            self.assertIsNone(summaries[1].error)
+
+    def test_scan(self):
+        self.assertIs(macholib.scan, batch.scan)
+
+        with temporary_macho_file([lc_load_dylib("/usr/lib/libA.dylib")]) as fn1:
+            with temporary_macho_file([lc_load_dylib("/usr/lib/libB.dylib")]) as fn2:
+                paths = [fn1, fn2, fn1, "/no/such/file"] * 5
+                expected = [batch.summarize(fn) for fn in paths]
+
+                for workers, executor in [
+                    (1, "thread"),
+                    (4, "thread"),
+                    (2, "process"),
+                ]:
+                    with self.subTest(workers=workers, executor=executor):
+                        self.assertEqual(
+                            batch.scan(paths, workers=workers, executor=executor),
+                            expected,
+                        )
+
+                self.assertRaises(
+                    ValueError, batch.scan, paths, workers=2, executor="fiber"
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
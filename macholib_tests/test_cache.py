@@ -0,0 +1,235 @@
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+
+import macholib
+from macholib import MachO, mach_o
+from macholib.cache import ParseCache
+from macholib.MachOGraph import MachOGraph
+
+from .test_MachO import lc_load_dylib, lc_segment_64, lc_uuid, temporary_macho_file
+
+if sys.version_info[:2] <= (2, 6):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+def _open_counting_cache(directory):
+    # Record every time the cache is unpickled
+    with open(os.path.join(directory, "opened"), "a") as fp:
+        fp.write("%d\n" % (os.getpid(),))
+    return CountingCache(directory)
+
+
+class CountingCache(ParseCache):
+    def __reduce__(self):
+        return (_open_counting_cache, (self.directory,))
+
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ParseCache(os.path.join(self.directory, "cache"))
+        self._load = MachO.MachO.load
+
+    def tearDown(self):
+        MachO.MachO.load = self._load
+        self.cache.close()
+        shutil.rmtree(self.directory)
+
+    def disable_parsing(self):
+        def load(self, fh):
+            raise AssertionError("parsing %r" % (self.filename,))
+
+        MachO.MachO.load = load
+
+    def test_lookup_store(self):
+        path = os.path.join(self.directory, "file")
+        with open(path, "wb") as fp:
+            fp.write(b"abc")
+
+        self.assertIsNone(self.cache.lookup(path))
+        self.assertIsNone(self.cache.lookup(path + "missing"))
+        self.cache.store(path, {"a": 1})
+        self.assertEqual(self.cache.lookup(path), {"a": 1})
+        self.assertIsNone(self.cache.lookup(path, "other options"))
+
+        # Unpicklable values are ignored
+        self.cache.store(path, lambda: 1, "other options")
+        self.assertIsNone(self.cache.lookup(path, "other options"))
+
+        with open(path, "ab") as fp:
+            fp.write(b"def")
+        self.assertIsNone(self.cache.lookup(path))
+
+        self.cache.store(path, 42)
+        self.assertEqual(self.cache.lookup(path), 42)
+        self.cache.invalidate(path)
+        self.assertIsNone(self.cache.lookup(path))
+
+        self.cache.store(path, 42)
+        self.cache.close()
+        with ParseCache(os.path.join(self.directory, "cache")) as cache:
+            self.assertEqual(cache.lookup(path), 42)
+            cache.invalidate()
+            self.assertIsNone(cache.lookup(path))
+
+    def test_closed(self):
+        path = os.path.join(self.directory, "file")
+        with open(path, "wb") as fp:
+            fp.write(b"abc")
+        self.cache.close()
+        self.assertRaises(ValueError, self.cache.lookup, path)
+        self.assertRaises(ValueError, self.cache.store, path, 42)
+        self.assertRaises(ValueError, self.cache.invalidate)
+        self.cache.close()
+
+    def test_release_specific(self):
+        # Databases of other releases are not used
+        self.assertIn(macholib.__version__, ParseCache.filename)
+        self.assertTrue(
+            os.path.exists(os.path.join(self.directory, "cache", ParseCache.filename))
+        )
+
+    def test_verify_content(self):
+        path = os.path.join(self.directory, "file")
+        with open(path, "wb") as fp:
+            fp.write(b"abc")
+        st = os.stat(path)
+
+        with ParseCache(self.directory, verify_content=True) as cache:
+            cache.store(path, 42)
+            self.assertEqual(cache.lookup(path), 42)
+
+            # Same size and timestamp, different contents
+            with open(path, "wb") as fp:
+                fp.write(b"xyz")
+            os.utime(path, (st.st_atime, st.st_mtime))
+            self.assertIsNone(cache.lookup(path))
+
+    def test_macho(self):
+        macho_uuid = uuid.UUID("6894C0AE-C8B7-4E0B-A529-30BBEBA3703B")
+        data_offset = 32 + 72 + 80 + 24
+        segment = lc_segment_64(b"__TEXT", [(b"__text", data_offset, 8, 0)])
+        with temporary_macho_file(
+            [segment, lc_uuid(macho_uuid)], b"ABCDEFGH"
+        ) as macho_filename:
+            MachO.MachO(macho_filename, cache=self.cache)
+
+            self.disable_parsing()
+            macho = MachO.MachO(macho_filename, cache=self.cache)
+            self.assertEqual(len(macho.headers), 1)
+            header = macho.headers[0]
+            self.assertIs(header.parent, macho)
+            _, _, sections = header.commands[0]
+            self.assertEqual(sections[0].section_data, b"ABCDEFGH")
+            _, command, _ = header.commands[1]
+            self.assertEqual(uuid.UUID(bytes=command.uuid), macho_uuid)
+
+            # Different parse options are cached separately
+            self.assertRaises(
+                AssertionError,
+                MachO.MachO,
+                macho_filename,
+                allow_unknown_load_commands=True,
+                cache=self.cache,
+            )
+
+    def test_section_data(self):
+        # Section contents are not stored in the cache, and are read
+        # from the file when using the cached headers.
+        data_offset = 32 + 72 + 80
+        segment = lc_segment_64(b"__TEXT", [(b"__text", data_offset, 8, 0)])
+        with temporary_macho_file([segment], b"ABCDEFGH") as macho_filename:
+            for use_mmap in (False, True):
+                for lazy in (False, True):
+                    with self.subTest(use_mmap=use_mmap, lazy=lazy):
+                        self.cache.invalidate()
+                        with MachO.MachO(
+                            macho_filename,
+                            lazy_section_data=lazy,
+                            use_mmap=use_mmap,
+                            cache=self.cache,
+                        ) as macho:
+                            _, _, sections = macho.headers[0].commands[0]
+                            self.assertEqual(
+                                bytes(sections[0].section_data), b"ABCDEFGH"
+                            )
+
+                        value = self.cache.lookup(
+                            macho_filename, macho._cache_options()
+                        )
+                        self.assertIsNotNone(value)
+                        _, headers = value
+                        _, _, sections = headers[0].commands[0]
+                        self.assertNotIn("_section_data", sections[0].__dict__)
+
+                        self.disable_parsing()
+                        try:
+                            with MachO.MachO(
+                                macho_filename,
+                                lazy_section_data=lazy,
+                                use_mmap=use_mmap,
+                                cache=self.cache,
+                            ) as macho:
+                                self.assertEqual(macho._mmap is not None, use_mmap)
+                                _, _, sections = macho.headers[0].commands[0]
+                                self.assertEqual(
+                                    "_section_data" in sections[0].__dict__,
+                                    not lazy,
+                                )
+                                self.assertEqual(
+                                    bytes(sections[0].section_data), b"ABCDEFGH"
+                                )
+                        finally:
+                            MachO.MachO.load = self._load
+
+    def test_graph(self):
+        with temporary_macho_file(
+            [lc_load_dylib("/no/such/libfoo.dylib")]
+        ) as macho_filename:
+            graph = MachOGraph(cache=self.cache)
+            graph.run_file(macho_filename)
+
+            self.disable_parsing()
+            graph = MachOGraph(cache=self.cache)
+            node = graph.run_file(macho_filename)
+            self.assertIsInstance(node, MachO.MachO)
+            self.assertEqual(
+                [name for _, _, name in node.headers[0].walkRelocatables()],
+                ["/no/such/libfoo.dylib"],
+            )
+            self.assertIsNotNone(graph.findNode("/no/such/libfoo.dylib"))
+            self.assertEqual(node.headers[0].commands[0][0].cmd, mach_o.LC_LOAD_DYLIB)
+
+    def test_graph_process(self):
+        paths = []
+        for i in range(8):
+            paths.append(os.path.join(self.directory, "lib%d.dylib" % (i,)))
+            with temporary_macho_file(
+                [lc_load_dylib("/no/such/libfoo%d.dylib" % (i,))]
+            ) as macho_filename:
+                shutil.copy(macho_filename, paths[-1])
+
+        directory = os.path.join(self.directory, "counting")
+        with CountingCache(directory) as cache:
+            graph = MachOGraph(cache=cache)
+            graph.run_files(paths, workers=2, executor="process")
+            for i, path in enumerate(paths):
+                self.assertIsNotNone(graph.findNode("/no/such/libfoo%d.dylib" % (i,)))
+                self.assertIsNotNone(
+                    cache.lookup(path, "allow_unknown_load_commands=0")
+                )
+
+        # The cache is opened once per worker process, not once per file
+        with open(os.path.join(directory, "opened")) as fp:
+            opened = fp.read().split()
+        self.assertLessEqual(len(opened), 2)
+        self.assertEqual(len(opened), len(set(opened)))
+
+
+if __name__ == "__main__":
+    unittest.main()
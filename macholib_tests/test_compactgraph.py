@@ -0,0 +1,151 @@
+import pickle
+import sys
+
+from altgraph.ObjectGraph import ObjectGraph
+
+from macholib.compactgraph import CompactGraph, CompactNode
+from macholib.MachOGraph import MissingMachO
+from macholib.util import has_filename_filter
+
+if sys.version_info[:2] <= (2, 6):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class FileNode(object):
+    def __init__(self, filename):
+        self.graphident = self.filename = filename
+
+
+class TestCompactGraph(unittest.TestCase):
+    def make_graph(self):
+        graph = ObjectGraph()
+        for name in ("/bin/app", "/bin/tool", "/lib/a", "/lib/b", "/lib/c"):
+            graph.createNode(FileNode, name)
+        graph.createNode(MissingMachO, "@rpath/missing")
+        graph.createReference(None, graph.findNode("/bin/app"), "run_file")
+        graph.createReference(None, graph.findNode("/bin/tool"), "run_file")
+        for head, tail, kind in [
+            ("/bin/app", "/lib/a", "load_dylib"),
+            ("/bin/app", "/lib/b", "load_weak_dylib"),
+            ("/bin/tool", "/lib/b", "load_dylib"),
+            ("/lib/a", "/lib/c", "reexport_dylib"),
+            ("/lib/b", "/lib/c", "load_dylib"),
+            ("/lib/b", "@rpath/missing", "lazy_load_dylib"),
+        ]:
+            graph.createReference(graph.findNode(head), graph.findNode(tail), kind)
+        return graph
+
+    def test_from_graph(self):
+        graph = self.make_graph()
+        compact = CompactGraph.from_graph(graph)
+
+        self.assertEqual(len(compact), 6)
+        self.assertIn("/lib/a", compact)
+        self.assertNotIn("/lib/d", compact)
+        self.assertEqual(compact.node_name(compact.node_id("/lib/b")), "/lib/b")
+        self.assertEqual(
+            [compact.node_name(node_id) for node_id in compact.roots],
+            ["/bin/app", "/bin/tool"],
+        )
+        self.assertEqual(
+            list(compact.iterdfs()),
+            [ident for ident in graph.graph.iterdfs(graph) if ident is not graph],
+        )
+        self.assertEqual(
+            [node.graphident for node in compact.flatten()],
+            [node.graphident for node in graph.flatten()],
+        )
+        self.assertEqual(
+            [node.graphident for node in compact.flatten(has_filename_filter)],
+            [node.graphident for node in graph.flatten(has_filename_filter)],
+        )
+        self.assertEqual(
+            list(compact.iterdfs("/lib/b")), ["/lib/b", "@rpath/missing", "/lib/c"]
+        )
+
+        self.assertEqual(
+            compact.node("/lib/a"), CompactNode("/lib/a", "/lib/a", "FileNode")
+        )
+        self.assertEqual(
+            compact.node("@rpath/missing"),
+            CompactNode("@rpath/missing", None, "MissingMachO"),
+        )
+
+        self.assertEqual(
+            compact.out_edges("/lib/b"),
+            [("/lib/c", "load_dylib"), ("@rpath/missing", "lazy_load_dylib")],
+        )
+        self.assertEqual(compact.dependencies("/bin/app"), ["/lib/a", "/lib/b"])
+        self.assertEqual(
+            sorted(compact.dependents("/lib/b")), ["/bin/app", "/bin/tool"]
+        )
+        self.assertEqual(compact.dependents("/bin/app"), [])
+
+        compact.add_node("/lib/d")
+        compact.add_edge("/lib/d", "/lib/b", "load_dylib")
+        compact.add_edge("/lib/d", "/lib/b", "load_weak_dylib")
+        self.assertEqual(
+            sorted(compact.dependents("/lib/b")), ["/bin/app", "/bin/tool", "/lib/d"]
+        )
+
+        copy = pickle.loads(pickle.dumps(compact))
+        self.assertEqual(list(copy.iterdfs()), list(compact.iterdfs()))
+        self.assertEqual(copy.out_edges("/lib/d"), compact.out_edges("/lib/d"))
+
+    def test_transitive(self):
+        compact = CompactGraph.from_graph(self.make_graph())
+        self.assertEqual(
+            compact.transitive_dependencies("/bin/app"),
+            {"/lib/a", "/lib/b", "/lib/c", "@rpath/missing"},
+        )
+        self.assertEqual(compact.transitive_dependencies("/lib/c"), set())
+        self.assertEqual(
+            compact.transitive_dependents("/lib/c"),
+            {"/bin/app", "/bin/tool", "/lib/a", "/lib/b"},
+        )
+        self.assertEqual(
+            compact.transitive_dependents("/lib/b"), {"/bin/app", "/bin/tool"}
+        )
+        self.assertEqual(compact.transitive_dependents("/bin/app"), set())
+        self.assertRaises(KeyError, compact.transitive_dependents, "/lib/d")
+
+        # A cycle between /lib/c, /lib/d and /lib/e, results are updated
+        # when the graph changes.
+        compact.add_node("/lib/d")
+        compact.add_node("/lib/e")
+        compact.add_edge("/lib/c", "/lib/d", "load_dylib")
+        compact.add_edge("/lib/d", "/lib/e", "load_dylib")
+        compact.add_edge("/lib/e", "/lib/c", "load_upward_dylib")
+        self.assertEqual(
+            compact.transitive_dependencies("/lib/c"), {"/lib/d", "/lib/e"}
+        )
+        self.assertEqual(
+            compact.transitive_dependencies("/lib/a"), {"/lib/c", "/lib/d", "/lib/e"}
+        )
+        self.assertEqual(
+            compact.transitive_dependents("/lib/e"),
+            {"/bin/app", "/bin/tool", "/lib/a", "/lib/b", "/lib/c", "/lib/d"},
+        )
+        self.assertEqual(
+            compact.transitive_dependencies("/bin/tool"),
+            {"/lib/b", "/lib/c", "/lib/d", "/lib/e", "@rpath/missing"},
+        )
+
+    def test_transitive_chain(self):
+        # Long chains don't hit the recursion limit
+        compact = CompactGraph()
+        count = sys.getrecursionlimit() + 100
+        for i in range(count):
+            compact.add_node(i)
+            if i:
+                compact.add_edge(i - 1, i, "load_dylib")
+        self.assertEqual(compact.transitive_dependencies(0), set(range(1, count)))
+        self.assertEqual(
+            compact.transitive_dependents(count - 1), set(range(count - 1))
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,9 @@
 import functools
 import os
+import shutil
 import sys
+import tempfile
+from itertools import chain
 
 from macholib import dyld
 
@@ -571,6 +574,242 @@ class TestDyld(unittest.TestCase):
             patcher.cleanup()
 
 
+class TestDyldLookupCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for name in ("libfoo.dylib", "libbar.dylib"):
+            with open(os.path.join(self.directory, name), "wb"):
+                pass
+        self.env = {"DYLD_LIBRARY_PATH": self.directory}
+        self.isfile_calls = []
+        self._dyld_isfile = dyld._dyld_isfile
+
+        def _dyld_isfile(path):
+            self.isfile_calls.append(path)
+            return self._dyld_isfile(path)
+
+        dyld._dyld_isfile = _dyld_isfile
+
+    def tearDown(self):
+        dyld._dyld_isfile = self._dyld_isfile
+        shutil.rmtree(self.directory)
+
+    def test_find(self):
+        cache = dyld.DyldLookupCache()
+        libfoo = os.path.join(self.directory, "libfoo.dylib")
+
+        self.assertEqual(cache.find("libfoo.dylib", env=self.env), libfoo)
+        self.assertEqual(self.isfile_calls, [libfoo])
+        self.assertEqual(cache.find("libfoo.dylib", env=self.env), libfoo)
+        self.assertEqual(self.isfile_calls, [libfoo])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # The environment is part of the key
+        self.assertRaises(ValueError, cache.find, "libfoo.dylib", env={})
+        self.assertEqual(len(cache), 2)
+
+        # Failed lookups are cached as well
+        del self.isfile_calls[:]
+        self.assertRaises(ValueError, cache.find, "libmissing.dylib", env=self.env)
+        self.assertNotEqual(self.isfile_calls, [])
+        del self.isfile_calls[:]
+        self.assertRaises(ValueError, cache.find, "libmissing.dylib", env=self.env)
+        self.assertEqual(self.isfile_calls, [])
+
+        # Candidates are only checked once, even for different names
+        self.assertRaises(
+            ValueError, cache.find, "/other/libmissing.dylib", env=self.env
+        )
+        self.assertEqual(self.isfile_calls, ["/other/libmissing.dylib"])
+
+        # The loader path is only part of the key when it is used
+        cache.find("libfoo.dylib", env=self.env, loader_path="/a")
+        cache.find("libfoo.dylib", env=self.env, loader_path="/b")
+        self.assertEqual(
+            cache.find("@loader_path/libbar.dylib", loader_path=self.directory),
+            os.path.join(self.directory, "libbar.dylib"),
+        )
+        self.assertRaises(
+            ValueError, cache.find, "@loader_path/libbar.dylib", loader_path="/b"
+        )
+        self.assertEqual(len(cache), 6)
+
+    def test_bounded(self):
+        cache = dyld.DyldLookupCache(maxsize=2)
+        cache.find("libfoo.dylib", env=self.env)
+        cache.find("libbar.dylib", env=self.env)
+        cache.find("libfoo.dylib", env=self.env)
+        self.assertRaises(ValueError, cache.find, "libmissing.dylib", env=self.env)
+        self.assertEqual(len(cache), 2)
+
+        # libbar.dylib was the least recently used result
+        cache.find("libfoo.dylib", env=self.env)
+        self.assertEqual((cache.hits, cache.misses), (2, 3))
+        cache.find("libbar.dylib", env=self.env)
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+
+    def test_invalidate(self):
+        stat_cache = dyld.StatCache()
+        cache = dyld.DyldLookupCache(stat_cache=stat_cache)
+        other = dyld.DyldLookupCache(stat_cache=stat_cache)
+        libfoo = os.path.join(self.directory, "libfoo.dylib")
+
+        self.assertEqual(cache.find("libfoo.dylib", env=self.env), libfoo)
+        self.assertEqual(other.find("libfoo.dylib", env=self.env), libfoo)
+        self.assertEqual(self.isfile_calls, [libfoo])
+
+        os.unlink(libfoo)
+        self.assertEqual(cache.find("libfoo.dylib", env=self.env), libfoo)
+        cache.invalidate("libfoo.dylib")
+        self.assertEqual(cache.find("libfoo.dylib", env=self.env), libfoo)
+
+        stat_cache.invalidate(libfoo)
+        cache.invalidate("libfoo.dylib")
+        self.assertRaises(ValueError, cache.find, "libfoo.dylib", env=self.env)
+
+        # Also clears the shared stat cache
+        other.invalidate()
+        self.assertEqual(len(other), 0)
+        self.assertEqual(len(cache), 1)
+        with open(libfoo, "wb"):
+            pass
+        self.assertEqual(other.find("libfoo.dylib", env=self.env), libfoo)
+
+    def test_directory_index(self):
+        listed = []
+        _list_directory = dyld._list_directory
+
+        def list_directory(directory):
+            listed.append(directory)
+            return _list_directory(directory)
+
+        dyld._list_directory = list_directory
+        try:
+            index = dyld.DirectoryIndex()
+            libfoo = os.path.join(self.directory, "libfoo.dylib")
+            missing = os.path.join(self.directory, "missing", "libfoo.dylib")
+            os.mkdir(os.path.join(self.directory, "libdir.dylib"))
+
+            self.assertTrue(index.isfile(libfoo))
+            self.assertFalse(index.isfile(libfoo + ".missing"))
+            self.assertFalse(index.isfile(os.path.join(self.directory, "libdir.dylib")))
+            self.assertFalse(index.isfile(missing))
+            self.assertFalse(index.isfile(missing))
+            self.assertEqual(listed, [self.directory, os.path.dirname(missing)])
+
+            cache = dyld.DyldLookupCache(stat_cache=index)
+            self.assertEqual(cache.find("libfoo.dylib", env=self.env), libfoo)
+            self.assertEqual(
+                cache.find("libbar.dylib", env=self.env),
+                os.path.join(self.directory, "libbar.dylib"),
+            )
+            self.assertEqual(self.isfile_calls, [])
+            self.assertEqual(listed, [self.directory, os.path.dirname(missing)])
+
+            with open(libfoo + ".missing", "wb"):
+                pass
+            self.assertFalse(index.isfile(libfoo + ".missing"))
+            index.refresh(self.directory + os.sep)
+            self.assertTrue(index.isfile(libfoo + ".missing"))
+            self.assertEqual(listed[-1], self.directory)
+
+            os.mkdir(os.path.dirname(missing))
+            with open(missing, "wb"):
+                pass
+            self.assertFalse(index.isfile(missing))
+            index.invalidate(missing)
+            self.assertTrue(index.isfile(missing))
+
+            del listed[:]
+            index.refresh()
+            self.assertTrue(index.isfile(libfoo))
+            self.assertEqual(listed, [self.directory])
+
+        finally:
+            dyld._list_directory = _list_directory
+
+
+class TestDyldResolver(unittest.TestCase):
+    def test_candidates(self):
+        environments = [
+            {},
+            {"DYLD_IMAGE_SUFFIX": "_debug"},
+            {
+                "DYLD_FRAMEWORK_PATH": "/fw1:/fw2",
+                "DYLD_LIBRARY_PATH": "/lib1:/lib2",
+                "DYLD_FALLBACK_FRAMEWORK_PATH": "/fb/fw",
+                "DYLD_FALLBACK_LIBRARY_PATH": "/fb/lib1:/fb/lib2",
+                "DYLD_IMAGE_SUFFIX": "_profile",
+            },
+        ]
+        names = [
+            "libfoo.dylib",
+            "/usr/lib/libfoo.dylib",
+            "Foo.framework/Versions/A/Foo",
+            "/Library/Frameworks/Foo.framework/Foo",
+            "@executable_path/../lib/libfoo.dylib",
+            "@loader_path/libfoo.dylib",
+        ]
+        for env in environments:
+            resolver = dyld.DyldResolver(env, executable_path="/app/bin")
+            for name in names:
+                for loader_path in (None, "/loader"):
+                    with self.subTest(env=env, name=name, loader_path=loader_path):
+                        expected = list(
+                            dyld.dyld_image_suffix_search(
+                                chain(
+                                    dyld.dyld_override_search(name, env),
+                                    dyld.dyld_executable_path_search(name, "/app/bin"),
+                                    dyld.dyld_loader_search(name, loader_path),
+                                    dyld.dyld_default_search(name, env),
+                                ),
+                                env,
+                            )
+                        )
+                        self.assertEqual(
+                            resolver.candidates(name, loader_path), expected
+                        )
+
+    def test_find(self):
+        directory = tempfile.mkdtemp()
+        try:
+            for name in ("libfoo.dylib", "libbar_debug.dylib"):
+                with open(os.path.join(directory, name), "wb"):
+                    pass
+
+            env = {"DYLD_LIBRARY_PATH": directory, "DYLD_IMAGE_SUFFIX": "_debug"}
+            resolver = dyld.DyldResolver(env, stat_cache=dyld.DirectoryIndex())
+            # Changes to the environment after creating the resolver
+            # don't affect the resolver.
+            env.clear()
+
+            self.assertEqual(
+                resolver.find("/no/such/libfoo.dylib"),
+                os.path.join(directory, "libfoo.dylib"),
+            )
+            self.assertEqual(
+                resolver.find("@loader_path/libbar.dylib", loader_path="/lib"),
+                os.path.join(directory, "libbar_debug.dylib"),
+            )
+            self.assertRaises(ValueError, resolver.find, "libmissing.dylib")
+            self.assertEqual(
+                resolver.find_many(["libmissing.dylib", "libfoo.dylib"]),
+                [None, os.path.join(directory, "libfoo.dylib")],
+            )
+
+            os.mkdir(os.path.join(directory, "Foo.framework"))
+            with open(os.path.join(directory, "Foo.framework", "Foo"), "wb"):
+                pass
+            resolver = dyld.DyldResolver({"DYLD_FRAMEWORK_PATH": directory})
+            self.assertEqual(
+                resolver.framework_find("Foo"),
+                os.path.join(directory, "Foo.framework", "Foo"),
+            )
+
+        finally:
+            shutil.rmtree(directory)
+
+
 class TestTrivialDyld(unittest.TestCase):
     # Tests ported from the implementation file
     def testBasic(self):
@@ -1,5 +1,8 @@
+import json
 import sys
 
+from altgraph.Graph import Graph
+
 from macholib import itergraphreport
 
 if sys.version_info[:2] <= (2, 6):
@@ -9,9 +12,104 @@ else:
 
 
 class TestIterGraphReport(unittest.TestCase):
-    @unittest.expectedFailure
-    def test_missing(self):
-        self.fail("tests are missing")
+    def make_graph(self):
+        graph = Graph()
+        graph.add_edge("root", "a", "run_file")
+        graph.add_edge("a", "b", "load_dylib")
+        graph.add_edge("a", "c", "load_weak_dylib")
+        graph.add_edge("b", "c", "load_dylib")
+        return graph
+
+    def iter_nodes(self, graph):
+        return (graph.describe_node(node) for node in graph.iterdfs("root"))
+
+    def test_graphreport(self):
+        graph = self.make_graph()
+        lines = list(
+            itergraphreport.itergraphreport(
+                self.iter_nodes(graph), graph.describe_edge, name="Test"
+            )
+        )
+        self.assertEqual(lines[0], "digraph Test {\n")
+        self.assertEqual(
+            sorted(lines[1:3]), ['\tconcentrate="true";\n', '\trankdir="LR";\n']
+        )
+        self.assertEqual(
+            lines[3:],
+            [
+                '\t"root" [label="root"];\n',
+                '\t"root" -> "a" [];\n',
+                '\t"a" [label="a"];\n',
+                '\t"a" -> "b" [];\n',
+                '\t"c" [label="c"];\n',
+                '\t"b" [label="b"];\n',
+                '\t"b" -> "c" [];\n',
+                "}\n",
+            ],
+        )
+
+        lines = list(
+            itergraphreport.itergraphreport(
+                self.iter_nodes(graph), graph.describe_edge, edge_kinds=None
+            )
+        )
+        self.assertIn('\t"a" -> "c" [];\n', lines)
+        self.assertEqual(sum(1 for line in lines if "->" in line), 4)
+
+        lines = list(
+            itergraphreport.itergraphreport(
+                self.iter_nodes(graph),
+                graph.describe_edge,
+                edge_kinds={"load_weak_dylib"},
+            )
+        )
+        self.assertEqual(
+            [line for line in lines if "->" in line], ['\t"a" -> "c" [];\n']
+        )
+
+    def test_jsonreport(self):
+        graph = self.make_graph()
+        records = [
+            json.loads(line)
+            for line in itergraphreport.iterjsonreport(
+                self.iter_nodes(graph), graph.describe_edge
+            )
+        ]
+        self.assertEqual(
+            records,
+            [
+                {"node": "root"},
+                {"head": "root", "tail": "a", "kind": "run_file"},
+                {"node": "a"},
+                {"head": "a", "tail": "b", "kind": "load_dylib"},
+                {"node": "c"},
+                {"node": "b"},
+                {"head": "b", "tail": "c", "kind": "load_dylib"},
+            ],
+        )
+
+    def test_streaming(self):
+        # Nodes are only iterated once, and output is produced
+        # before all nodes are seen.
+        count = 200000
+        consumed = []
+
+        def nodes():
+            for i in range(count):
+                consumed.append(i)
+                yield i, None, [i], []
+
+        def describe_edge(edge):
+            return edge, "load_dylib", edge, edge + 1
+
+        report = itergraphreport.itergraphreport(nodes(), describe_edge)
+        for line in report:
+            if "->" in line:
+                break
+        self.assertEqual(len(consumed), 1)
+
+        self.assertEqual(sum(1 for line in report if "->" in line), count - 1)
+        self.assertEqual(len(consumed), count)
 
 
 if __name__ == "__main__":
@@ -3,7 +3,7 @@ import struct
 import sys
 import unittest
 
-from macholib import ptypes
+from macholib import mach_o, ptypes
 
 if sys.version_info[:2] <= (2, 6):
     import unittest2 as unittest
@@ -20,6 +20,11 @@ try:
 except NameError:
     long = int
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class TestPTypes(unittest.TestCase):
     if not hasattr(unittest.TestCase, "assertIsSubclass"):
@@ -135,6 +140,53 @@ class TestPTypesPrivate(unittest.TestCase):
         self.assertEqual(ptypes._formatinfo("<h"), (2, 1))
         self.assertEqual(ptypes._formatinfo("<HhL"), (8, 3))
 
+    def test_struct_cache(self):
+        st = MyStructure._get_struct("<")
+        self.assertIsInstance(st, struct.Struct)
+        self.assertEqual(st.format, "<" + MyStructure._format_)
+        self.assertIs(MyStructure._get_struct("<"), st)
+        self.assertIsNot(MyStructure._get_struct(">"), st)
+        self.assertIsNot(MyFunStructure._get_struct("<"), st)
+        self.assertEqual(ptypes.p_uint32._get_struct(">").format, ">I")
+
+    def test_from_tuple_custom_init(self):
+        class MyInitStructure(ptypes.Structure):
+            _fields_ = MyStructure._fields_
+
+            def __init__(self, *args, **kwds):
+                super(MyInitStructure, self).__init__(*args, **kwds)
+                self.initialized = True
+
+        value = MyInitStructure.from_tuple((1, 2), _endian_="<")
+        self.assertTrue(value.initialized)
+        self.assertEqual(value._endian_, "<")
+        self.assertEqual((value.foo, value.bar), (1, 2))
+
+        value = MyStructure.from_tuple((1, 2))
+        self.assertIs(type(value.foo), ptypes.p_int32)
+        self.assertIs(type(value.bar), ptypes.p_uint8)
+        self.assertEqual(value._endian_, ">")
+
+    def test_single_field_substructure(self):
+        # Structures with one field, such as mach_version_helper, take
+        # a single item in the struct format.
+        class MyVersion(ptypes.Structure):
+            _fields_ = (("version", ptypes.p_uint32),)
+
+        class MyVersionStructure(ptypes.Structure):
+            _fields_ = (("name", ptypes.p_uint32), ("current", MyVersion))
+
+        value = MyVersionStructure.from_str(b"\x00\x00\x00\x01\x00\x02\x00\x00")
+        self.assertIs(type(value.current), MyVersion)
+        self.assertEqual(value.current.version, 0x20000)
+        self.assertEqual(value.to_str(), b"\x00\x00\x00\x01\x00\x02\x00\x00")
+
+        value = MyVersionStructure(name=1, current=MyVersion(3))
+        self.assertEqual(value.to_str(), b"\x00\x00\x00\x01\x00\x00\x00\x03")
+
+        data = bytes(bytearray(range(16)))
+        self.assertEqual(mach_o.dylib_command.from_str(data).to_str(), data)
+
 
 class MyStructure(ptypes.Structure):
     _fields_ = (("foo", ptypes.p_int32), ("bar", ptypes.p_uint8))
@@ -144,6 +196,16 @@ class MyFunStructure(ptypes.Structure):
     _fields_ = (("fun", ptypes.p_char), ("mystruct", MyStructure))
 
 
+class MyCompactStructure(ptypes.Structure):
+    _compact_ = True
+    _fields_ = (("foo", ptypes.p_int32), ("bar", ptypes.p_uint8))
+
+
+class MyCompactFunStructure(ptypes.Structure):
+    _compact_ = True
+    _fields_ = (("fun", ptypes.p_char), ("mystruct", MyCompactStructure))
+
+
 class TestPTypesSimple(unittest.TestCase):
     # Quick port of tests that used to be part of
     # the macholib.ptypes source code
@@ -216,6 +278,97 @@ class TestPTypesSimple(unittest.TestCase):
                 myFunStructure,
             )
 
+    def test_compact(self):
+        MYSTRUCTURE = b"\x00\x01\x02\x03\xff"
+        for endian in "><":
+            kw = dict(_endian_=endian)
+            for fn, args in [
+                ("from_str", (MYSTRUCTURE,)),
+                ("from_mmap", (MYSTRUCTURE, 0)),
+                ("from_fileobj", (BytesIO(MYSTRUCTURE),)),
+            ]:
+                with self.subTest("MyCompactStructure", endian=endian, fn=fn):
+                    value = getattr(MyCompactStructure, fn)(*args, **kw)
+                    regular = MyStructure.from_str(MYSTRUCTURE, **kw)
+                    self.assertFalse(hasattr(value, "__dict__"))
+                    self.assertEqual(value.foo, regular.foo)
+                    self.assertEqual(value.bar, 0xFF)
+                    self.assertEqual(value._endian_, endian)
+                    self.assertEqual(value.to_str(), MYSTRUCTURE)
+                    self.assertEqual(
+                        repr(value),
+                        repr(regular).replace("MyStructure", "MyCompactStructure"),
+                    )
+
+        value = MyCompactStructure(foo=1)
+        self.assertEqual(value._endian_, ">")
+        self.assertEqual((value.foo, value.bar), (1, 0))
+        self.assertEqual(MyCompactStructure._endian_, ">")
+
+        other = MyCompactStructure(value)
+        self.assertEqual(other, value)
+        other.bar = 2
+        self.assertNotEqual(other, value)
+        self.assertLess(value, other)
+        self.assertEqual(value.bar, 0)
+
+        self.assertRaises(TypeError, MyCompactStructure, baz=1)
+        with self.assertRaises(AttributeError):
+            value.baz = 1
+
+        # Fields have the packable type of the field, assigned values
+        # are converted and must fit in the field.
+        self.assertIs(type(value.foo), ptypes.p_int32)
+        self.assertIs(
+            type(MyCompactStructure.from_str(MYSTRUCTURE).bar), ptypes.p_uint8
+        )
+        value.foo = "5"
+        self.assertIs(type(value.foo), ptypes.p_int32)
+        self.assertEqual(value.foo, 5)
+        self.assertRaises(ValueError, setattr, value, "foo", "five")
+        self.assertRaises(struct.error, setattr, value, "bar", 256)
+        self.assertEqual(value.bar, 0)
+
+        nested = MyCompactFunStructure.from_str(b"!" + MYSTRUCTURE, _endian_="<")
+        self.assertEqual(nested.fun, b"!")
+        self.assertIsInstance(nested.mystruct, MyCompactStructure)
+        self.assertEqual(nested.mystruct._endian_, "<")
+        self.assertEqual(nested.to_str(), b"!" + MYSTRUCTURE)
+
+    def test_array_from_buffer(self):
+        MYSTRUCTURE = b"\x00\x01\x02\x03\xff"
+        buf = MYSTRUCTURE + b"\x01\x01\x02\x03\x01" + b"extra"
+        for cls in (MyStructure, MyCompactStructure):
+            with self.subTest(cls=cls.__name__):
+                array = cls.array_from_buffer(buf, 2, "<")
+                self.assertIsInstance(array, ptypes.StructureArray)
+                self.assertEqual(len(array), 2)
+                self.assertEqual(array[0], cls.from_str(MYSTRUCTURE, _endian_="<"))
+                self.assertEqual(array[-1].foo, 0x03020101)
+                self.assertEqual(array[1]._endian_, "<")
+                self.assertEqual([v.bar for v in array], [0xFF, 0x01])
+                self.assertEqual(len(array[1:]), 1)
+                self.assertEqual(array[1:][0], array[1])
+                self.assertEqual(array.records(), [(0x03020100, 0xFF), (0x03020101, 1)])
+                self.assertEqual(cls.array_from_buffer(buf, 1)[0].foo, 0x00010203)
+                self.assertEqual(len(cls.array_from_buffer(b"", 0)), 0)
+                self.assertRaises(ValueError, cls.array_from_buffer, buf, 4)
+
+        array = MyFunStructure.array_from_buffer(b"!" + MYSTRUCTURE, 1)
+        self.assertEqual(array[0].mystruct, MyStructure.from_str(MYSTRUCTURE))
+
+    @unittest.skipIf(numpy is None, "requires NumPy")
+    def test_numpy_dtype(self):
+        MYFUNSTRUCTURE = b"!\x00\x01\x02\x03\xff"
+        dtype = MyFunStructure.numpy_dtype("<")
+        self.assertEqual(dtype.itemsize, ptypes.sizeof(MyFunStructure))
+        self.assertEqual(dtype.names, ("fun", "mystruct"))
+        value = numpy.frombuffer(MYFUNSTRUCTURE, dtype=dtype)[0]
+        self.assertEqual(value["fun"], b"!")
+        self.assertEqual(value["mystruct"]["foo"], 0x03020100)
+        self.assertEqual(value["mystruct"]["bar"], 0xFF)
+        self.assertEqual(MyStructure.numpy_dtype()["foo"], numpy.dtype(">i4"))
+
     def test_issue14(self):
         raw = b"\x01\x00\x00\x00\x00\x00\x00\x00"
         v = ptypes.p_uint64.from_str(raw, _endian_="<")
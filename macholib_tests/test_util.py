@@ -0,0 +1,108 @@
+import os
+import shutil
+import stat
+import sys
+import tempfile
+
+from macholib import util
+
+if sys.version_info[:2] <= (2, 6):
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestCopy(unittest.TestCase):
+    def setUp(self):
+        self.directory = os.path.realpath(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_file(self, name, data):
+        path = os.path.join(self.directory, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as fp:
+            fp.write(data)
+        return path
+
+    def read_file(self, path):
+        with open(path, "rb") as fp:
+            return fp.read()
+
+    def test_copy_file(self):
+        data = os.urandom(3 * 1024 * 1024 + 17)
+        src = self.make_file("src", data)
+        os.chmod(src, 0o751)
+        os.utime(src, (1000000000, 1000000000))
+
+        dst = os.path.join(self.directory, "dst")
+        strategy = util.copy_file(src, dst)
+        self.assertIn(
+            strategy, ("clonefile", "reflink", "copy_file_range", "sendfile", "copy")
+        )
+        self.assertEqual(self.read_file(dst), data)
+        self.assertEqual(stat.S_IMODE(os.stat(dst).st_mode), 0o751)
+        self.assertEqual(os.stat(dst).st_mtime, 1000000000)
+        self.assertNotEqual(os.stat(dst).st_ino, os.stat(src).st_ino)
+
+        empty = self.make_file("empty", b"")
+        util.copy_file(empty, os.path.join(self.directory, "empty2"))
+        self.assertEqual(self.read_file(os.path.join(self.directory, "empty2")), b"")
+
+    def test_copy_file_link(self):
+        src = self.make_file("src", b"contents")
+        dst = os.path.join(self.directory, "dst")
+        self.assertEqual(util.copy_file(src, dst, link=True), "link")
+        self.assertEqual(os.stat(dst).st_ino, os.stat(src).st_ino)
+
+        # Copying over a hard link doesn't change the source
+        other = self.make_file("other", b"other contents")
+        util.copy_file(other, dst)
+        self.assertEqual(self.read_file(dst), b"other contents")
+        self.assertEqual(self.read_file(src), b"contents")
+
+    def test_mergecopy(self):
+        src = self.make_file("src", b"new")
+        dst = self.make_file("dst", b"old")
+        os.utime(src, (1000000000, 1000000000))
+        util.mergecopy(src, dst)
+        self.assertEqual(self.read_file(dst), b"old")
+
+        os.utime(dst, (900000000, 900000000))
+        util.mergecopy(src, dst, link=True)
+        self.assertEqual(self.read_file(dst), b"new")
+        self.assertEqual(os.stat(dst).st_ino, os.stat(src).st_ino)
+
+    def test_mergetree(self):
+        self.make_file("src/a", b"a")
+        self.make_file("src/sub/b", b"b")
+        self.make_file("src/sub/skip", b"skip")
+        os.symlink("sub/b", os.path.join(self.directory, "src", "link"))
+        os.symlink("sub", os.path.join(self.directory, "src", "dirlink"))
+
+        src = os.path.join(self.directory, "src")
+        dst = os.path.join(self.directory, "dst")
+        copied = []
+
+        def copyfn(src, dst):
+            copied.append(os.path.basename(src))
+            util.mergecopy(src, dst)
+
+        util.mergetree(
+            src,
+            dst,
+            condition=lambda path: not path.endswith(b"skip"),
+            copyfn=copyfn,
+        )
+        self.assertEqual(sorted(copied), [b"a", b"b"])
+        self.assertEqual(self.read_file(os.path.join(dst, "a")), b"a")
+        self.assertEqual(self.read_file(os.path.join(dst, "sub", "b")), b"b")
+        self.assertFalse(os.path.exists(os.path.join(dst, "sub", "skip")))
+        self.assertEqual(os.readlink(os.path.join(dst, "link")), "sub/b")
+        self.assertEqual(os.readlink(os.path.join(dst, "dirlink")), "sub")
+
+
+if __name__ == "__main__":
+    unittest.main()